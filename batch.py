@@ -0,0 +1,264 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Converts many broker exports at once using a pool of worker processes.
+
+Each input is detected and parsed independently, so a bad file is reported but
+does not abort the rest of the batch. Outputs are either written one per input
+into a directory, or merged into a single output in sorted input order, so the
+result does not depend on which worker happens to finish first.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+import os
+import sys
+import time
+from typing import Iterable, Iterator, Optional, TextIO
+
+from brokers import GetBroker
+import csv2txf
+import csvrows
+import diagnostics
+import lots
+import parallel
+import pipeline
+import sinks
+import stats
+import utils
+import wash_sales
+
+
+class Result:
+    """The outcome of converting a single input file."""
+
+    __slots__ = ('filename', 'broker', 'txns', 'num_txns', 'seconds', 'error', 'warnings',
+                 'stats')
+
+    filename: str
+    broker: Optional[str]
+    txns: list[utils.Transaction]
+    num_txns: int
+    seconds: float
+    error: Optional[str]
+    warnings: list[str]
+    # What `stats.Stats.toDict` returns, if stats are collected.
+    stats: Optional[dict]
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.broker = None
+        self.txns = []
+        self.num_txns = 0
+        self.seconds = 0.0
+        self.error = None
+        self.warnings = []
+        self.stats = None
+
+
+def FindInputs(paths: Iterable[str]) -> list[str]:
+    """Expands directories into the CSV files beneath them.
+
+    Zip archives, given or beneath directories, are expanded into the CSV
+    files they hold (see `csvrows.ZipMembers`).
+
+    Returns a sorted list without duplicates, which fixes the order of the
+    merged output.
+    """
+    found = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for (dirpath, _, filenames) in os.walk(path):
+                for filename in filenames:
+                    if filename.lower().endswith('.csv'):
+                        found.add(os.path.join(dirpath, filename))
+                    elif filename.lower().endswith('.zip'):
+                        found.update(csvrows.ZipMembers(os.path.join(dirpath, filename)))
+        else:
+            found.update(csvrows.ZipMembers(path) or [path])
+    return sorted(found)
+
+
+def OutputFilename(out_dir: str, filename: str, out_format: str) -> str:
+    base = os.path.splitext(os.path.basename(filename))[0]
+    ext = '.%s.out' % out_format if out_format in sinks.SINKS and out_format != 'txf' else '.txf'
+    return os.path.join(out_dir, base + ext)
+
+
+def _CountTxns(result: Result, txns: Iterable[utils.Transaction]) -> Iterator[utils.Transaction]:
+    for txn in txns:
+        result.num_txns += 1
+        yield txn
+
+
+def Convert(filename: str, broker_name: Optional[str], tax_year: int, date: str,
+            out_format: str, out_filename: Optional[str],
+            max_warnings: int = diagnostics.DEFAULT_MAX_SAMPLES,
+            lot_method: str = lots.FIFO, wash: bool = False, split: bool = False,
+            split_jobs: Optional[int] = None, pipelined: bool = False,
+            cache_dir: Optional[str] = None, cache_max_bytes: Optional[int] = None,
+            collect_stats: bool = False) -> Result:
+    """Converts a single file; this runs in a worker process.
+
+    If `out_filename` is given, the output is written there and only the
+    statistics are sent back; otherwise the parsed transactions are returned
+    to be merged by the caller.
+    """
+    start = time.perf_counter()
+    result = Result(filename)
+    # Set explicitly, as workers which are spawned rather than forked (e.g.,
+    # on macOS) do not inherit the settings of the parent process.
+    lots.METHOD = lot_method
+    wash_sales.ENABLED = wash
+    parallel.ENABLED = split
+    parallel.JOBS = split_jobs
+    pipeline.ENABLED = pipelined
+    worker_stats = stats.Enable() if collect_stats else None
+    diagnostics.Collect(max_warnings)
+    txn_cache = None
+    try:
+        if cache_dir:
+            from cache import DEFAULT_MAX_BYTES, TxnCache
+            txn_cache = TxnCache(cache_dir, cache_max_bytes or DEFAULT_MAX_BYTES)
+        broker = GetBroker(broker_name, filename)
+        result.broker = broker.name()
+        parsed = stats.Timed('parse', csv2txf.IterTxns(broker, filename, tax_year, txn_cache),
+                             'txns')
+        if out_filename is None:
+            result.txns = list(parsed)
+            result.num_txns = len(result.txns)
+        else:
+            txns = _CountTxns(result, parsed)
+            try:
+                with open(out_filename, 'w') as out:
+                    _Write(txns, broker.name(), tax_year, date, out_format,
+                           stats.TimedWriter(out))
+            except BaseException:
+                os.remove(out_filename)
+                raise
+    except Exception as e:
+        result.error = '%s: %s' % (type(e).__name__, e)
+    finally:
+        if txn_cache is not None:
+            txn_cache.close()
+    collector = diagnostics.Stop()
+    assert collector is not None
+    result.warnings = collector.summary()
+    if worker_stats is not None:
+        result.stats = worker_stats.toDict()
+        stats.Disable()
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def Report(result: Result, err: TextIO) -> None:
+    for warning in result.warnings:
+        err.write('warning: %s: %s\n' % (result.filename, warning))
+    if result.error is None:
+        err.write('ok   %8.3fs %8d txns  %s (%s)\n' %
+                  (result.seconds, result.num_txns, result.filename, result.broker))
+    else:
+        err.write('FAIL %8.3fs                %s: %s\n' %
+                  (result.seconds, result.filename, result.error))
+
+
+def Run(inputs: Iterable[str], broker_name: Optional[str], tax_year: int,
+        date: Optional[str], out_format: str, out_dir: Optional[str],
+        out_filename: Optional[str], jobs: Optional[int],
+        err: TextIO = sys.stderr,
+        max_warnings: int = diagnostics.DEFAULT_MAX_SAMPLES,
+        lot_method: str = lots.FIFO, wash: bool = False, split: bool = False,
+        pipelined: bool = False, cache_dir: Optional[str] = None,
+        cache_max_bytes: Optional[int] = None) -> bool:
+    """Converts all `inputs`, reporting progress on `err`.
+
+    If stats are enabled, those of the workers are added up into them.
+
+    Returns True if every input was converted successfully.
+    """
+    filenames = FindInputs(inputs)
+    if date is None:
+        date = utils.txfDate(datetime.today())
+
+    out_filenames: list[Optional[str]] = [None] * len(filenames)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+        out_filenames = [OutputFilename(out_dir, filename, out_format)
+                         for filename in filenames]
+
+    start = time.perf_counter()
+    results: list[Result] = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures: list[Future[Result]] = []
+        claimed: set[str] = set()
+        for (filename, out_filename_for_input) in zip(filenames, out_filenames):
+            if out_filename_for_input in claimed:
+                result = Result(filename)
+                result.error = 'output %s would overwrite that of another input' % (
+                    out_filename_for_input)
+                future: Future[Result] = Future()
+                future.set_result(result)
+                futures.append(future)
+                continue
+            if out_filename_for_input is not None:
+                claimed.add(out_filename_for_input)
+            futures.append(executor.submit(
+                Convert, filename, broker_name, tax_year, date, out_format,
+                out_filename_for_input, max_warnings, lot_method, wash, split, jobs,
+                pipelined, cache_dir, cache_max_bytes, stats.ACTIVE is not None))
+
+        def Collect() -> Iterator[utils.Transaction]:
+            # Wait for the results in input order, so that the merged output
+            # is deterministic, and drop each file's transactions once they
+            # have been written out.
+            for future in futures:
+                result = future.result()
+                Report(result, err)
+                if result.stats is not None:
+                    stats.Merge(result.stats)
+                yield from result.txns
+                result.txns = []
+                results.append(result)
+
+        if out_dir:
+            for _ in Collect():
+                pass
+        elif out_filename:
+            with open(out_filename, 'w') as out:
+                _WriteMerged(Collect(), tax_year, date, out_format, len(filenames), out)
+        else:
+            _WriteMerged(Collect(), tax_year, date, out_format, len(filenames), sys.stdout)
+            sys.stdout.write('\n')
+
+    failures = [result for result in results if result.error is not None]
+    err.write('batch: %d files, %d failed, %d txns in %.3fs\n' % (
+        len(results), len(failures), sum(result.num_txns for result in results),
+        time.perf_counter() - start))
+    return not failures
+
+
+def _WriteMerged(txns: Iterable[utils.Transaction], tax_year: int, date: str,
+                 out_format: str, num_files: int, out: TextIO) -> None:
+    _Write(txns, 'Batch of %d files' % num_files, tax_year, date, out_format, out)
+
+
+def _Write(txns: Iterable[utils.Transaction], name: str, tax_year: int, date: str,
+           out_format: str, out: TextIO) -> None:
+    # Unknown formats fall back to TXF, as they do for a single conversion.
+    sink = sinks.SINKS.get(out_format, sinks.TxfSink)(out, name, tax_year, date)
+    for txn in txns:
+        sink.add(txn)
+    sink.finish()
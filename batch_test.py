@@ -0,0 +1,113 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the batch module."""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import batch
+import parallel
+import pipeline
+import stats
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def testFindInputs(self):
+        inputs = batch.FindInputs(['testdata', 'testdata/vanguard.csv'])
+        self.assertEqual(['testdata/interactive_brokers.csv',
+                          'testdata/tdameritrade.csv',
+                          'testdata/vanguard.csv'], inputs)
+
+    def testOutDirMatchesGoldens(self):
+        err = io.StringIO()
+        ok = batch.Run(['testdata/vanguard.csv', 'testdata/interactive_brokers.csv'],
+                       None, 2011, '04/15/2012', 'txf', self.tmpdir, None, 2, err)
+        self.assertTrue(ok, err.getvalue())
+        for name in ('vanguard', 'interactive_brokers'):
+            with open(os.path.join(self.tmpdir, name + '.txf')) as actual:
+                with open('testdata/%s.out' % name) as expected:
+                    self.assertEqual(expected.read(), actual.read())
+
+    def testZipArchive(self):
+        archive = os.path.join(self.tmpdir, 'exports.zip')
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as f:
+            f.write('testdata/vanguard.csv', 'vanguard.csv')
+            f.write('testdata/interactive_brokers.csv', '2011/interactive_brokers.csv')
+            f.write('testdata/vanguard.out', 'vanguard.out')
+        self.assertEqual([archive + '/2011/interactive_brokers.csv', archive + '/vanguard.csv'],
+                         batch.FindInputs([self.tmpdir]))
+
+        out_dir = os.path.join(self.tmpdir, 'out')
+        err = io.StringIO()
+        ok = batch.Run([archive], None, 2011, '04/15/2012', 'txf', out_dir, None, 2, err)
+        self.assertTrue(ok, err.getvalue())
+        for name in ('vanguard', 'interactive_brokers'):
+            with open(os.path.join(out_dir, name + '.txf')) as actual:
+                with open('testdata/%s.out' % name) as expected:
+                    self.assertEqual(expected.read(), actual.read())
+
+    def testBadFileDoesNotAbortBatch(self):
+        bad = os.path.join(self.tmpdir, 'bad.csv')
+        with open(bad, 'w') as f:
+            f.write('not,a,broker,export\n')
+        merged = os.path.join(self.tmpdir, 'merged.summary')
+
+        err = io.StringIO()
+        ok = batch.Run([bad, 'testdata/vanguard.csv'], None, 2011, None, 'summary',
+                       None, merged, 2, err)
+        self.assertFalse(ok)
+        self.assertIn('FAIL', err.getvalue())
+        self.assertIn('1 failed', err.getvalue())
+        with open(merged) as f:
+            self.assertIn('Num sale txns:  2', f.read())
+
+    def testWorkerSettings(self):
+        self.addCleanup(setattr, parallel, 'ENABLED', parallel.ENABLED)
+        self.addCleanup(setattr, parallel, 'JOBS', parallel.JOBS)
+        self.addCleanup(setattr, pipeline, 'ENABLED', pipeline.ENABLED)
+        cache_dir = os.path.join(self.tmpdir, 'cache')
+        for cache_hits in (0, 1):
+            result = batch.Convert('testdata/vanguard.csv', None, 2011, '04/15/2012', 'txf',
+                                   None, split=True, split_jobs=3, pipelined=True,
+                                   cache_dir=cache_dir, collect_stats=True)
+            self.assertIsNone(result.error)
+            self.assertEqual(2, result.num_txns)
+            self.assertEqual(cache_hits, result.stats['counters'].get('cache_hits', 0))
+        # Workers need not inherit these from the process which starts them.
+        self.assertEqual((True, 3, True), (parallel.ENABLED, parallel.JOBS, pipeline.ENABLED))
+        self.assertIsNone(stats.ACTIVE)
+
+    def testStatsOfWorkers(self):
+        self.addCleanup(stats.Disable)
+        stats.Enable()
+        ok = batch.Run(['testdata/vanguard.csv', 'testdata/tdameritrade.csv'], None, 2011,
+                       '04/15/2012', 'summary', None, os.path.join(self.tmpdir, 'out'), 2,
+                       io.StringIO())
+        self.assertTrue(ok)
+        self.assertGreater(stats.ACTIVE.counters['bytes_in'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,363 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks the converter on large synthetic broker exports.
+
+Generates seeded, valid exports for each broker at several sizes and times
+detection, parsing, TXF rendering and the summary report on each, along with
+a full streaming conversion and its peak memory. Given a baseline recorded on
+the same machine, results are compared against it to catch performance
+regressions.
+
+With `--startup`, instead times starting up the command-line tool: importing
+it, as reported by `python -X importtime`, and running `csv2txf.py --help`.
+
+Usage:
+  ./benchmark.py [--sizes 1000,10000,100000] [--json]
+  ./benchmark.py --baseline FILE [--update-baseline] [--tolerance 0.25]
+  ./benchmark.py --startup [--repeat 10]
+
+Baselines are machine-dependent, so none is kept in the repository: record
+one with `--update-baseline` before making a change, and compare against it
+afterwards. Parsers decode some fields lazily, when they are rendered, so how
+the time splits between parsing and rendering may change from one version to
+the next; `convert`, which times both, stays comparable.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, TextIO
+
+from brokers import BROKERS, DetectBroker
+import csv2txf
+from interactive_brokers import FIRST_LINE as IB_FIRST_LINE
+from tdameritrade import FIRST_LINE as TD_FIRST_LINE
+import utils
+from vanguard import FIRST_LINE as VANGUARD_FIRST_LINE
+
+
+# Bump this whenever what the stages measure changes, so that baselines
+# recorded before are not compared against.
+BASELINE_VERSION = 2
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_TAX_YEAR = 2020
+STAGES = ['detect', 'parse', 'render', 'summary', 'convert']
+# Detection takes microseconds regardless of file size, which is too noisy to
+# compare against a baseline.
+COMPARED_STAGES = ['parse', 'render', 'summary', 'convert']
+
+SYMBOLS = ['ABC', 'BAR', 'XYZ', 'FOO', 'QUUX', 'ACME', 'INIT', 'WXYZ', 'MNOP', 'ZZZ']
+
+
+def _Dollars(value: float) -> str:
+    return '{:,.2f}'.format(value)
+
+
+def _RandomLot(rng: random.Random, tax_year: int) -> tuple[int, str, datetime, datetime, float, float]:
+    """Returns (shares, symbol, buy date, sell date, cost, proceeds)."""
+    shares = rng.randint(1, 50) * 10
+    symbol = rng.choice(SYMBOLS)
+    sell_date = datetime(tax_year, 1, 1) + timedelta(days=rng.randrange(365))
+    buy_date = sell_date - timedelta(days=rng.randrange(1, 3 * 365))
+    cost = shares * rng.uniform(1.0, 500.0)
+    proceeds = cost * rng.uniform(0.5, 1.5)
+    return (shares, symbol, buy_date, sell_date, cost, proceeds)
+
+
+def GenerateVanguard(out: TextIO, rows: int, rng: random.Random, tax_year: int) -> None:
+    """Writes `rows` reconciled buy/sell pairs in the Vanguard format."""
+    out.write(VANGUARD_FIRST_LINE)
+    for _ in range(rows):
+        (shares, symbol, buy_date, sell_date, cost, proceeds) = _RandomLot(rng, tax_year)
+        name = '%s Corp' % symbol
+        out.write('"%s","Buy","%s","%s",%d,%.2f,%.2f\n' % (
+            buy_date.strftime('%Y-%m-%d'), name, symbol, shares, -cost * 0.99, -cost))
+        out.write('"%s","Sell","%s","%s",%d,%.2f,%.2f\n' % (
+            sell_date.strftime('%Y-%m-%d'), name, symbol, -shares, proceeds * 1.01, proceeds))
+
+
+def GenerateTDAmeritrade(out: TextIO, rows: int, rng: random.Random, tax_year: int) -> None:
+    """Writes `rows` gain/loss records in the TD Ameritrade format."""
+    out.write(TD_FIRST_LINE)
+    total_cost = 0.0
+    total_proceeds = 0.0
+    for _ in range(rows):
+        (shares, symbol, buy_date, sell_date, cost, proceeds) = _RandomLot(rng, tax_year)
+        total_cost += cost
+        total_proceeds += proceeds
+        term = 'Long-term' if utils.isLongTerm(buy_date, sell_date) else 'Short-term'
+        out.write('%s Inc. (%s),Sell.FIFO,%d.,%d/%d/%d,"%s ",%d/%d/%d,"%s ",%.2f ,%.2f ,%s\n' % (
+            symbol, symbol, shares,
+            buy_date.month, buy_date.day, buy_date.year, _Dollars(cost),
+            sell_date.month, sell_date.day, sell_date.year, _Dollars(proceeds),
+            proceeds - cost, (proceeds - cost) / cost * 100, term))
+    out.write('Total:,,,,"%s ",,"%s ","%s ",,\n' % (
+        _Dollars(total_cost), _Dollars(total_proceeds), _Dollars(total_proceeds - total_cost)))
+
+
+def GenerateInteractiveBrokers(out: TextIO, rows: int, rng: random.Random, tax_year: int) -> None:
+    """Writes `rows` records spread over all parts and boxes of the IB Form 8949 worksheet."""
+    out.write('%s%d,\n' % (IB_FIRST_LINE, tax_year))
+    out.write('Account,U123456,John Doe,\n')
+    sections = [(part, box) for part in ('I', 'II') for box in ('A', 'B', 'C')]
+    for (i, (part, box)) in enumerate(sections):
+        out.write('Part,%s,\n' % part)
+        out.write('Box,%s,\n' % box)
+        out.write('Header,Description,Code,Date Acquired,Date Sold,Sales Price,'
+                  'Cost Basis,Adjustment,\n')
+        total_cost = 0.0
+        total_proceeds = 0.0
+        for _ in range(rows // len(sections) + (1 if i < rows % len(sections) else 0)):
+            (shares, symbol, buy_date, sell_date, cost, proceeds) = _RandomLot(rng, tax_year)
+            total_cost += cost
+            total_proceeds += proceeds
+            adjustment = '"%s"' % _Dollars(cost - proceeds) if rng.random() < 0.05 else ''
+            out.write('Data,%d sh %s INC,,%d/%d/%d,%d/%d/%d,"%s","%s",%s,\n' % (
+                shares, symbol, buy_date.month, buy_date.day, buy_date.year,
+                sell_date.month, sell_date.day, sell_date.year,
+                _Dollars(proceeds), _Dollars(cost), adjustment))
+        out.write('Footer,,,,,"%s","%s",,\n' % (_Dollars(total_proceeds), _Dollars(total_cost)))
+
+
+GENERATORS: dict[str, Callable[[TextIO, int, random.Random, int], None]] = {
+    'ib': GenerateInteractiveBrokers,
+    'tdameritrade': GenerateTDAmeritrade,
+    'vanguard': GenerateVanguard,
+}
+
+
+def Generate(broker_name: str, filename: str, rows: int, seed: int = 0,
+             tax_year: int = DEFAULT_TAX_YEAR) -> None:
+    with open(filename, 'w') as out:
+        GENERATORS[broker_name](out, rows, random.Random(seed), tax_year)
+
+
+class _NullWriter:
+    """Discards its input, only counting how much was written."""
+
+    def __init__(self):
+        self.chars = 0
+
+    def write(self, data: str) -> int:
+        self.chars += len(data)
+        return len(data)
+
+
+def _Time(fn: Callable[[], object], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def BenchmarkFile(broker_name: str, filename: str, rows: int, tax_year: int,
+                  repeat: int = 3) -> dict[str, dict[str, float]]:
+    """Returns {stage: {'seconds': ..., 'rows_per_sec': ...}}; that of `convert`
+    also has the peak memory of the conversion, as 'peak_bytes'."""
+    broker = BROKERS[broker_name]
+    assert DetectBroker(filename) is broker
+    txns = broker.parseFileToTxnList(filename, tax_year)
+    assert len(txns) == rows, '%s: parsed %d of %d rows' % (filename, len(txns), rows)
+
+    timings = {
+        'detect': _Time(lambda: DetectBroker(filename), repeat),
+        'parse': _Time(lambda: broker.parseFileToTxnList(filename, tax_year), repeat),
+        'render': _Time(lambda: csv2txf.WriteTxf(txns, tax_year, '04/15/2021', _NullWriter()),
+                        repeat),
+        'summary': _Time(lambda: csv2txf.FormatSummary(broker.name(), txns, tax_year), repeat),
+    }
+    del txns
+
+    def Convert():
+        csv2txf.WriteTxf(broker.iterTxns(filename, tax_year), tax_year, '04/15/2021',
+                         _NullWriter())
+
+    timings['convert'] = _Time(Convert, repeat)
+    # Timed separately, as tracing allocations slows the conversion down.
+    tracemalloc.start()
+    Convert()
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results: dict[str, dict[str, float]] = {}
+    for (stage, seconds) in timings.items():
+        results[stage] = {'seconds': seconds, 'rows_per_sec': rows / seconds if seconds else 0.0}
+    results['convert']['peak_bytes'] = float(peak)
+    return results
+
+
+def StartupTime(repeat: int) -> dict[str, float]:
+    """Returns the best times of `repeat` runs to start up the tool, in seconds."""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    best = {'import': float('inf'), 'help': float('inf')}
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import csv2txf'],
+                                 cwd=directory, capture_output=True, text=True, check=True)
+        # The last line is for csv2txf itself, whose cumulative time includes
+        # all of the modules it imports, in microseconds.
+        cumulative = int(process.stderr.splitlines()[-1].split('|')[1])
+        best['import'] = min(best['import'], cumulative / 1e6)
+
+        start = time.perf_counter()
+        subprocess.run([sys.executable, 'csv2txf.py', '--help'], cwd=directory,
+                       stdout=subprocess.DEVNULL, check=True)
+        best['help'] = min(best['help'], time.perf_counter() - start)
+    return best
+
+
+def Run(sizes: list[int], brokers: list[str], seed: int, tax_year: int,
+        repeat: int) -> dict[str, dict[str, dict[str, dict[str, float]]]]:
+    """Returns {broker: {size: {stage: metrics}}}."""
+    tmpdir = tempfile.mkdtemp(prefix='csv2txf-bench.')
+    try:
+        results: dict[str, dict[str, dict[str, dict[str, float]]]] = {}
+        for broker_name in brokers:
+            results[broker_name] = {}
+            for rows in sizes:
+                filename = os.path.join(tmpdir, '%s.%d.csv' % (broker_name, rows))
+                Generate(broker_name, filename, rows, seed, tax_year)
+                results[broker_name][str(rows)] = BenchmarkFile(
+                    broker_name, filename, rows, tax_year, repeat)
+                os.remove(filename)
+        return results
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def Compare(results, baseline, tolerance: float) -> list[str]:
+    """Returns a description of each stage slower than the baseline by more than
+    `tolerance`, and of each conversion using that much more memory."""
+    regressions = []
+    for (broker_name, sizes) in results.items():
+        for (rows, stages) in sizes.items():
+            for stage in COMPARED_STAGES:
+                try:
+                    expected = baseline[broker_name][rows][stage]
+                except KeyError:
+                    continue
+                actual = stages[stage]
+                if 'rows_per_sec' in expected and (
+                        actual['rows_per_sec'] < expected['rows_per_sec'] * (1 - tolerance)):
+                    regressions.append('%s/%s/%s: %.0f rows/sec, baseline %.0f (%+.0f%%)' % (
+                        broker_name, rows, stage, actual['rows_per_sec'],
+                        expected['rows_per_sec'],
+                        (actual['rows_per_sec'] / expected['rows_per_sec'] - 1) * 100))
+                if 'peak_bytes' in expected and (
+                        actual['peak_bytes'] > expected['peak_bytes'] * (1 + tolerance)):
+                    regressions.append('%s/%s/%s: peak %.2f MiB, baseline %.2f MiB (%+.0f%%)' % (
+                        broker_name, rows, stage, actual['peak_bytes'] / (1 << 20),
+                        expected['peak_bytes'] / (1 << 20),
+                        (actual['peak_bytes'] / expected['peak_bytes'] - 1) * 100))
+    return regressions
+
+
+def FormatTable(results) -> str:
+    lines = ['%-14s %9s %-8s %12s %14s %10s' % (
+        'broker', 'rows', 'stage', 'seconds', 'rows/sec', 'peak MiB')]
+    for (broker_name, sizes) in results.items():
+        for (rows, stages) in sizes.items():
+            for stage in STAGES:
+                peak = stages[stage].get('peak_bytes')
+                lines.append('%-14s %9s %-8s %12.6f %14.0f %10s' % (
+                    broker_name, rows, stage, stages[stage]['seconds'],
+                    stages[stage]['rows_per_sec'],
+                    '' if peak is None else '%.2f' % (peak / (1 << 20))))
+    return '\n'.join(lines)
+
+
+def main(argv):
+    from optparse import OptionParser
+    parser = OptionParser()
+    parser.add_option("--sizes", dest="sizes",
+                      default=','.join(str(size) for size in DEFAULT_SIZES),
+                      help="comma-separated numbers of transactions per file")
+    parser.add_option("--brokers", dest="brokers", default=','.join(sorted(GENERATORS)),
+                      help="comma-separated brokers to benchmark")
+    parser.add_option("--seed", dest="seed", type="int", default=0,
+                      help="seed for the synthetic data")
+    parser.add_option("--year", dest="year", type="int", default=DEFAULT_TAX_YEAR,
+                      help="tax year of the synthetic data")
+    parser.add_option("--repeat", dest="repeat", type="int", default=3,
+                      help="timing runs per stage; the best is reported")
+    parser.add_option("--baseline", dest="baseline",
+                      help="baseline file, recorded on this machine, to compare against")
+    parser.add_option("--tolerance", dest="tolerance", type="float", default=0.25,
+                      help="allowed slowdown, or growth in memory, relative to the "
+                           "baseline (default: %default)")
+    parser.add_option("--update-baseline", dest="update_baseline", action="store_true",
+                      default=False, help="store these results in the --baseline file")
+    parser.add_option("--json", dest="json", action="store_true", default=False,
+                      help="print results as JSON")
+    parser.add_option("--startup", dest="startup", action="store_true", default=False,
+                      help="time starting up the command-line tool instead")
+    (options, args) = parser.parse_args(argv)
+
+    if options.startup:
+        startup = StartupTime(options.repeat)
+        if options.json:
+            print(json.dumps(startup, indent=2, sort_keys=True))
+        else:
+            for (name, seconds) in startup.items():
+                print('%-8s %12.6f' % (name, seconds))
+        return
+
+    if options.update_baseline and not options.baseline:
+        parser.error('--update-baseline requires --baseline')
+
+    sizes = [int(size) for size in options.sizes.split(',')]
+    brokers = options.brokers.split(',')
+    results = Run(sizes, brokers, options.seed, options.year, options.repeat)
+
+    if options.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        print(FormatTable(results))
+
+    if options.update_baseline:
+        with open(options.baseline, 'w') as f:
+            json.dump({'version': BASELINE_VERSION, 'results': results}, f, indent=2,
+                      sort_keys=True)
+            f.write('\n')
+        return
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('version') != BASELINE_VERSION:
+            sys.stderr.write('%s was recorded by another version of the benchmark; '
+                             'record it again with --update-baseline\n' % options.baseline)
+            sys.exit(1)
+        regressions = Compare(results, baseline['results'], options.tolerance)
+        for regression in regressions:
+            sys.stderr.write('regression: %s\n' % regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,67 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the synthetic data generators of the benchmark module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import benchmark
+from brokers import BROKERS, DetectBroker
+
+
+class BenchmarkTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def testGeneratedFilesAreValid(self):
+        for broker_name in benchmark.GENERATORS:
+            filename = os.path.join(self.tmpdir, broker_name + '.csv')
+            benchmark.Generate(broker_name, filename, 100, seed=1, tax_year=2020)
+            broker = BROKERS[broker_name]
+            self.assertIs(broker, DetectBroker(filename))
+            self.assertEqual(100, len(broker.parseFileToTxnList(filename, 2020)))
+            self.assertEqual(0, len(broker.parseFileToTxnList(filename, 2019)))
+
+    def testGeneratorIsDeterministic(self):
+        contents = []
+        for i in range(2):
+            filename = os.path.join(self.tmpdir, 'td.%d.csv' % i)
+            benchmark.Generate('tdameritrade', filename, 50, seed=7)
+            with open(filename) as f:
+                contents.append(f.read())
+        self.assertEqual(contents[0], contents[1])
+
+    def testCompare(self):
+        baseline = {'ib': {'10': {'parse': {'rows_per_sec': 1000.0}}}}
+        fast = {'ib': {'10': {'parse': {'rows_per_sec': 900.0}}}}
+        slow = {'ib': {'10': {'parse': {'rows_per_sec': 500.0}}}}
+        self.assertEqual([], benchmark.Compare(fast, baseline, 0.25))
+        self.assertEqual(1, len(benchmark.Compare(slow, baseline, 0.25)))
+
+    def testCompareMemory(self):
+        baseline = {'ib': {'10': {'convert': {'rows_per_sec': 1000.0, 'peak_bytes': 1000.0}}}}
+        small = {'ib': {'10': {'convert': {'rows_per_sec': 1000.0, 'peak_bytes': 1200.0}}}}
+        large = {'ib': {'10': {'convert': {'rows_per_sec': 1000.0, 'peak_bytes': 2000.0}}}}
+        self.assertEqual([], benchmark.Compare(small, baseline, 0.25))
+        self.assertEqual(1, len(benchmark.Compare(large, baseline, 0.25)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,24 +15,93 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import ClassVar, Iterable, Iterator, Optional
 
+import csvrows
 import utils
 
 
 class Broker(ABC):
 
+    # The first line of files exported by this broker, including the trailing
+    # newline; if `HEADER_IS_PREFIX` is set, it only needs to match the start
+    # of the first line. Used to detect which broker produced a file.
+    HEADER: ClassVar[Optional[str]] = None
+    HEADER_IS_PREFIX: ClassVar[bool] = False
+
+    # Whether parsing can resume from a checkpoint; see `resumeTxnsFromRows`.
+    RESUMABLE: ClassVar[bool] = False
+
+    # Whether a file can be split into chunks which are parsed in parallel;
+    # see `summarizeRows`. Requires `RESUMABLE`.
+    SPLITTABLE: ClassVar[bool] = False
+
+    # The start of the lines which end exports by this broker (e.g., totals),
+    # and which are rewritten rather than appended to as the export grows.
+    TRAILER: ClassVar[Optional[str]] = None
+
     @classmethod
     @abstractmethod
     def name(cls) -> str:
         ...
 
     @classmethod
-    @abstractmethod
-    def isFileForBroker(cls, file: str) -> bool:
-        ...
+    def matchesHeader(cls, first_line: str) -> bool:
+        if cls.HEADER is None:
+            return False
+        if cls.HEADER_IS_PREFIX:
+            return first_line.startswith(cls.HEADER)
+        return first_line == cls.HEADER
+
+    @classmethod
+    def isFileForBroker(cls, file: csvrows.Source) -> bool:
+        return cls.matchesHeader(csvrows.FirstLine(file))
+
+    @classmethod
+    def iterTxns(cls, file: csvrows.Source,
+                 tax_year: Optional[int]) -> Iterator[utils.Transaction]:
+        """Yields transactions one at a time as they are parsed from `file`.
+
+        `file` is a file name or a `csvrows.Input`, e.g., of an upload held in
+        memory or of standard input.
+        """
+        return cls.iterTxnsFromRows(csvrows.Read(file), tax_year)
 
     @classmethod
     @abstractmethod
-    def parseFileToTxnList(cls, file: str, tax_year: Optional[int]) -> list[utils.Transaction]:
+    def iterTxnsFromRows(cls, rows: Iterable[list[str]],
+                         tax_year: Optional[int]) -> Iterator[utils.Transaction]:
+        """Yields transactions one at a time as they are parsed from CSV `rows`."""
         ...
+
+    @classmethod
+    def resumeTxnsFromRows(cls, rows: Iterable[list[str]], tax_year: Optional[int],
+                           state: dict) -> Iterator[utils.Transaction]:
+        """Like `iterTxnsFromRows`, but resumes parsing from `state`.
+
+        `state` is empty at the start of a file, and is updated as `rows` are
+        consumed, so that the rows which follow them can be parsed later on;
+        it only holds values which `marshal` can store. Only supported by
+        brokers which set `RESUMABLE`.
+        """
+        raise NotImplementedError('%s cannot resume parsing' % cls.name())
+
+    @classmethod
+    def summarizeRows(cls, rows: Iterable[list[str]]) -> object:
+        """Returns what `advanceState` needs to know of `rows` to skip them.
+
+        This does not depend on the parser state before `rows`, so the chunks
+        of a file can be summarized in parallel. The summary must be picklable.
+        Only supported by brokers which set `SPLITTABLE`.
+        """
+        raise NotImplementedError('%s cannot split files' % cls.name())
+
+    @classmethod
+    def advanceState(cls, state: dict, summary: object) -> None:
+        """Updates `state` as `resumeTxnsFromRows` would for the summarized rows."""
+        raise NotImplementedError('%s cannot split files' % cls.name())
+
+    @classmethod
+    def parseFileToTxnList(cls, file: csvrows.Source,
+                           tax_year: Optional[int]) -> list[utils.Transaction]:
+        return list(cls.iterTxns(file, tax_year))
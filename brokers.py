@@ -15,51 +15,228 @@
 """Code for figuring out which broker to use.
 
 To define a new broker:
-1) Create a new class and define the following method:
+1) Create a new class derived from `Broker` and define the following method:
   @classmethod
-  def parseFileToTxnList(cls, filename, tax_year):
+  def iterTxnsFromRows(cls, rows, tax_year):
+    This should be a generator which yields transactions as they are parsed
+    from `rows`, the rows of the CSV file as lists of strings; `iterTxns` and
+    `parseFileToTxnList` are derived from it automatically.
     Note that if tax_year == None, then all transactions should be accepted.
-2) If there is an easy way to determine if a particular file is usable
-   by your class, then define the method:
+    If the rows follow a header naming the columns, declare the columns read
+    as a `schema.Schema`, and decode the rows with the decoder it compiles
+    for the header, as `TDAmeritrade` and `Vanguard` do.
+2) If the files exported by the broker start with a fixed header line, set
+   the `HEADER` class attribute (and `HEADER_IS_PREFIX`, if the header only
+   needs to match the start of the first line); detection then costs a single
+   hash lookup. Otherwise, if there is another easy way to determine if a
+   particular file is usable by your class, then override the method:
   @classmethod
   def isFileForBroker(cls, filename):
-    Note that if this method is not defined, then you may need to modify
+    `filename` may also be a `csvrows.Input`, so read it with `csvrows.Read`
+    or `csvrows.FirstLine` rather than opening it. Note that if neither is
+    defined, then you may need to modify
     update_testdata.py as well.
-3) Add your class to the BROKERS map below.
+3) Add an entry for your class to BUILTIN_BROKERS below, with its header, if
+   any, so that its module is only imported once it is used (or call
+   `RegisterBroker`); define the header in `headers`, for both the entry and
+   the class to use. Brokers distributed separately can instead declare an
+   entry point in the `csv2txf.brokers` group, named after the broker and
+   referring to its class.
 """
 
 from __future__ import annotations
 
-from typing import Optional, Type
+import importlib
+from typing import Any, Iterable, Iterator, Mapping, Optional, Type, TYPE_CHECKING, Union
 
-from broker import Broker
-from interactive_brokers import InteractiveBrokers
-from tdameritrade import TDAmeritrade
-from vanguard import Vanguard
+import headers
 
+if TYPE_CHECKING:
+    from broker import Broker
+    from csvrows import Source
 
-BROKERS: dict[str, Type[Broker]] = {
-    'amtd': TDAmeritrade,
-    'ib': InteractiveBrokers,
-    'tdameritrade': TDAmeritrade,
-    'vanguard': Vanguard,
+
+# The group of the entry points through which other packages provide brokers.
+ENTRY_POINT_GROUP = 'csv2txf.brokers'
+
+
+class BrokerEntry:
+    """A broker, whose module is only imported when the broker is used.
+
+    `HEADER` and `HEADER_IS_PREFIX` mirror those of the broker class, so that
+    files can be detected without importing it.
+    """
+
+    __slots__ = ('module', 'class_name', 'HEADER', 'HEADER_IS_PREFIX', '_broker')
+
+    def __init__(self, module: str, class_name: str, header: Optional[str] = None,
+                 header_is_prefix: bool = False):
+        self.module = module
+        self.class_name = class_name
+        self.HEADER = header
+        self.HEADER_IS_PREFIX = header_is_prefix
+        self._broker: Optional[Type[Broker]] = None
+
+    @classmethod
+    def of(cls, broker: Type[Broker]) -> BrokerEntry:
+        """Returns an entry for a broker class which is already imported."""
+        entry = cls(broker.__module__, broker.__qualname__, broker.HEADER,
+                    broker.HEADER_IS_PREFIX)
+        entry._broker = broker
+        return entry
+
+    def load(self) -> Type[Broker]:
+        if self._broker is None:
+            self._broker = getattr(importlib.import_module(self.module), self.class_name)
+        return self._broker
+
+    def isFileForBroker(self, filename: Source) -> bool:
+        return self.load().isFileForBroker(filename)
+
+
+BUILTIN_BROKERS: dict[str, BrokerEntry] = {
+    'ib': BrokerEntry('interactive_brokers', 'InteractiveBrokers',
+                      headers.INTERACTIVE_BROKERS, header_is_prefix=True),
+    'tdameritrade': BrokerEntry('tdameritrade', 'TDAmeritrade', headers.TDAMERITRADE),
+    'vanguard': BrokerEntry('vanguard', 'Vanguard', headers.VANGUARD),
 }
+BUILTIN_BROKERS['amtd'] = BUILTIN_BROKERS['tdameritrade']
+
+_ENTRIES: dict[str, BrokerEntry] = dict(BUILTIN_BROKERS)
+
+# Entry points not loaded yet, by name, or None until they are looked up.
+_entry_points: Optional[dict[str, Any]] = None
+
+
+def _EntryPoints() -> dict[str, Any]:
+    global _entry_points
+    if _entry_points is None:
+        from importlib.metadata import entry_points
+        found = entry_points()
+        if hasattr(found, 'select'):
+            group = found.select(group=ENTRY_POINT_GROUP)
+        else:
+            # Before Python 3.10, entry points are grouped in a dict.
+            group = found.get(ENTRY_POINT_GROUP, [])
+        _entry_points = {entry_point.name: entry_point for entry_point in group
+                         if entry_point.name not in _ENTRIES}
+    return _entry_points
+
+
+def _LoadEntryPoint(broker_name: str) -> Optional[BrokerEntry]:
+    entry_point = _EntryPoints().pop(broker_name, None)
+    if entry_point is None:
+        return None
+    RegisterBroker(broker_name, entry_point.load())
+    return _ENTRIES[broker_name]
+
+
+class _Brokers(Mapping[str, 'Type[Broker]']):
+    """Broker names and aliases to broker classes, imported on first use."""
+
+    def __getitem__(self, broker_name: str) -> Type[Broker]:
+        entry = _ENTRIES.get(broker_name) or _LoadEntryPoint(broker_name)
+        if entry is None:
+            raise KeyError(broker_name)
+        return entry.load()
 
+    def __contains__(self, broker_name: object) -> bool:
+        return broker_name in _ENTRIES or broker_name in _EntryPoints()
 
-def DetectBroker(filename: str) -> Optional[Type[Broker]]:
-    for (broker_name, broker) in BROKERS.items():
-        if hasattr(broker, 'isFileForBroker'):
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(_ENTRIES) + list(_EntryPoints()))
+
+    def __len__(self) -> int:
+        return len(_ENTRIES) + len(_EntryPoints())
+
+
+BROKERS: Mapping[str, Type[Broker]] = _Brokers()
+
+# What `HeaderIndex` can tell files apart with: broker classes or entries.
+Detectable = Union['Type[Broker]', BrokerEntry]
+
+
+# Number of characters of the first line read for detection; this is far longer
+# than any known header, but bounds the read for files without newlines.
+MAX_HEADER_LENGTH = 64 * 1024
+
+
+class HeaderIndex:
+    """Maps the first line of a file to the broker which exported it.
+
+    Exact headers are looked up in a single dict; prefix headers are grouped
+    by length, so a lookup costs one dict probe per distinct prefix length
+    rather than one check (and one file read) per broker.
+    """
+
+    def __init__(self, brokers: Iterable[Detectable] = ()):
+        self._exact: dict[str, Detectable] = {}
+        # Prefix length -> prefix -> broker, with the longest prefixes first.
+        self._prefixes: dict[int, dict[str, Detectable]] = {}
+        # Brokers with no fixed header, which must inspect the file themselves.
+        self._others: list[Detectable] = []
+        for broker in brokers:
+            self.add(broker)
+
+    def add(self, broker: Detectable) -> None:
+        header = broker.HEADER
+        if header is None:
+            if broker not in self._others:
+                self._others.append(broker)
+        elif broker.HEADER_IS_PREFIX:
+            self._prefixes.setdefault(len(header), {})[header] = broker
+            self._prefixes = dict(sorted(self._prefixes.items(), reverse=True))
+        else:
+            self._exact[header] = broker
+
+    def lookup(self, first_line: str) -> Optional[Detectable]:
+        broker = self._exact.get(first_line)
+        if broker is not None:
+            return broker
+        for (length, prefixes) in self._prefixes.items():
+            broker = prefixes.get(first_line[:length])
+            if broker is not None:
+                return broker
+        return None
+
+    def detect(self, filename: Source) -> Optional[Detectable]:
+        import csvrows
+        broker = self.lookup(csvrows.FirstLine(filename, MAX_HEADER_LENGTH))
+        if broker is not None:
+            return broker
+        for broker in self._others:
             if broker.isFileForBroker(filename):
                 return broker
+        return None
+
+
+_HEADER_INDEX = HeaderIndex(_ENTRIES.values())
+
+
+def RegisterBroker(broker_name: str, broker: Type[Broker]) -> None:
+    entry = BrokerEntry.of(broker)
+    _ENTRIES[broker_name] = entry
+    _HEADER_INDEX.add(entry)
+
 
-    return None
+def DetectBroker(filename: Source) -> Optional[Type[Broker]]:
+    entry = _HEADER_INDEX.detect(filename)
+    if entry is None and _EntryPoints():
+        # Only import the brokers of other packages once the built-in ones
+        # have failed to recognize the file.
+        for broker_name in list(_EntryPoints()):
+            _LoadEntryPoint(broker_name)
+        entry = _HEADER_INDEX.detect(filename)
+    return None if entry is None else entry.load()
 
 
-def GetBroker(broker_name: str, filename: str) -> Type[Broker]:
-    if broker_name in BROKERS:
-        return BROKERS[broker_name]
+def GetBroker(broker_name: Optional[str], filename: Source) -> Type[Broker]:
+    if broker_name:
+        broker = BROKERS.get(broker_name)
+        if broker is not None:
+            return broker
 
-    broker: Optional[Type[Broker]] = DetectBroker(filename)
+    broker = DetectBroker(filename)
     if not broker:
         raise Exception('Invalid broker name: %s' % broker_name)
 
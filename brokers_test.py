@@ -0,0 +1,149 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the brokers module."""
+
+import gzip
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import brokers
+import csvrows
+from interactive_brokers import InteractiveBrokers
+from tdameritrade import TDAmeritrade
+from vanguard import Vanguard
+
+
+class BrokersTest(unittest.TestCase):
+    def testDetect(self):
+        self.assertIs(InteractiveBrokers,
+                      brokers.DetectBroker('testdata/interactive_brokers.csv'))
+        self.assertIs(TDAmeritrade, brokers.DetectBroker('testdata/tdameritrade.csv'))
+        self.assertIs(Vanguard, brokers.DetectBroker('testdata/vanguard.csv'))
+        self.assertIsNone(brokers.DetectBroker('testdata/vanguard.out'))
+
+    def testDetectInput(self):
+        for (filename, broker) in (('testdata/interactive_brokers.csv', InteractiveBrokers),
+                                   ('testdata/tdameritrade.csv', TDAmeritrade),
+                                   ('testdata/vanguard.csv', Vanguard)):
+            expected = broker.parseFileToTxnList(filename, None)
+            with open(filename, 'rb') as f:
+                source = csvrows.Input(f)
+                self.assertIs(broker, brokers.GetBroker(None, source))
+                self.assertEqual([str(txn) for txn in expected],
+                                 [str(txn) for txn in broker.parseFileToTxnList(source, None)])
+        self.assertIsNone(brokers.DetectBroker(csvrows.Input('Unknown,header\n')))
+
+    def testDetectCompressed(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        filename = os.path.join(tmpdir, 'vanguard.csv.gz')
+        with open('testdata/vanguard.csv', 'rb') as f:
+            data = f.read()
+        with gzip.open(filename, 'wb') as f:
+            f.write(data)
+        self.assertIs(Vanguard, brokers.DetectBroker(filename))
+
+    def testLookup(self):
+        index = brokers.HeaderIndex(brokers.BROKERS.values())
+        self.assertIs(InteractiveBrokers,
+                      index.lookup('Title,Worksheet for Form 8949,2011,\n'))
+        self.assertIs(TDAmeritrade, index.lookup(TDAmeritrade.HEADER))
+        self.assertIsNone(index.lookup(TDAmeritrade.HEADER + 'extra'))
+        self.assertIsNone(index.lookup('Title,Worksheet'))
+        self.assertIsNone(index.lookup(''))
+
+    def testLongestPrefixWins(self):
+        class Narrow(InteractiveBrokers):
+            HEADER = InteractiveBrokers.HEADER + '2011,'
+
+        index = brokers.HeaderIndex([InteractiveBrokers, Narrow])
+        self.assertIs(Narrow, index.lookup('Title,Worksheet for Form 8949,2011,\n'))
+        self.assertIs(InteractiveBrokers,
+                      index.lookup('Title,Worksheet for Form 8949,2012,\n'))
+
+    def testBuiltinHeadersMatch(self):
+        for (broker_name, entry) in brokers.BUILTIN_BROKERS.items():
+            broker = brokers.BROKERS[broker_name]
+            self.assertEqual(broker.HEADER, entry.HEADER, broker_name)
+            self.assertEqual(broker.HEADER_IS_PREFIX, entry.HEADER_IS_PREFIX, broker_name)
+
+    def testBrokersAreImportedLazily(self):
+        script = ';'.join([
+            'import sys',
+            'import csv2txf',
+            'print(sorted(m for m in ("interactive_brokers", "tdameritrade", "vanguard")'
+            ' if m in sys.modules))',
+            'csv2txf.GetBroker(None, "testdata/tdameritrade.csv")',
+            'print(sorted(m for m in ("interactive_brokers", "tdameritrade", "vanguard")'
+            ' if m in sys.modules))',
+        ])
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True,
+                                text=True, check=True).stdout
+        self.assertEqual("[]\n['tdameritrade']\n", output)
+
+
+class FakeEntryPoint:
+    def __init__(self, name, broker):
+        self.name = name
+        self.broker = broker
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        return self.broker
+
+
+class PluginBroker(TDAmeritrade):
+    HEADER = 'Plugin,' + TDAmeritrade.HEADER
+
+
+class EntryPointTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        for name in ('_ENTRIES', '_HEADER_INDEX', '_entry_points'):
+            self.addCleanup(setattr, brokers, name, getattr(brokers, name))
+        brokers._ENTRIES = dict(brokers._ENTRIES)
+        brokers._HEADER_INDEX = brokers.HeaderIndex(brokers._ENTRIES.values())
+        self.entry_point = FakeEntryPoint('plugin', PluginBroker)
+        brokers._entry_points = {'plugin': self.entry_point}
+
+    def testByName(self):
+        self.assertIs(TDAmeritrade, brokers.GetBroker('tdameritrade', 'unused.csv'))
+        self.assertEqual(0, self.entry_point.loads)
+        self.assertIn('plugin', brokers.BROKERS)
+        self.assertEqual(0, self.entry_point.loads)
+        self.assertIs(PluginBroker, brokers.GetBroker('plugin', 'unused.csv'))
+        self.assertIs(PluginBroker, brokers.BROKERS['plugin'])
+        self.assertEqual(1, self.entry_point.loads)
+
+    def testDetect(self):
+        self.assertIs(Vanguard, brokers.DetectBroker('testdata/vanguard.csv'))
+        self.assertEqual(0, self.entry_point.loads)
+        filename = os.path.join(self.tmpdir, 'plugin.csv')
+        with open('testdata/tdameritrade.csv') as source, open(filename, 'w') as f:
+            f.write('Plugin,' + source.read())
+        self.assertIs(PluginBroker, brokers.DetectBroker(filename))
+        self.assertEqual(1, self.entry_point.loads)
+
+
+if __name__ == '__main__':
+    unittest.main()
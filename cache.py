@@ -0,0 +1,385 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""On-disk cache of parsed transactions, keyed by file content.
+
+Entries are keyed by a hash of the input file's contents, the broker class,
+the tax year, the lot matching method and a hash of the parser's source code,
+so editing either the export or the code invalidates the entry automatically.
+Entries are stored in a SQLite database as compressed `marshal` data, which
+(unlike `pickle`) cannot execute code when loaded, and the least recently used
+ones are evicted once the cache grows beyond its size limit. Transactions are
+encoded as they are parsed and passed on, and the entry is stored once the
+whole file has been parsed. The transactions may be consumed on another thread
+than the one which opened the cache (e.g., with `--pipeline`), so the database
+is shared between threads, one at a time.
+
+In incremental mode, the cache instead keeps a checkpoint for each input file:
+how far it was parsed, a hash of that prefix and the parser's state at that
+point. Exports which only grow then need only the appended rows parsed, and
+only their transactions are produced; if the prefix has changed, the whole
+file is parsed again.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from decimal import Decimal
+import hashlib
+import inspect
+import io
+import marshal
+import mmap
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Callable, Iterable, Iterator, Optional, Type
+import zlib
+
+from broker import Broker
+import csvrows
+import diagnostics
+import lots
+import money
+import schema
+import stats
+import utils
+
+
+# Bump this whenever the encoding below changes.
+FORMAT_VERSION = 4
+
+DEFAULT_MAX_BYTES = 1 << 30
+
+DB_FILENAME = 'txns.sqlite3'
+
+# Fields are stored positionally, in the order of `Transaction.__init__`.
+_FIELDS = utils.Transaction.FIELDS
+_DATE_INDICES = [_FIELDS.index(field) for field in ('buyDate', 'sellDate')]
+# Amounts are stored as they are, in cents.
+_DECIMAL_INDICES = [_FIELDS.index('shares')]
+
+# Transactions are encoded this many at a time, as they are parsed.
+BATCH_SIZE = 1024
+
+# Source files which every parser depends on, in addition to its own module.
+_COMMON_SOURCES = [csvrows, diagnostics, lots, money, schema, utils,
+                   sys.modules[Broker.__module__]]
+
+
+class TxnEncoder:
+    """Encodes transactions as they are added, into bytes which `DecodeTxns`
+    turns back into them.
+
+    Transactions are compressed a batch at a time, so only the compressed
+    bytes are kept, rather than the transactions themselves. `level` is that
+    of `zlib.compress`.
+    """
+
+    def __init__(self, level: int = -1):
+        self._compressor = zlib.compressobj(level)
+        self._chunks: list[bytes] = []
+        self._rows: list[tuple] = []
+
+    def add(self, txn: utils.Transaction) -> None:
+        row = [getattr(txn, field) for field in _FIELDS]
+        for i in _DATE_INDICES:
+            if row[i] is not None:
+                row[i] = row[i].toordinal()
+        for i in _DECIMAL_INDICES:
+            if row[i] is not None:
+                row[i] = str(row[i])
+        self._rows.append(tuple(row))
+        if len(self._rows) >= BATCH_SIZE:
+            self._flushRows()
+
+    def _flushRows(self) -> None:
+        self._chunks.append(self._compressor.compress(marshal.dumps(self._rows)))
+        self._rows = []
+
+    def finish(self) -> bytes:
+        if self._rows:
+            self._flushRows()
+        self._chunks.append(self._compressor.flush())
+        return b''.join(self._chunks)
+
+
+def EncodeTxns(txns: Iterable[utils.Transaction], level: int = -1) -> bytes:
+    """Returns `txns` as compact bytes, which `DecodeTxns` turns back into them."""
+    encoder = TxnEncoder(level)
+    for txn in txns:
+        encoder.add(txn)
+    return encoder.finish()
+
+
+def IterDecodeTxns(data: bytes) -> Iterator[utils.Transaction]:
+    """Yields the transactions encoded in `data`, a batch at a time."""
+    stream = io.BytesIO(zlib.decompress(data))
+    end = len(stream.getbuffer())
+    while stream.tell() < end:
+        for row in marshal.load(stream):
+            values = list(row)
+            for i in _DATE_INDICES:
+                if values[i] is not None:
+                    values[i] = datetime.fromordinal(values[i])
+            for i in _DECIMAL_INDICES:
+                if values[i] is not None:
+                    values[i] = Decimal(values[i])
+            yield utils.Transaction(*values)
+
+
+def DecodeTxns(data: bytes) -> list[utils.Transaction]:
+    return list(IterDecodeTxns(data))
+
+
+_parser_versions: dict[Type[Broker], str] = {}
+
+
+def ParserVersion(broker: Type[Broker]) -> str:
+    """Returns a hash of the source code used to parse files for `broker`."""
+    version = _parser_versions.get(broker)
+    if version is None:
+        digest = hashlib.sha256(b'%d\0%s\0' % (FORMAT_VERSION, sys.version.encode()))
+        for module in [sys.modules[broker.__module__]] + _COMMON_SOURCES:
+            source_file = inspect.getsourcefile(module)
+            assert source_file is not None
+            with open(source_file, 'rb') as f:
+                digest.update(f.read())
+        version = _parser_versions[broker] = digest.hexdigest()
+    return version
+
+
+def FileHash(filename: str) -> str:
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _MappedHash(data: mmap.mmap) -> str:
+    digest = hashlib.sha256()
+    _HashRange(digest, data, 0, len(data))
+    return digest.hexdigest()
+
+
+def _CheckpointOffset(data: mmap.mmap, trailer: Optional[str]) -> int:
+    """Returns where to checkpoint `data`: the end of its last complete line,
+    before any lines starting with `trailer`, which may yet be rewritten."""
+    end = data.rfind(b'\n') + 1
+    if trailer:
+        prefix = trailer.encode()
+        while end:
+            start = data.rfind(b'\n', 0, end - 1) + 1
+            if data[start:start + len(prefix)] != prefix:
+                break
+            end = start
+    return end
+
+
+def _HashRange(digest, data: mmap.mmap, start: int, end: int) -> None:
+    for offset in range(start, end, 1 << 20):
+        digest.update(data[offset:min(offset + (1 << 20), end)])
+
+
+class TxnCache:
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES,
+                 incremental: bool = False):
+        os.makedirs(directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.incremental = incremental
+        # Guards `_db`, which is used by whichever thread consumes `iterTxns`.
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(os.path.join(directory, DB_FILENAME), timeout=60,
+                                   check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS entries ('
+                         'key TEXT PRIMARY KEY, data BLOB NOT NULL, '
+                         'size INTEGER NOT NULL, last_used REAL NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_by_last_used '
+                         'ON entries (last_used)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS checkpoints ('
+                         'key TEXT PRIMARY KEY, offset INTEGER NOT NULL, '
+                         'hash TEXT NOT NULL, state BLOB NOT NULL)')
+        self._db.commit()
+        # Checkpoints of the files parsed so far; see `saveCheckpoints`.
+        self._pending: list[tuple[str, int, str, bytes]] = []
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def key(self, broker: Type[Broker], filename: str, tax_year: Optional[int],
+            file_hash: Optional[str] = None) -> str:
+        """Returns the key of the transactions in `filename`, whose hash is
+        `file_hash`, if already known."""
+        return '%s:%s.%s:%s:%s:%s' % (
+            file_hash or FileHash(filename), broker.__module__, broker.__qualname__,
+            tax_year or 'all', lots.METHOD, ParserVersion(broker))
+
+    def _lookup(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._db.execute('SELECT data FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute('UPDATE entries SET last_used = ? WHERE key = ?',
+                             (time.time(), key))
+            self._db.commit()
+            return row[0]
+
+    def get(self, key: str) -> Optional[list[utils.Transaction]]:
+        data = self._lookup(key)
+        return None if data is None else DecodeTxns(data)
+
+    def put(self, key: str, txns: Iterable[utils.Transaction]) -> None:
+        self._store(key, EncodeTxns(txns))
+
+    def _store(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                             (key, data, len(data), time.time()))
+            self._evict()
+            self._db.commit()
+
+    def size(self) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def _evict(self) -> None:
+        excess = self.size() - self.max_bytes
+        if excess <= 0:
+            return
+        victims = []
+        for (key, size) in self._db.execute('SELECT key, size FROM entries ORDER BY last_used'):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._db.executemany('DELETE FROM entries WHERE key = ?', victims)
+
+    def iterTxns(self, broker: Type[Broker], filename: str,
+                 tax_year: Optional[int]) -> Iterator[utils.Transaction]:
+        """Yields transactions from the cache, or parses and caches them.
+
+        In incremental mode, yields the transactions appended since the last
+        checkpoint instead.
+        """
+        if self.incremental:
+            yield from self.iterNewTxns(broker, filename, tax_year)
+            return
+        if not csvrows.IsPlainFile(filename) or not os.path.getsize(filename):
+            # Compressed files are hashed as they are stored.
+            yield from self._iterCachedTxns(self.key(broker, filename, tax_year),
+                                            lambda: broker.iterTxns(filename, tax_year))
+            return
+        # The file is only mapped once, to both hash and parse it.
+        with open(filename, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                key = self.key(broker, filename, tax_year, _MappedHash(data))
+                yield from self._iterCachedTxns(
+                    key, lambda: broker.iterTxnsFromRows(csvrows.ReadMapped(data, filename),
+                                                         tax_year))
+
+    def _iterCachedTxns(self, key: str, parse: Callable[[], Iterable[utils.Transaction]]
+                        ) -> Iterator[utils.Transaction]:
+        data = self._lookup(key)
+        if data is not None:
+            stats.Count('cache_hits')
+            yield from IterDecodeTxns(data)
+            return
+
+        stats.Count('cache_misses')
+        encoder = TxnEncoder()
+        for txn in parse():
+            encoder.add(txn)
+            yield txn
+        # Only complete parses are cached.
+        self._store(key, encoder.finish())
+
+    def checkpointKey(self, broker: Type[Broker], filename: str,
+                      tax_year: Optional[int]) -> str:
+        return '%s:%s.%s:%s:%s:%s' % (
+            os.path.abspath(filename), broker.__module__, broker.__qualname__,
+            tax_year or 'all', lots.METHOD, ParserVersion(broker))
+
+    def getCheckpoint(self, key: str) -> Optional[tuple[int, str, dict]]:
+        with self._lock:
+            row = self._db.execute('SELECT offset, hash, state FROM checkpoints WHERE key = ?',
+                                   (key,)).fetchone()
+        if row is None:
+            return None
+        return (row[0], row[1], marshal.loads(row[2]))
+
+    def putCheckpoint(self, key: str, offset: int, digest: str, state: bytes) -> None:
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?)',
+                             (key, offset, digest, state))
+            self._db.commit()
+
+    def saveCheckpoints(self) -> None:
+        """Saves the checkpoints of the files parsed by `iterNewTxns` so far.
+
+        Call this once their transactions have been written out: until then,
+        the next run still yields them, in case writing them failed.
+        """
+        for checkpoint in self._pending:
+            self.putCheckpoint(*checkpoint)
+        self._pending = []
+
+    def iterNewTxns(self, broker: Type[Broker], filename: str,
+                    tax_year: Optional[int]) -> Iterator[utils.Transaction]:
+        """Yields the transactions appended to `filename` since its checkpoint.
+
+        If there is no checkpoint, or the part of the file it covers has
+        changed, yields all of the transactions. Once they are all consumed,
+        the file is checkpointed up to its last complete line, before any
+        trailing lines (e.g., totals) which are rewritten as it grows; those
+        are parsed again next time. The checkpoint is only saved by
+        `saveCheckpoints`.
+        """
+        if (not broker.RESUMABLE or not csvrows.IsPlainFile(filename)
+                or not os.path.getsize(filename)):
+            stats.Count('checkpoint_unsupported')
+            yield from broker.iterTxns(filename, tax_year)
+            return
+
+        key = self.checkpointKey(broker, filename, tax_year)
+        with open(filename, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                end = _CheckpointOffset(data, broker.TRAILER)
+                (start, state) = (0, {})
+                digest = hashlib.sha256()
+                checkpoint = self.getCheckpoint(key)
+                if checkpoint is not None and checkpoint[0] <= end:
+                    _HashRange(digest, data, 0, checkpoint[0])
+                    if digest.hexdigest() == checkpoint[1]:
+                        (start, _, state) = checkpoint
+                    else:
+                        digest = hashlib.sha256()
+                _HashRange(digest, data, start, end)
+                size = len(data)
+
+        stats.Count('checkpoint_hits' if start else 'checkpoint_misses')
+        yield from broker.resumeTxnsFromRows(csvrows.ReadRange(filename, start, end),
+                                             tax_year, state)
+        saved = marshal.dumps(state)
+        if end < size:
+            yield from broker.resumeTxnsFromRows(csvrows.ReadRange(filename, end),
+                                                 tax_year, marshal.loads(saved))
+        # Only complete parses are checkpointed.
+        self._pending.append((key, end, digest.hexdigest(), saved))
@@ -0,0 +1,153 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the cache module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import cache
+from cache import TxnCache
+from interactive_brokers import InteractiveBrokers
+from tdameritrade import TDAmeritrade
+from vanguard import Vanguard
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.cache = TxnCache(os.path.join(self.tmpdir, 'cache'))
+        self.addCleanup(self.cache.close)
+
+    def testRoundTrip(self):
+        for (broker, filename) in ((Vanguard, 'testdata/vanguard.csv'),
+                                   (InteractiveBrokers, 'testdata/interactive_brokers.csv')):
+            expected = [str(txn) for txn in broker.parseFileToTxnList(filename, 2011)]
+            key = self.cache.key(broker, filename, 2011)
+            self.assertIsNone(self.cache.get(key))
+            self.assertEqual(expected, [str(txn) for txn in
+                                        self.cache.iterTxns(broker, filename, 2011)])
+            cached = self.cache.get(key)
+            self.assertIsNotNone(cached)
+            self.assertEqual(expected, [str(txn) for txn in cached])
+            self.assertEqual([txn.buyDate for txn in broker.parseFileToTxnList(filename, 2011)],
+                             [txn.buyDate for txn in cached])
+
+    def testKeyDependsOnContentsAndYear(self):
+        filename = os.path.join(self.tmpdir, 'vanguard.csv')
+        shutil.copy('testdata/vanguard.csv', filename)
+        key = self.cache.key(Vanguard, filename, 2011)
+        self.assertNotEqual(key, self.cache.key(Vanguard, filename, 2012))
+        with open(filename, 'a') as f:
+            f.write('"2011-06-01","Buy","ABC Corp","ABC",10,-1.00,-1.00\n')
+        self.assertNotEqual(key, self.cache.key(Vanguard, filename, 2011))
+
+    def testStreamsWhileCaching(self):
+        filename = 'testdata/vanguard.csv'
+        key = self.cache.key(Vanguard, filename, 2011)
+        txns = self.cache.iterTxns(Vanguard, filename, 2011)
+        first = next(txns)
+        self.assertIsNone(self.cache.get(key))
+        rest = list(txns)
+        self.assertEqual([str(txn) for txn in [first] + rest],
+                         [str(txn) for txn in self.cache.get(key)])
+
+        # Parses which are not consumed completely are not cached.
+        key = self.cache.key(Vanguard, filename, None)
+        txns = self.cache.iterTxns(Vanguard, filename, None)
+        next(txns)
+        txns.close()
+        self.assertIsNone(self.cache.get(key))
+
+    def testManyBatches(self):
+        txns = Vanguard.parseFileToTxnList('testdata/vanguard.csv', 2011) * 1500
+        self.assertEqual([str(txn) for txn in txns],
+                         [str(txn) for txn in cache.DecodeTxns(cache.EncodeTxns(txns))])
+
+    def testEviction(self):
+        txns = Vanguard.parseFileToTxnList('testdata/vanguard.csv', 2011)
+        self.cache.put('a', txns)
+        self.cache.max_bytes = self.cache.size() * 2
+        self.cache.put('b', txns)
+        self.cache.put('c', txns)
+        self.assertIsNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('c'))
+
+
+class IncrementalTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.cache = TxnCache(os.path.join(self.tmpdir, 'cache'), incremental=True)
+        self.addCleanup(self.cache.close)
+        self.filename = os.path.join(self.tmpdir, 'input.csv')
+
+    def Write(self, lines):
+        with open(self.filename, 'w') as f:
+            f.writelines(lines)
+
+    def NewTxns(self, broker, tax_year):
+        txns = [str(txn) for txn in self.cache.iterTxns(broker, self.filename, tax_year)]
+        self.cache.saveCheckpoints()
+        return txns
+
+    def testOnlyAppendedRows(self):
+        for (broker, source, tax_year) in (
+                (TDAmeritrade, 'testdata/tdameritrade.csv', 2020),
+                (InteractiveBrokers, 'testdata/interactive_brokers.csv', 2011)):
+            with open(source) as f:
+                lines = f.readlines()
+            trailer = [line for line in lines[-1:] if line.startswith(broker.TRAILER)]
+            body = lines[:len(lines) - len(trailer)]
+            seen = []
+            for end in range(1, len(body) + 1):
+                self.Write(body[:end] + trailer)
+                seen += self.NewTxns(broker, tax_year)
+                self.assertEqual([], self.NewTxns(broker, tax_year))
+            self.assertEqual([str(txn) for txn in broker.parseFileToTxnList(source, tax_year)],
+                             seen)
+
+    def testUnsavedCheckpoint(self):
+        with open('testdata/tdameritrade.csv') as f:
+            self.Write(f.readlines())
+        expected = [str(txn) for txn in
+                    self.cache.iterTxns(TDAmeritrade, self.filename, 2020)]
+        # E.g., the output could not be written.
+        self.assertEqual(expected, self.NewTxns(TDAmeritrade, 2020))
+        self.assertEqual([], self.NewTxns(TDAmeritrade, 2020))
+
+    def testChangedPrefix(self):
+        with open('testdata/tdameritrade.csv') as f:
+            lines = f.readlines()
+        self.Write(lines)
+        expected = self.NewTxns(TDAmeritrade, 2020)
+        self.assertEqual(3, len(expected))
+        self.Write(lines[:1] + lines[2:])
+        self.assertEqual(expected[1:], self.NewTxns(TDAmeritrade, 2020))
+
+    def testNotResumable(self):
+        shutil.copy('testdata/vanguard.csv', self.filename)
+        expected = [str(txn) for txn in Vanguard.parseFileToTxnList(self.filename, 2011)]
+        self.assertEqual(expected, self.NewTxns(Vanguard, 2011))
+        self.assertEqual(expected, self.NewTxns(Vanguard, 2011))
+
+
+if __name__ == '__main__':
+    unittest.main()
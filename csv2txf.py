@@ -25,102 +25,359 @@ Docs:
 
 from __future__ import annotations
 
-from decimal import Decimal
+import contextlib
 from datetime import datetime
+import os
 import sys
-from typing import List
+from typing import Iterable, Iterator, List, Optional, TextIO, Type, TYPE_CHECKING
 
 from brokers import GetBroker
+import csvrows
+import diagnostics
+import lots
+import parallel
+import pipeline
+import sinks
+import stats
 import utils
+import wash_sales
 
+if TYPE_CHECKING:
+    from broker import Broker
+    from cache import TxnCache
+
+
+def IterTxfLines(txns: Iterable[utils.Transaction], tax_year: int, date: str) -> Iterator[str]:
+    """Yields TXF lines for `txns`, consuming them one at a time."""
+    yield from sinks.TxfHeaderLines(date)
+    for txn in txns:
+        yield from sinks.TxfRecordLines(txn)
+
+
+def ConvertTxnListToTxf(txn_list: Iterable[utils.Transaction], tax_year: int, date: str) -> List[str]:
+    return list(IterTxfLines(txn_list, tax_year, date))
+
+
+def WriteTxf(txns: Iterable[utils.Transaction], tax_year: int, date: str, out: TextIO) -> None:
+    """Writes TXF for `txns` to `out` as it is produced.
+
+    The output is identical to `'\\n'.join(ConvertTxnListToTxf(...))`, i.e.,
+    there is no trailing newline, but neither the transactions nor the lines
+    are ever held in memory all at once.
+    """
+    sink = sinks.TxfSink(out, '', tax_year, date)
+    for txn in txns:
+        sink.add(txn)
+    sink.finish()
+
+
+def IterTxns(broker: Type[Broker], filename: csvrows.Source, tax_year: int,
+             cache: Optional[TxnCache] = None) -> Iterator[utils.Transaction]:
+    """Yields the transactions in `filename`, from `cache` if possible."""
+    if wash_sales.ENABLED:
+        # Replacement shares may have been bought in lots sold in other years,
+        # so look for wash sales across the whole export before selecting the
+        # transactions from `tax_year`.
+        txns = wash_sales.Adjust(_ParseTxns(broker, filename, None, cache))
+        return wash_sales.SelectYear(txns, tax_year)
+    return _ParseTxns(broker, filename, tax_year, cache)
+
+
+def _ParseTxns(broker: Type[Broker], filename: csvrows.Source, tax_year: Optional[int],
+               cache: Optional[TxnCache]) -> Iterator[utils.Transaction]:
+    # Streams cannot be hashed for the cache before they are read, so they are
+    # parsed as they are read.
+    if cache is not None and isinstance(filename, str) and os.path.isfile(filename):
+        return cache.iterTxns(broker, filename, tax_year)
+    if parallel.ENABLED and broker.SPLITTABLE:
+        return parallel.IterTxns(broker, filename, tax_year)
+    if pipeline.ENABLED:
+        return pipeline.IterTxns(broker, filename, tax_year)
+    return broker.iterTxns(filename, tax_year)
+
+
+def RunConverter(broker_name: str, filename: csvrows.Source, tax_year: int, date: str,
+                 cache: Optional[TxnCache] = None) -> List[str]:
+    with stats.Stage('detect'):
+        broker = GetBroker(broker_name, filename)
+    if pipeline.ENABLED:
+        txns = IterTxns(broker, filename, tax_year, cache)
+        return ''.join(pipeline.RenderTxf(txns, tax_year, date)).split('\n')
+    with stats.Stage('parse'):
+        txn_list = list(IterTxns(broker, filename, tax_year, cache))
+    stats.Count('txns', len(txn_list))
+    with stats.Stage('render'):
+        return ConvertTxnListToTxf(txn_list, tax_year, date)
+
+
+def StreamConverter(broker_name: str, filename: csvrows.Source, tax_year: int, date: str, out: TextIO,
+                    cache: Optional[TxnCache] = None) -> None:
+    """Like `RunConverter`, but streams the TXF output directly to `out`."""
+    with stats.Stage('detect'):
+        broker = GetBroker(broker_name, filename)
+    if pipeline.ENABLED:
+        # The stages time themselves on their own threads.
+        pipeline.WriteTxf(IterTxns(broker, filename, tax_year, cache), tax_year, date,
+                          stats.TimedWriter(out))
+        return
+    txns = stats.Timed('parse', IterTxns(broker, filename, tax_year, cache), 'txns')
+    with stats.Stage('render'):
+        WriteTxf(txns, tax_year, date, stats.TimedWriter(out))
+
+
+def FormatSummary(name: str, txns: Iterable[utils.Transaction], tax_year: int) -> str:
+    totals = sinks.SummaryTotals()
+    for txn in txns:
+        totals.add(txn)
+    return totals.format(name, tax_year)
+
+
+def GetSummary(broker_name: str, filename: csvrows.Source, tax_year: int,
+               cache: Optional[TxnCache] = None) -> str:
+    with stats.Stage('detect'):
+        broker = GetBroker(broker_name, filename)
+    txns = stats.Timed('parse', IterTxns(broker, filename, tax_year, cache), 'txns')
+    with stats.Stage('summarize'):
+        return FormatSummary(broker.name(), txns, tax_year)
+
+
+def RunOutputs(broker_name: str, filename: csvrows.Source, tax_year: int, date: str,
+               outputs: list[tuple[str, TextIO]], cache: Optional[TxnCache] = None) -> None:
+    """Parses `filename` once, writing each of `outputs` in a single pass.
+
+    Args:
+      outputs: list of (format, stream) pairs, where format is a key of
+        `sinks.SINKS`
+    """
+    with stats.Stage('detect'):
+        broker = GetBroker(broker_name, filename)
+    txn_sinks = [sinks.SINKS[fmt](stats.TimedWriter(out), broker.name(), tax_year, date)
+                 for (fmt, out) in outputs]
+    txns = stats.Timed('parse', IterTxns(broker, filename, tax_year, cache), 'txns')
+    with stats.Stage('render'):
+        for txn in txns:
+            for sink in txn_sinks:
+                sink.add(txn)
+        for sink in txn_sinks:
+            sink.finish()
+
+
+def WriteOutputs(broker_name: str, filename: csvrows.Source, tax_year: int, date: str,
+                 output_specs: list[str], cache: Optional[TxnCache] = None) -> None:
+    """Like `RunOutputs`, but takes `FORMAT:FILE` specs and opens the files."""
+    outputs: list[tuple[str, TextIO]] = []
+    with contextlib.ExitStack() as stack:
+        for spec in output_specs:
+            (fmt, sep, path) = spec.partition(':')
+            if not sep or fmt not in sinks.SINKS:
+                raise utils.ValueError('Invalid output %r; expected FORMAT:FILE with '
+                                       'FORMAT one of: %s' % (spec, ', '.join(sinks.SINKS)))
+            if path == '-':
+                outputs.append((fmt, sys.stdout))
+            else:
+                outputs.append((fmt, stack.enter_context(open(path, 'w'))))
+        RunOutputs(broker_name, filename, tax_year, date, outputs, cache)
+        if any(out is sys.stdout for (_, out) in outputs):
+            sys.stdout.write('\n')
 
-def ConvertTxnListToTxf(txn_list: list[utils.Transaction], tax_year: int, date: str) -> List[str]:
-    lines = []
-    lines.append('V042')  # Version
-    lines.append('Acsv2txf')  # Program name/version
-    if date is None:
-        date = utils.txfDate(datetime.today())
-    lines.append('D%s' % date)  # Export date
-    lines.append('^')
-    for txn in txn_list:
-        lines.append('TD')
-        assert txn.entryCode is not None
-        lines.append('N%d' % txn.entryCode)
-        lines.append('C1')
-        lines.append('L1')
-        lines.append('P%s' % txn.desc)
-        lines.append('D%s' % txn.buyDateStr)
-        lines.append('D%s' % txn.sellDateStr)
-        assert txn.costBasis is not None
-        lines.append('$%.2f' % txn.costBasis)
-        assert txn.saleProceeds is not None
-        lines.append('$%.2f' % txn.saleProceeds)
-        if txn.adjustment:
-            lines.append('$%.2f' % txn.adjustment)
-        lines.append('^')
-    return lines
-
-
-def RunConverter(broker_name: str, filename: str, tax_year: int, date: str) -> List[str]:
-    broker = GetBroker(broker_name, filename)
-    txn_list = broker.parseFileToTxnList(filename, tax_year)
-    return ConvertTxnListToTxf(txn_list, tax_year, date)
-
-
-def GetSummary(broker_name: str, filename: str, tax_year: int) -> str:
-    broker = GetBroker(broker_name, filename)
-    total_cost = Decimal(0)
-    total_sales = Decimal(0)
-    txn_list = broker.parseFileToTxnList(filename, tax_year)
-    for txn in txn_list:
-        assert txn.costBasis is not None
-        total_cost += txn.costBasis
-        assert txn.saleProceeds is not None
-        total_sales += txn.saleProceeds
-
-    return '\n'.join([
-        '%s summary report for %d' % (broker.name(), tax_year),
-        'Num sale txns:  %d' % len(txn_list),
-        'Total cost:     $%.2f' % total_cost,
-        'Total proceeds: $%.2f' % total_sales,
-        'Net gain/loss:  $%.2f' % (total_sales - total_cost),
-    ])
 
 def main(argv):
+    if len(argv) > 1 and argv[1] in ('serve', 'client'):
+        import daemon
+        daemon.main(argv[1:])
+        return
+    if len(argv) > 1 and argv[1] in ('merge', 'diff'):
+        import txf
+        txf.main(argv[1:])
+        return
+
     from optparse import OptionParser
     parser = OptionParser()
     parser.add_option("--broker", dest="broker", help="broker name or alias")
-    parser.add_option("-f", "--file", dest="filename", help="input file")
+    parser.add_option("-f", "--file", dest="filename",
+                      help="input file, or `-` for stdin; may be compressed "
+                           "with gzip, bzip2 or xz, or a zip archive, which is "
+                           "converted as a batch if it holds several exports")
     parser.add_option("-o", "--outfile", dest="out_filename",
                       help="output file, leave empty for stdout")
     parser.add_option("--outfmt", dest="out_format",
-                      help="output format: `txf` or `summary`")
+                      help="output format: `txf`, `summary`, or a summary "
+                           "grouped by entry code, symbol or term: "
+                           "`summary-by-code`, `summary-by-symbol` or "
+                           "`summary-by-term` (Interactive Brokers "
+                           "exports have no symbols)")
+    parser.add_option("--output", dest="outputs", action="append", default=[],
+                      metavar="FORMAT:FILE",
+                      help="write output in FORMAT to FILE (`-` for stdout); may "
+                           "be repeated to write several formats from a single "
+                           "parse, and overrides `--outfmt` and `--outfile`")
     parser.add_option("--year", dest="year", help="tax year", type="int")
     parser.add_option("--date", dest="date", help="date to output", type="str")
+    parser.add_option("--batch", dest="batch", action="store_true", default=False,
+                      help="convert all input files and directories given as "
+                           "arguments (and `--file`, if any) in parallel")
+    parser.add_option("--outdir", dest="out_dir",
+                      help="with `--batch`, write one output per input file "
+                           "into this directory instead of a merged output")
+    parser.add_option("--split", dest="split", action="store_true", default=False,
+                      help="parse large inputs in chunks on several worker "
+                           "processes (Interactive Brokers, TD Ameritrade)")
+    parser.add_option("-j", "--jobs", dest="jobs", type="int",
+                      help="with `--batch` or `--split`, number of worker "
+                           "processes (default: number of CPUs)")
+    parser.add_option("--stats", dest="stats", type="choice", choices=["table", "json"],
+                      help="print time per stage and counters to stderr after "
+                           "converting, as a `table` or `json`")
+    parser.add_option("--progress", dest="progress", action="store_true", default=False,
+                      help="report progress reading the input on stderr")
+    parser.add_option("--cache-dir", dest="cache_dir",
+                      help="cache parsed transactions in this directory, keyed "
+                           "by the input's contents, the tax year and the "
+                           "parser's code")
+    parser.add_option("--incremental", dest="incremental", action="store_true", default=False,
+                      help="with `--cache-dir`, only convert the rows appended "
+                           "to the input since the last run, which is "
+                           "checkpointed; the whole input is converted if it "
+                           "changed otherwise")
+    parser.add_option("--cache-max-mb", dest="cache_max_mb", type="int", default=1024,
+                      help="with `--cache-dir`, evict the least recently used "
+                           "entries beyond this size (default: %default)")
+    parser.add_option("--max-warnings", dest="max_warnings", type="int",
+                      default=diagnostics.DEFAULT_MAX_SAMPLES,
+                      help="number of warnings of each kind (e.g., rows ignored "
+                           "for being from the wrong year) to show; the rest are "
+                           "only counted (default: %default)")
+    parser.add_option("--diagnostics-file", dest="diagnostics_file",
+                      help="write every warning to this file")
+    parser.add_option("--lot-method", dest="lot_method", type="choice",
+                      choices=list(lots.METHODS), default=lots.FIFO,
+                      help="for brokers which report buys and sells separately "
+                           "(Vanguard), which lots each sale is matched against: "
+                           "`fifo`, `lifo` or `hifo` (highest cost first) "
+                           "(default: %default)")
+    parser.add_option("--pipeline", dest="pipeline", action="store_true", default=False,
+                      help="read, parse and render the input concurrently, on "
+                           "separate threads connected by bounded queues, so "
+                           "that I/O overlaps with parsing and rendering")
+    parser.add_option("--wash-sales", dest="wash_sales", action="store_true", default=False,
+                      help="for brokers which do not report wash sales (TD "
+                           "Ameritrade, Vanguard), find them and report the "
+                           "disallowed losses as adjustments")
     (options, args) = parser.parse_args(argv)
 
-    if not options.filename:
+    inputs = args[1:]
+    if options.filename:
+        inputs.insert(0, options.filename)
+        # A zip archive of several exports is converted as a batch.
+        if len(csvrows.ZipMembers(options.filename)) > 1:
+            options.batch = True
+    if options.batch:
+        if not inputs:
+            sys.stderr.write('Inputs are required; specify files or directories '
+                             'to convert as arguments.\n')
+            sys.exit(1)
+    elif not options.filename:
         sys.stderr.write('Filename is required; specify with `--file` flag.\n')
         sys.exit(1)
 
+    if options.incremental and not options.cache_dir:
+        sys.stderr.write('`--incremental` requires `--cache-dir` to keep checkpoints in.\n')
+        sys.exit(1)
+    if options.batch and (options.incremental or options.progress):
+        sys.stderr.write('`--batch` cannot be used with `--incremental` or `--progress`; '
+                         'it reports the progress of each input instead.\n')
+        sys.exit(1)
+    if options.incremental and options.wash_sales:
+        sys.stderr.write('`--incremental` cannot be used with `--wash-sales`, which needs '
+                         'all of the transactions.\n')
+        sys.exit(1)
+
     if options.year:
         year = int(options.year)
     else:
         year = datetime.today().year - 1
         utils.Warning(f'Year not specified, defaulting to {year} (last year)')
 
-    output = None
-    if options.out_format == 'summary':
-        output = GetSummary(options.broker, options.filename, year)
-    else:
-        txf_lines = RunConverter(options.broker, options.filename, year, options.date)
-        output = '\n'.join(txf_lines)
+    lots.METHOD = options.lot_method
+    wash_sales.ENABLED = options.wash_sales
+    pipeline.ENABLED = options.pipeline
+    parallel.ENABLED = options.split
+    parallel.JOBS = options.jobs
+
+    if options.stats or options.progress:
+        stats.Enable(progress=sys.stderr if options.progress else None)
+
+    if options.batch:
+        import batch
+        ok = batch.Run(inputs, options.broker, year, options.date,
+                       options.out_format or 'txf', options.out_dir,
+                       options.out_filename, options.jobs,
+                       max_warnings=options.max_warnings,
+                       lot_method=options.lot_method,
+                       wash=options.wash_sales,
+                       split=options.split,
+                       pipelined=options.pipeline,
+                       cache_dir=options.cache_dir,
+                       cache_max_bytes=options.cache_max_mb << 20)
+        if options.stats:
+            stats.Report(options.stats)
+        sys.exit(0 if ok else 1)
+
+    with contextlib.ExitStack() as stack:
+        log = None
+        if options.diagnostics_file:
+            log = stack.enter_context(open(options.diagnostics_file, 'w'))
+        diagnostics.Collect(options.max_warnings, log)
+        stack.callback(diagnostics.Flush)
+        Convert(options, year)
+
+    if options.stats:
+        date_cache = utils.tryParseDate.cache_info()
+        stats.Count('date_cache_hits', date_cache.hits)
+        stats.Count('date_cache_misses', date_cache.misses)
+        stats.Report(options.stats)
 
-    if options.out_filename:
+
+def Convert(options, year: int) -> None:
+    """Runs a single conversion as specified by the command-line `options`."""
+    txn_cache = None
+    if options.cache_dir:
+        from cache import TxnCache
+        txn_cache = TxnCache(options.cache_dir, options.cache_max_mb << 20,
+                             incremental=options.incremental)
+
+    source: csvrows.Source = options.filename
+    if source == '-':
+        source = csvrows.Input(sys.stdin.buffer, '<stdin>')
+
+    if options.outputs:
+        WriteOutputs(options.broker, source, year, options.date,
+                     options.outputs, txn_cache)
+    elif options.out_format in sinks.SINKS and options.out_format not in ('summary', 'txf'):
+        WriteOutputs(options.broker, source, year, options.date,
+                     ['%s:%s' % (options.out_format, options.out_filename or '-')], txn_cache)
+    elif options.out_format == 'summary':
+        output = GetSummary(options.broker, source, year, txn_cache)
+        if options.out_filename:
+            with open(options.out_filename, 'w') as out:
+                out.write(output)
+        else:
+            print(output)
+    elif options.out_filename:
         with open(options.out_filename, 'w') as out:
-            out.write(output)
+            StreamConverter(options.broker, source, year, options.date, out,
+                            txn_cache)
     else:
-        print(output)
+        StreamConverter(options.broker, source, year, options.date, sys.stdout,
+                        txn_cache)
+        sys.stdout.write('\n')
+
+    if txn_cache is not None:
+        # Only once the output has been written, so that the rows are
+        # converted again next time if it could not be.
+        sys.stdout.flush()
+        txn_cache.saveCheckpoints()
+        txn_cache.close()
 
 
 if __name__ == '__main__':
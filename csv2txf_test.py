@@ -0,0 +1,134 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the csv2txf module."""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import csv2txf
+import csvrows
+import pipeline
+import stats
+from tdameritrade import TDAmeritrade
+import utils
+
+
+class Csv2TxfTest(unittest.TestCase):
+    def testStreamMatchesList(self):
+        txn_list = TDAmeritrade.parseFileToTxnList('testdata/tdameritrade.csv', 2020)
+        expected = '\n'.join(csv2txf.ConvertTxnListToTxf(txn_list, 2020, '04/15/2021'))
+
+        out = io.StringIO()
+        csv2txf.StreamConverter('tdameritrade', 'testdata/tdameritrade.csv', 2020,
+                                '04/15/2021', out)
+        self.assertEqual(expected, out.getvalue())
+
+    def testInMemoryInput(self):
+        with open('testdata/tdameritrade.csv', 'rb') as f:
+            source = csvrows.Input(f.read())
+        out = io.StringIO()
+        csv2txf.StreamConverter(None, source, 2020, '04/15/2021', out)
+        with open('testdata/tdameritrade.out') as expected:
+            self.assertEqual(expected.read(), out.getvalue())
+
+    def testStreamIsLazy(self):
+        txns = TDAmeritrade.iterTxns('testdata/tdameritrade.csv', 2020)
+        lines = csv2txf.IterTxfLines(txns, 2020, '04/15/2021')
+        # Reading the first record only consumes the first transaction.
+        for _ in range(4 + 10):
+            next(lines)
+        self.assertEqual(2, len(list(txns)))
+
+    def testRunOutputsParsesOnce(self):
+        parses = []
+        original = TDAmeritrade.iterTxns.__func__
+
+        def CountingIterTxns(cls, filename, tax_year):
+            parses.append(filename)
+            return original(cls, filename, tax_year)
+
+        txf = io.StringIO()
+        summary = io.StringIO()
+        TDAmeritrade.iterTxns = classmethod(CountingIterTxns)
+        try:
+            csv2txf.RunOutputs('tdameritrade', 'testdata/tdameritrade.csv', 2020, '04/15/2021',
+                               [('txf', txf), ('summary', summary)])
+        finally:
+            TDAmeritrade.iterTxns = classmethod(original)
+
+        self.assertEqual(1, len(parses))
+        with open('testdata/tdameritrade.out') as expected:
+            self.assertEqual(expected.read(), txf.getvalue())
+        with open('testdata/tdameritrade.summary.out') as expected:
+            self.assertEqual(expected.read(), summary.getvalue())
+
+    def testDecodeErrorNamesLine(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        with open('testdata/tdameritrade.csv') as f:
+            lines = f.readlines()
+        for (old, new) in (('4/12/2020', '4/26/2020'), ('(BAR)', 'BAR'), ('"1,234.56 "', 'x')):
+            filename = os.path.join(tmpdir, 'input.csv')
+            with open(filename, 'w') as f:
+                f.writelines(lines[:2] + [lines[2].replace(old, new)] + lines[3:])
+            # The row is only decoded once its record is rendered.
+            with self.assertRaisesRegex(utils.ValueError, '^line 3: '):
+                csv2txf.StreamConverter(None, filename, 2020, '04/15/2021', io.StringIO())
+
+    def testPipelineWithCache(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.addCleanup(setattr, pipeline, 'ENABLED', pipeline.ENABLED)
+        self.addCleanup(setattr, stats, 'ACTIVE', stats.ACTIVE)
+        out = os.path.join(tmpdir, 'out.txf')
+        argv = ['csv2txf.py', '-f', 'testdata/tdameritrade.csv', '--year', '2020',
+                '--date', '04/15/2021', '-o', out]
+        csv2txf.main(argv)
+        with open(out) as f:
+            expected = f.read()
+        # The transactions are cached, then read from the cache, on the
+        # thread which renders them rather than the one which opened it.
+        for counter in ('cache_misses', 'cache_hits'):
+            stats.Enable()
+            csv2txf.main(argv + ['--pipeline', '--cache-dir', os.path.join(tmpdir, 'cache')])
+            self.assertEqual(1, stats.ACTIVE.toDict()['counters'][counter])
+            with open(out) as f:
+                self.assertEqual(expected, f.read(), counter)
+
+    @unittest.skipUnless(os.path.exists('/dev/full'), 'needs /dev/full')
+    def testIncrementalOutputNotWritten(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        argv = ['csv2txf.py', '-f', 'testdata/tdameritrade.csv', '--year', '2020',
+                '--date', '04/15/2021', '--cache-dir', os.path.join(tmpdir, 'cache'),
+                '--incremental', '-o']
+        # Writing to /dev/full fails, as if the disk were full.
+        with self.assertRaises(OSError):
+            csv2txf.main(argv + ['/dev/full'])
+        # The rows are converted again, as their output was not written.
+        out = os.path.join(tmpdir, 'out.txf')
+        csv2txf.main(argv + [out])
+        with open(out) as actual:
+            with open('testdata/tdameritrade.out') as expected:
+                self.assertEqual(expected.read(), actual.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,413 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reads the rows of CSV files exported by brokers.
+
+The file is memory-mapped and read a block of lines at a time, so files of any
+size can be read, including those larger than memory. Blocks of plain rows,
+without quotes, are split with `str.split`. From the first block with quotes
+on, the rest of the file goes through the `csv` module: a quoted field may span
+lines, so rows cannot be split independently of each other, and switching
+between the two for each row costs more than `csv` itself does.
+
+Either way, rows are produced by C code as they are consumed, and are the same
+as those of `csv.reader` with the default dialect.
+
+Exports which are not files, such as standard input or uploads held in memory,
+are read through an `Input` instead, wherever a file name is taken.
+
+Exports compressed with gzip, bzip2 or xz, whether files or `Input`s, are
+recognized by their magic bytes and decompressed as they are read. A zip
+archive is read as the export it holds; its members can also be named as if
+the archive were a directory, e.g., `exports.zip/2011/ib.csv` (see
+`ZipMembers`). Neither can be mapped, or read in parts.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import itertools
+import mmap
+import os
+import stat
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional, TextIO, Union
+
+import stats
+import utils
+
+
+# Bytes of the file read at a time, rounded up to the end of a line.
+BLOCK_SIZE = 1 << 20
+
+
+def _Blocks(data: mmap.mmap, start: int, end: int,
+            reading: stats.Reading) -> Iterator[bytes]:
+    """Yields consecutive blocks of `data[start:end]` which end at the end of a line."""
+    while start < end:
+        stop = data.find(b'\n', min(start + BLOCK_SIZE, end) - 1, end)
+        stop = end if stop < 0 else stop + 1
+        block = data[start:stop]
+        reading.advance(block)
+        yield block
+        start = stop
+
+
+def _BlockRows(blocks: Iterator[bytes]) -> Iterator[Iterator[list[str]]]:
+    """Yields iterators over the rows of `blocks`, a block at a time."""
+    for block in blocks:
+        if b'"' not in block and b'\r' not in block:
+            lines = block.decode('utf-8').split('\n')
+            if not lines[-1]:
+                lines.pop()
+            # Empty lines are rows without any fields, rather than with a
+            # single empty one, so they are left to `csv`.
+            if '' not in lines:
+                yield map(str.split, lines, itertools.repeat(','))
+                continue
+        # Lines are read as from a file opened in text mode, which `csv`
+        # expects, but the reader carries on from one block to the next.
+        stream = itertools.chain.from_iterable(
+            io.TextIOWrapper(io.BytesIO(block), encoding='utf-8')
+            for block in itertools.chain([block], blocks))
+        yield csv.reader(stream)
+        return
+
+
+def _MappedRows(data: mmap.mmap, name: str, start: int,
+                end: int) -> Iterator[Iterator[list[str]]]:
+    with stats.Reading(name, end - start) as reading:
+        yield from _BlockRows(_Blocks(data, start, end, reading))
+
+
+def _Rows(filename: str, start: int, end: Optional[int]) -> Iterator[Iterator[list[str]]]:
+    if _ZipMember(filename) is None:
+        with open(filename, 'rb') as f:
+            info = os.fstat(f.fileno())
+            if stat.S_ISREG(info.st_mode) and info.st_size and not _Codec(f.peek(_MAGIC_LENGTH)):
+                end = info.st_size if end is None else min(end, info.st_size)
+                if start >= end:
+                    return
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    yield from _MappedRows(data, filename, start, end)
+                return
+    # Pipes, compressed files and the like cannot be mapped.
+    if start or end is not None:
+        raise utils.ValueError('cannot read part of %s, which is not a plain file' % filename)
+    yield from _BlockRows(ReadBlocks(filename))
+
+
+# Magic bytes at the start of compressed files, by format.
+_MAGIC = {
+    'gzip': b'\x1f\x8b',
+    'bzip2': b'BZh',
+    'xz': b'\xfd7zXZ\x00',
+    'zip': b'PK\x03\x04',
+}
+_MAGIC_LENGTH = max(len(magic) for magic in _MAGIC.values())
+
+
+def _Codec(head: bytes) -> Optional[str]:
+    """Returns the compression format of data starting with `head`, if any."""
+    for (codec, magic) in _MAGIC.items():
+        if head.startswith(magic):
+            return codec
+    return None
+
+
+def _Decompressor(codec: str):
+    # Imported here, as most inputs are not compressed.
+    if codec == 'gzip':
+        import zlib
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if codec == 'bzip2':
+        import bz2
+        return bz2.BZ2Decompressor()
+    import lzma
+    return lzma.LZMADecompressor()
+
+
+def _Decompress(chunks: Iterable[bytes], codec: str, name: str) -> Iterator[bytes]:
+    decompressor = _Decompressor(codec)
+    for data in chunks:
+        while data:
+            if decompressor.eof:
+                # Streams may be concatenated, as by `cat 1.gz 2.gz`.
+                decompressor = _Decompressor(codec)
+            yield decompressor.decompress(data)
+            data = decompressor.unused_data if decompressor.eof else b''
+    if not decompressor.eof:
+        raise utils.ValueError('%s is truncated' % name)
+
+
+def _ZipMember(filename: str) -> Optional[tuple[str, str]]:
+    """Splits `filename` into a zip archive and the name of a member, if it is one."""
+    if os.path.exists(filename):
+        return None
+    archive = filename
+    while True:
+        (archive, _, _) = archive.rpartition('/')
+        if not archive:
+            return None
+        if os.path.isfile(archive):
+            with open(archive, 'rb') as f:
+                if _Codec(f.read(_MAGIC_LENGTH)) != 'zip':
+                    return None
+            return (archive, filename[len(archive) + 1:])
+
+
+def ZipMembers(filename: str) -> list[str]:
+    """Returns the names of the CSV files in the zip archive `filename`, if it is one.
+
+    The names are those of the archive, followed by those of the members, as
+    if the archive were a directory; they can be read like any other file.
+    """
+    if not os.path.isfile(filename):
+        return []
+    with open(filename, 'rb') as f:
+        if _Codec(f.read(_MAGIC_LENGTH)) != 'zip':
+            return []
+    import zipfile
+    with zipfile.ZipFile(filename) as archive:
+        return ['%s/%s' % (filename, info.filename) for info in archive.infolist()
+                if not info.is_dir() and info.filename.lower().endswith('.csv')]
+
+
+def _OpenZip(filename: str) -> BinaryIO:
+    """Opens the member of a zip archive named by `filename`, or the only export in it."""
+    import zipfile
+    member = _ZipMember(filename)
+    if member is None:
+        members = ZipMembers(filename)
+        if len(members) != 1:
+            raise utils.ValueError('%s holds %d exports rather than one; convert it with '
+                                   '`--batch`' % (filename, len(members)))
+        member = (filename, members[0][len(filename) + 1:])
+    # The member stays readable once the archive is closed.
+    with zipfile.ZipFile(member[0]) as archive:
+        return archive.open(member[1])  # type: ignore[return-value]
+
+
+def _LineBlocks(chunks: Iterable[bytes], reading: stats.Reading) -> Iterator[bytes]:
+    """Joins or splits `chunks` into blocks which end at the end of a line."""
+    rest = b''
+    for data in chunks:
+        end = data.rfind(b'\n') + 1
+        if not end:
+            rest += data
+            continue
+        block = rest + data[:end]
+        rest = data[end:]
+        reading.advance(block)
+        yield block
+    if rest:
+        reading.advance(rest)
+        yield rest
+
+
+def _Chunks(read: Callable[[int], Union[bytes, str]]) -> Iterator[bytes]:
+    while True:
+        data = read(BLOCK_SIZE)
+        if not data:
+            return
+        # Text streams are encoded back, so that all input is parsed alike.
+        yield data.encode('utf-8') if isinstance(data, str) else data
+
+
+def _StreamBlocks(read: Callable[[int], Union[bytes, str]], name: str,
+                  size: int) -> Iterator[bytes]:
+    chunks = _Chunks(read)
+    head = b''
+    for data in chunks:
+        head += data
+        if len(head) >= _MAGIC_LENGTH:
+            break
+    chunks = itertools.chain([head], chunks)
+    codec = _Codec(head)
+    if codec == 'zip':
+        raise utils.ValueError('%s is a zip archive, which can only be read from a file' % name)
+    if codec is not None:
+        chunks = _Decompress(chunks, codec, name)
+        # The size of the decompressed data is not known up front.
+        size = 0
+    with stats.Reading(name, size) as reading:
+        yield from _LineBlocks(chunks, reading)
+
+
+class Input:
+    """A broker export given as a stream or in memory, rather than as a file.
+
+    `source` is the contents of the export, as `bytes` or `str`, or a binary or
+    text stream, such as `sys.stdin`, which is read as it is parsed and is left
+    open. The first block read is kept, so that the broker can be detected
+    from the first line (see `FirstLine`) before it is parsed along with the
+    rest: the input is only read once, and so can only be parsed once.
+    """
+
+    def __init__(self, source: Union[bytes, str, BinaryIO, TextIO], name: str = '<input>'):
+        self.name = name
+        if isinstance(source, str):
+            source = source.encode('utf-8')
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            size = len(source)
+            stream: Union[BinaryIO, TextIO] = io.BytesIO(source)
+        else:
+            stream = source
+            size = 0
+        self._blocks = _StreamBlocks(stream.read, name, size)
+        self._first: Optional[bytes] = None
+        self._consumed = False
+
+    def __str__(self) -> str:
+        return self.name
+
+    def firstLine(self, limit: int = -1) -> str:
+        """Returns the first line as `readline` would, without consuming it."""
+        if self._consumed:
+            raise utils.ValueError('%s has already been read' % self.name)
+        if self._first is None:
+            self._first = next(self._blocks, b'')
+        return _ReadLine(self._first, limit)
+
+    def blocks(self) -> Iterator[bytes]:
+        """Returns an iterator over blocks of the input, as `ReadBlocks` does."""
+        if self._consumed:
+            raise utils.ValueError('%s has already been read' % self.name)
+        self._consumed = True
+        if self._first is None:
+            return self._blocks
+        return itertools.chain([self._first], self._blocks)
+
+    def rows(self) -> Iterator[list[str]]:
+        """Returns an iterator over the rows of the input."""
+        return FromBlocks(self.blocks())
+
+
+# A broker export: the name of a file, or an `Input`.
+Source = Union[str, Input]
+
+
+def _ReadLine(block: bytes, limit: int) -> str:
+    with io.TextIOWrapper(io.BytesIO(block), encoding='utf-8') as text:
+        return text.readline(limit)
+
+
+def FirstLine(source: Source, limit: int = -1) -> str:
+    """Returns the first line of `source`, as read from a file opened as text."""
+    if isinstance(source, Input):
+        return source.firstLine(limit)
+    if _ZipMember(source) is None:
+        with open(source, 'rb') as f:
+            if not _Codec(f.peek(_MAGIC_LENGTH)):
+                text = io.TextIOWrapper(f)
+                try:
+                    return text.readline(limit)
+                finally:
+                    # Leaves `f` to be closed by the `with`.
+                    text.detach()
+    blocks = ReadBlocks(source)
+    try:
+        return _ReadLine(next(blocks, b''), limit)
+    finally:
+        blocks.close()
+
+
+def IsPlainFile(source: Source) -> bool:
+    """Whether `source` is a regular, uncompressed file, which can be read in parts."""
+    if not isinstance(source, str) or not os.path.isfile(source):
+        return False
+    with open(source, 'rb') as f:
+        return not _Codec(f.read(_MAGIC_LENGTH))
+
+
+def Read(filename: Source) -> Iterator[list[str]]:
+    """Returns an iterator over the rows of the CSV file `filename`."""
+    if isinstance(filename, Input):
+        return filename.rows()
+    return itertools.chain.from_iterable(_Rows(filename, 0, None))
+
+
+def ReadRange(filename: str, start: int, end: Optional[int] = None) -> Iterator[list[str]]:
+    """Returns an iterator over the rows in bytes `start` to `end` of `filename`.
+
+    Both offsets must be at the start of a line, or the end of the file.
+    """
+    return itertools.chain.from_iterable(_Rows(filename, start, end))
+
+
+def ReadMapped(data: mmap.mmap, name: str) -> Iterator[list[str]]:
+    """Returns an iterator over the rows of `data`, a file which the caller has
+    mapped, e.g., to hash it as well; `name` is that of the file."""
+    return itertools.chain.from_iterable(_MappedRows(data, name, 0, len(data)))
+
+
+def ReadBlocks(filename: Source) -> Iterator[bytes]:
+    """Yields the contents of `filename` in blocks which end at the end of a line.
+
+    Unlike `Read`, which maps the file, this uses ordinary reads, which
+    release the GIL; so another thread can parse the blocks already read while
+    waiting for the next, e.g., from network storage.
+    """
+    if isinstance(filename, Input):
+        yield from filename.blocks()
+        return
+    if _ZipMember(filename) is None:
+        with open(filename, 'rb') as f:
+            if _Codec(f.peek(_MAGIC_LENGTH)) != 'zip':
+                yield from _StreamBlocks(f.read, filename, os.fstat(f.fileno()).st_size)
+                return
+    with _OpenZip(filename) as member:
+        yield from _StreamBlocks(member.read, filename, 0)
+
+
+def FromBlocks(blocks: Iterable[bytes]) -> Iterator[list[str]]:
+    """Returns an iterator over the rows of CSV data given in `blocks`.
+
+    Each block must end at the end of a line, as those of `ReadBlocks` do.
+    """
+    return itertools.chain.from_iterable(_BlockRows(iter(blocks)))
+
+
+def SplitRows(filename: str, chunk_size: int) -> list[tuple[int, int]]:
+    """Splits `filename` into ranges of bytes of about `chunk_size` each.
+
+    Each range starts at the start of a row: the start of a line which is not
+    inside a quoted field. Quotes are assumed to only enclose fields, as they
+    do in the files written by brokers (and the `csv` module).
+    """
+    with open(filename, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            bounds = [0]
+            counted = quotes = 0
+            start = chunk_size
+            while start < size:
+                end = data.find(b'\n', start - 1) + 1
+                if not end:
+                    break
+                # An odd number of quotes before the end of the line means it
+                # ends inside a quoted field, so try the next one.
+                for offset in range(counted, end, BLOCK_SIZE):
+                    quotes += data[offset:min(offset + BLOCK_SIZE, end)].count(b'"')
+                counted = end
+                if quotes % 2:
+                    start = end + 1
+                    continue
+                if end < size:
+                    bounds.append(end)
+                start = end + chunk_size
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
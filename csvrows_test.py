@@ -0,0 +1,198 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the csvrows module."""
+
+import bz2
+import csv
+import gzip
+import io
+import lzma
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import csvrows
+import utils
+
+
+class ReadTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        block_size = csvrows.BLOCK_SIZE
+        self.addCleanup(setattr, csvrows, 'BLOCK_SIZE', block_size)
+
+    def AssertSameRows(self, data):
+        filename = os.path.join(self.tmpdir, 'input.csv')
+        with open(filename, 'wb') as f:
+            f.write(data)
+        with open(filename, encoding='utf-8') as f:
+            expected = list(csv.reader(f))
+        for block_size in (1, 7, 64, 1 << 20):
+            csvrows.BLOCK_SIZE = block_size
+            self.assertEqual(expected, list(csvrows.Read(filename)), (data, block_size))
+
+    def testPlainRows(self):
+        self.AssertSameRows(b'a,b,c\n1,2,3\n,,\n')
+        self.AssertSameRows(b'a,b,c\n1,2,3')
+        self.AssertSameRows(b'x\n')
+        self.AssertSameRows(b'')
+
+    def testQuotedRows(self):
+        self.AssertSameRows(b'Security,Qty\nABC,100\n"A, B",200\nXYZ,"1,000.00 "\n')
+        self.AssertSameRows(b'"quoted ""twice""",x\nplain,y\n')
+
+    def testQuotedFieldsSpanningLines(self):
+        self.AssertSameRows(b'a,"multi\nline\nfield",b\nc,d\n')
+        self.AssertSameRows(b'a,b\n' * 10 + b'"x\n\ny",z\n' + b'c,d\n' * 10)
+
+    def testLineBreaksAndEmptyLines(self):
+        self.AssertSameRows(b'a,b\r\nc,d\r\n')
+        self.AssertSameRows(b'a,"x\r\ny"\r\nc,d\r\n')
+        self.AssertSameRows(b'a,b\n\nc,d\n')
+        self.AssertSameRows(b'\na,b\n')
+
+    def testRandomRows(self):
+        rng = random.Random(1)
+        fields = ['', 'abc', '1,234.56', 'say "hi"', 'two\nlines', '12.00 ', 'caf\xe9']
+        for _ in range(50):
+            rows = [[rng.choice(fields) for _ in range(rng.randrange(1, 5))]
+                    for _ in range(rng.randrange(1, 30))]
+            filename = os.path.join(self.tmpdir, 'rows.csv')
+            with open(filename, 'w', encoding='utf-8', newline='') as f:
+                csv.writer(f, lineterminator=rng.choice(['\n', '\r\n'])).writerows(rows)
+            with open(filename, 'rb') as f:
+                self.AssertSameRows(f.read())
+
+    def testReadRange(self):
+        filename = os.path.join(self.tmpdir, 'input.csv')
+        data = b'a,b\n"x\ny",z\n\nc,d\ne'
+        with open(filename, 'wb') as f:
+            f.write(data)
+        starts = [0, 4, 12, 13, 17, len(data)]
+        for block_size in (1, 7, 1 << 20):
+            csvrows.BLOCK_SIZE = block_size
+            for (i, start) in enumerate(starts):
+                for end in starts[i:]:
+                    expected = list(csv.reader(io.StringIO(data[start:end].decode())))
+                    self.assertEqual(expected, list(csvrows.ReadRange(filename, start, end)),
+                                     (start, end, block_size))
+
+    def testEarlyExit(self):
+        filename = os.path.join(self.tmpdir, 'input.csv')
+        with open(filename, 'w') as f:
+            f.write('a,b\n' * 1000)
+        rows = csvrows.Read(filename)
+        self.assertEqual(['a', 'b'], next(rows))
+        del rows
+
+
+class CompressedTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        block_size = csvrows.BLOCK_SIZE
+        self.addCleanup(setattr, csvrows, 'BLOCK_SIZE', block_size)
+        self.data = b'header,line\r\n' + b'a,"b\nc"\n1,2\n' * 100
+        self.expected = list(csv.reader(io.StringIO(self.data.decode(), newline='')))
+
+    def Write(self, name, data):
+        filename = os.path.join(self.tmpdir, name)
+        with open(filename, 'wb') as f:
+            f.write(data)
+        return filename
+
+    def AssertReads(self, filename):
+        for block_size in (1, 7, 1 << 20):
+            csvrows.BLOCK_SIZE = block_size
+            self.assertEqual(self.expected, list(csvrows.Read(filename)), block_size)
+            self.assertEqual(self.data, b''.join(csvrows.ReadBlocks(filename)), block_size)
+            self.assertEqual('header,line\n', csvrows.FirstLine(filename), block_size)
+        self.assertFalse(csvrows.IsPlainFile(filename))
+        self.assertRaises(utils.ValueError, list, csvrows.ReadRange(filename, 0, 10))
+
+    def testCodecs(self):
+        for (suffix, compress) in (('gz', gzip.compress), ('bz2', bz2.compress),
+                                   ('xz', lzma.compress)):
+            self.AssertReads(self.Write('input.csv.' + suffix, compress(self.data)))
+
+    def testConcatenatedStreams(self):
+        half = len(self.data) // 2
+        self.AssertReads(self.Write('input.csv.gz', gzip.compress(self.data[:half]) +
+                                    gzip.compress(self.data[half:])))
+
+    def testTruncated(self):
+        filename = self.Write('input.csv.gz', gzip.compress(self.data)[:-20])
+        self.assertRaises(utils.ValueError, list, csvrows.Read(filename))
+
+    def testZip(self):
+        archive = os.path.join(self.tmpdir, 'exports.zip')
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as f:
+            f.writestr('2011/a.csv', self.data)
+        self.assertEqual([archive + '/2011/a.csv'], csvrows.ZipMembers(archive))
+        self.AssertReads(archive)
+        self.AssertReads(archive + '/2011/a.csv')
+
+        with zipfile.ZipFile(archive, 'a') as f:
+            f.writestr('b.CSV', b'x\n')
+            f.writestr('notes.txt', b'')
+        self.assertEqual([archive + '/2011/a.csv', archive + '/b.CSV'],
+                         csvrows.ZipMembers(archive))
+        self.assertEqual([['x']], list(csvrows.Read(archive + '/b.CSV')))
+        self.assertRaises(utils.ValueError, list, csvrows.Read(archive))
+        self.assertEqual([], csvrows.ZipMembers(self.Write('plain.csv', self.data)))
+
+
+class InputTest(unittest.TestCase):
+    def setUp(self):
+        block_size = csvrows.BLOCK_SIZE
+        self.addCleanup(setattr, csvrows, 'BLOCK_SIZE', block_size)
+
+    def testSources(self):
+        data = b'a,b\r\n"x\ny",caf\xc3\xa9\n\nc,d'
+        expected = list(csv.reader(io.StringIO(data.decode(), newline='')))
+        for block_size in (1, 7, 1 << 20):
+            csvrows.BLOCK_SIZE = block_size
+            for source in (data, data.decode(), io.BytesIO(data),
+                           io.StringIO(data.decode(), newline='')):
+                self.assertEqual(expected, list(csvrows.Read(csvrows.Input(source))),
+                                 (source, block_size))
+
+    def testFirstLineIsNotConsumed(self):
+        csvrows.BLOCK_SIZE = 4
+        source = csvrows.Input(io.BytesIO(b'header,line\r\na,b\n'))
+        self.assertEqual('header,line\n', csvrows.FirstLine(source))
+        self.assertEqual('head', csvrows.FirstLine(source, 4))
+        self.assertEqual([['header', 'line'], ['a', 'b']], list(csvrows.Read(source)))
+
+    def testCompressedStream(self):
+        data = b'a,b\n"x\ny",z\n' * 100
+        self.assertEqual(list(csv.reader(io.StringIO(data.decode()))),
+                         list(csvrows.Read(csvrows.Input(io.BytesIO(gzip.compress(data))))))
+
+    def testReadOnce(self):
+        source = csvrows.Input(b'a,b\n')
+        self.assertEqual([['a', 'b']], list(csvrows.Read(source)))
+        self.assertRaises(utils.ValueError, csvrows.Read, source)
+        self.assertRaises(utils.ValueError, csvrows.FirstLine, source)
+
+
+if __name__ == '__main__':
+    unittest.main()
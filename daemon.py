@@ -0,0 +1,332 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A long-running conversion server, and its client.
+
+`csv2txf.py serve` imports the converter and every broker once, then listens
+on a Unix socket. Each job is run in a process forked from the server, so it
+starts warm, and jobs cannot affect each other through the module-level
+settings of the command-line tool; at most `--jobs` run at once, and the rest
+wait for their turn.
+
+`csv2txf.py client [options] -- ARGS` runs `csv2txf.py ARGS` on the server,
+streaming back its output and warnings and exiting with its status, so it can
+stand in for the command-line tool. Only the user running the server can
+connect to its socket. Paths are relative to the directory of the
+client, or with `--upload`, the input is sent to the server instead. Running
+`./daemon.py client` does the same without importing the converter at all,
+which is most of what starting `csv2txf.py` costs.
+
+Requests are a line of JSON, followed by the uploaded input, if any. Responses
+are a series of frames: a byte for the stream (`1` for output, `2` for
+warnings, `x` for the exit status), the length of the data as 4 bytes in
+network order, and the data.
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+from typing import BinaryIO, Optional
+
+
+# Counters shared by all jobs; see `_Counters.status`.
+COUNTERS = ('jobs', 'failed', 'active', 'bytes_uploaded', 'bytes_out',
+            'latency_total', 'latency_max')
+
+_OUT = b'1'
+_ERR = b'2'
+_EXIT = b'x'
+
+_FRAME = struct.Struct('!cI')
+
+
+def DefaultSocket() -> str:
+    return os.path.join(tempfile.gettempdir(), 'csv2txf-%d.sock' % os.getuid())
+
+
+class _Connection:
+    """Sends frames over a client connection, from any thread."""
+
+    def __init__(self, conn: socket.socket):
+        self.conn = conn
+        self._lock = threading.Lock()
+
+    def send(self, stream: bytes, data: bytes) -> None:
+        with self._lock:
+            self.conn.sendall(_FRAME.pack(stream, len(data)) + data)
+
+
+class _Counters:
+    """Counters in memory shared with the processes forked for jobs."""
+
+    def __init__(self):
+        import multiprocessing
+        self._values = multiprocessing.Array('d', len(COUNTERS))
+        self.start = time.time()
+
+    def add(self, name: str, value: float) -> None:
+        with self._values.get_lock():
+            self._values[COUNTERS.index(name)] += value
+
+    def max(self, name: str, value: float) -> None:
+        with self._values.get_lock():
+            i = COUNTERS.index(name)
+            self._values[i] = max(self._values[i], value)
+
+    def status(self) -> dict[str, float]:
+        with self._values.get_lock():
+            status = dict(zip(COUNTERS, self._values))
+        status['uptime'] = time.time() - self.start
+        status['jobs_per_sec'] = status['jobs'] / status['uptime']
+        status['latency_mean'] = status['latency_total'] / status['jobs'] if status['jobs'] else 0.0
+        return status
+
+
+def _Pump(fd: int, stream: bytes, conn: _Connection, counters: _Counters) -> None:
+    while True:
+        data = os.read(fd, 1 << 16)
+        if not data:
+            break
+        if stream == _OUT:
+            counters.add('bytes_out', len(data))
+        conn.send(stream, data)
+    os.close(fd)
+
+
+def _RunJob(request: dict, conn: _Connection, counters: _Counters) -> int:
+    """Runs the command-line tool for `request`, with its output sent to `conn`."""
+    # Redirect the file descriptors, rather than `sys.stdout` and `sys.stderr`,
+    # so that everything written to them is sent, including by subprocesses.
+    pumps = []
+    for (fd, stream) in ((1, _OUT), (2, _ERR)):
+        (read_fd, write_fd) = os.pipe()
+        os.dup2(write_fd, fd)
+        os.close(write_fd)
+        pump = threading.Thread(target=_Pump, args=(read_fd, stream, conn, counters))
+        pump.start()
+        pumps.append(pump)
+
+    import csv2txf
+    status = 0
+    try:
+        os.chdir(request['cwd'])
+        csv2txf.main(['csv2txf.py'] + request['args'])
+    except SystemExit as e:
+        if isinstance(e.code, int) or e.code is None:
+            status = e.code or 0
+        else:
+            sys.stderr.write('%s\n' % e.code)
+            status = 1
+    except Exception as e:
+        sys.stderr.write('error: %s: %s\n' % (type(e).__name__, e))
+        status = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        null = os.open(os.devnull, os.O_WRONLY)
+        for fd in (1, 2):
+            os.dup2(null, fd)
+        os.close(null)
+        for pump in pumps:
+            pump.join()
+    return status
+
+
+def _Handle(client: socket.socket, counters: _Counters, accepted: float) -> None:
+    """Serves a single request; this runs in a process forked for it."""
+    conn = _Connection(client)
+    reader = client.makefile('rb')
+    request = json.loads(reader.readline())
+    if request.get('status'):
+        conn.send(_OUT, (json.dumps(counters.status(), indent=2, sort_keys=True) + '\n').encode())
+        conn.send(_EXIT, b'0')
+        return
+
+    upload = request.get('upload', 0)
+    if upload:
+        counters.add('bytes_uploaded', upload)
+        # The upload is converted from memory, as the standard input of the
+        # job; the last `--file` wins.
+        sys.stdin = io.TextIOWrapper(io.BytesIO(reader.read(upload)), encoding='utf-8')
+        request['args'] = request['args'] + ['--file', '-']
+    status = _RunJob(request, conn, counters)
+
+    latency = time.time() - accepted
+    counters.add('jobs', 1)
+    counters.add('failed', 1 if status else 0)
+    counters.add('latency_total', latency)
+    counters.max('latency_max', latency)
+    conn.send(_EXIT, str(status).encode())
+
+
+def Serve(socket_path: str, jobs: Optional[int] = None) -> None:
+    """Serves conversions on `socket_path` until terminated."""
+    jobs = jobs or os.cpu_count() or 1
+    # Import everything up front, so that jobs start warm.
+    import brokers
+    import csv2txf  # noqa: F401
+    for entry in brokers.BUILTIN_BROKERS.values():
+        entry.load()
+    import batch  # noqa: F401
+    import cache  # noqa: F401
+    import concurrent.futures.process  # noqa: F401
+
+    counters = _Counters()
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Jobs run as this user, with any paths, so only this user may connect;
+    # the socket is created with these permissions, leaving no window before
+    # they are set.
+    umask = os.umask(0o077)
+    try:
+        listener.bind(socket_path)
+    finally:
+        os.umask(umask)
+    listener.listen(128)
+    # Wake up now and then to reap the jobs which are done.
+    listener.settimeout(1.0)
+
+    def Stop(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, Stop)
+    children: set[int] = set()
+    try:
+        while True:
+            # Wait for a free slot before accepting another job.
+            while children:
+                (pid, _) = os.waitpid(-1, 0 if len(children) >= jobs else os.WNOHANG)
+                if not pid:
+                    break
+                children.discard(pid)
+                counters.add('active', -1)
+            try:
+                (client, _) = listener.accept()
+            except socket.timeout:
+                continue
+            accepted = time.time()
+            pid = os.fork()
+            if not pid:
+                listener.close()
+                status = 0
+                try:
+                    _Handle(client, counters, accepted)
+                except BaseException:
+                    status = 1
+                finally:
+                    os._exit(status)
+            client.close()
+            children.add(pid)
+            counters.add('active', 1)
+    finally:
+        listener.close()
+        os.remove(socket_path)
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+
+def _InputFile(args: list[str]) -> Optional[str]:
+    """Returns the value of the `--file` option in `args`, if any."""
+    filename = None
+    for (i, arg) in enumerate(args):
+        if arg in ('-f', '--file') and i + 1 < len(args):
+            filename = args[i + 1]
+        elif arg.startswith('--file='):
+            filename = arg[len('--file='):]
+        elif arg.startswith('-f') and arg != '-f':
+            filename = arg[2:]
+    return filename
+
+
+def RunClient(socket_path: str, args: list[str], upload: bool = False,
+              status: bool = False, out: Optional[BinaryIO] = None,
+              err: Optional[BinaryIO] = None) -> int:
+    """Runs `csv2txf.py args` on the server; returns its exit status.
+
+    The output and warnings are written to `out` and `err`, which default to
+    those of this process.
+    """
+    if out is None:
+        out = sys.stdout.buffer
+    if err is None:
+        err = sys.stderr.buffer
+    request: dict = {'args': args, 'cwd': os.getcwd()}
+    data = b''
+    if status:
+        request = {'status': True}
+    elif upload:
+        filename = _InputFile(args)
+        if filename is None:
+            raise ValueError('`--upload` requires an input given with `--file`')
+        with open(filename, 'rb') as f:
+            data = f.read()
+        request['upload'] = len(data)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path)
+        conn.sendall(json.dumps(request).encode() + b'\n' + data)
+        reader = conn.makefile('rb')
+        while True:
+            header = reader.read(_FRAME.size)
+            if len(header) < _FRAME.size:
+                raise ConnectionError('the server closed the connection')
+            (stream, length) = _FRAME.unpack(header)
+            payload = reader.read(length)
+            if stream == _EXIT:
+                return int(payload)
+            target = out if stream == _OUT else err
+            target.write(payload)
+            target.flush()
+
+
+def main(argv: list[str]) -> None:
+    """Runs `csv2txf.py serve` or `csv2txf.py client`; `argv` starts with which."""
+    from optparse import OptionParser
+    command = argv[0]
+    if command == 'serve':
+        parser = OptionParser(usage='%prog serve [options]')
+    else:
+        parser = OptionParser(usage='%prog client [options] [-- csv2txf arguments]')
+        parser.add_option("--upload", dest="upload", action="store_true", default=False,
+                          help="send the input file to the server, rather than "
+                               "its path")
+        parser.add_option("--status", dest="status", action="store_true", default=False,
+                          help="print the server's counters as JSON")
+    parser.add_option("--socket", dest="socket", default=DefaultSocket(),
+                      help="the server's Unix socket (default: %default)")
+    if command == 'serve':
+        parser.add_option("-j", "--jobs", dest="jobs", type="int",
+                          help="number of jobs run at once (default: number of CPUs)")
+    (options, args) = parser.parse_args(argv[1:])
+
+    if command == 'serve':
+        Serve(options.socket, options.jobs)
+    else:
+        sys.exit(RunClient(options.socket, args, options.upload, options.status))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
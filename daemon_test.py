@@ -0,0 +1,104 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the daemon module."""
+
+import io
+import json
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import daemon
+
+
+ARGS = ['--broker', 'tdameritrade', '--file', 'testdata/tdameritrade.csv', '--year', '2020',
+        '--date', '04/15/2021']
+
+
+class DaemonTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.socket = os.path.join(self.tmpdir, 'csv2txf.sock')
+        # The socket is private even if files are created group-writable.
+        server = subprocess.Popen([sys.executable, 'csv2txf.py', 'serve', '--socket', self.socket,
+                                   '--jobs', '2'], preexec_fn=lambda: os.umask(0o002))
+        self.addCleanup(server.wait)
+        self.addCleanup(server.terminate)
+        deadline = time.time() + 30
+        while not os.path.exists(self.socket):
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.05)
+
+    def Run(self, args, upload=False):
+        (out, err) = (io.BytesIO(), io.BytesIO())
+        status = daemon.RunClient(self.socket, args, upload, out=out, err=err)
+        return (status, out.getvalue().decode(), err.getvalue().decode())
+
+    def testMatchesCommandLine(self):
+        expected = subprocess.run([sys.executable, 'csv2txf.py'] + ARGS, capture_output=True,
+                                  text=True, check=True).stdout
+        self.assertEqual((0, expected, ''), self.Run(ARGS))
+        self.assertEqual((0, expected, ''), self.Run(ARGS + ['--pipeline']))
+
+    def testConcurrentJobs(self):
+        (_, expected, _) = self.Run(ARGS)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.Run(ARGS)))
+                   for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([(0, expected, '')] * 6, results)
+
+    def testSocketIsPrivate(self):
+        self.assertEqual(0, stat.S_IMODE(os.stat(self.socket).st_mode) & 0o077)
+
+    def testFailure(self):
+        (status, out, err) = self.Run(['--file', 'missing.csv', '--year', '2020'])
+        self.assertEqual(1, status)
+        self.assertEqual('', out)
+        self.assertIn('missing.csv', err)
+
+    def testUpload(self):
+        (_, expected, _) = self.Run(ARGS + ['--outfmt', 'summary'])
+        shutil.copy('testdata/tdameritrade.csv', os.path.join(self.tmpdir, 'input.csv'))
+        args = ['--broker', 'tdameritrade', '-f', os.path.join(self.tmpdir, 'input.csv'),
+                '--year', '2020', '--outfmt', 'summary']
+        self.assertEqual((0, expected, ''), self.Run(args, upload=True))
+
+    def testStatus(self):
+        self.Run(ARGS)
+        self.Run(['--file', 'missing.csv', '--year', '2020'])
+        (out, err) = (io.BytesIO(), io.BytesIO())
+        self.assertEqual(0, daemon.RunClient(self.socket, [], status=True, out=out, err=err))
+        status = json.loads(out.getvalue())
+        self.assertEqual(2, status['jobs'])
+        self.assertEqual(1, status['failed'])
+        self.assertGreater(status['bytes_out'], 0)
+        self.assertGreater(status['latency_max'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Collects per-row diagnostics from the parsers.
+
+A multi-year export filtered with `--year` can produce hundreds of thousands
+of ignored rows; rather than writing a warning for each of them, parsers
+`Report` categorized events, which a `Collector` counts and samples, printing
+a bounded summary at the end and optionally logging every event to a file.
+Messages are only formatted for events which are sampled or logged.
+
+Without an active collector, events are written as warnings immediately.
+"""
+
+from __future__ import annotations
+
+import sys
+from typing import Optional, TextIO
+
+import stats
+import utils
+
+
+# Categories of events.
+WRONG_YEAR = 'wrong_year'
+UNKNOWN_LINE = 'unknown_line'
+UNKNOWN_PART = 'unknown_part'
+UNKNOWN_BOX = 'unknown_box'
+MISSING_ENTRY_CODE = 'missing_entry_code'
+MISSING_BUY_DATE = 'missing_buy_date'
+NO_SHARES_BOUGHT = 'no_shares_bought'
+
+DEFAULT_MAX_SAMPLES = 10
+
+
+class Collector:
+
+    def __init__(self, max_samples: int = DEFAULT_MAX_SAMPLES, log: Optional[TextIO] = None):
+        """Creates a collector.
+
+        Args:
+          max_samples: number of messages to keep for each category
+          log: if given, every event is written to it as `category<TAB>message`
+        """
+        self.max_samples = max_samples
+        self.log = log
+        self.counts: dict[str, int] = {}
+        self.samples: dict[str, list[str]] = {}
+
+    def report(self, category: str, fmt: str, *args) -> None:
+        count = self.counts.get(category, 0) + 1
+        self.counts[category] = count
+        if count <= self.max_samples:
+            self.samples.setdefault(category, []).append(fmt % args)
+            if self.log is not None:
+                self.log.write('%s\t%s\n' % (category, self.samples[category][-1]))
+        elif self.log is not None:
+            self.log.write('%s\t%s\n' % (category, fmt % args))
+
+    def merge(self, counts: dict[str, int], samples: dict[str, list[str]], log: str) -> None:
+        """Adds the events collected by another collector, after those so far.
+
+        Args:
+          counts: the other collector's `counts`
+          samples: the other collector's `samples`
+          log: what the other collector logged, if it had a log
+        """
+        for (category, count) in counts.items():
+            kept = max(0, self.max_samples - self.counts.get(category, 0))
+            self.counts[category] = self.counts.get(category, 0) + count
+            if kept:
+                self.samples.setdefault(category, []).extend(samples.get(category, [])[:kept])
+        if self.log is not None:
+            self.log.write(log)
+
+    def summary(self) -> list[str]:
+        """Returns the sampled messages and the number of those left out."""
+        lines = []
+        for (category, count) in self.counts.items():
+            samples = self.samples.get(category, [])
+            lines.extend(samples)
+            if count > len(samples):
+                lines.append('%d more `%s` diagnostics not shown (%d total)' % (
+                    count - len(samples), category, count))
+        return lines
+
+
+ACTIVE: Optional[Collector] = None
+
+
+def Collect(max_samples: int = DEFAULT_MAX_SAMPLES,
+            log: Optional[TextIO] = None) -> Collector:
+    """Starts collecting diagnostics into a new `Collector`."""
+    global ACTIVE
+    ACTIVE = Collector(max_samples, log)
+    return ACTIVE
+
+
+def Report(category: str, fmt: str, *args) -> None:
+    """Reports an event; the message is `fmt % args`."""
+    stats.Count(category)
+    if ACTIVE is None:
+        utils.Warning(fmt % args)
+    else:
+        ACTIVE.report(category, fmt, *args)
+
+
+def Merge(counts: dict[str, int], samples: dict[str, list[str]], log: str = '') -> None:
+    """Reports the events collected elsewhere, e.g., in a worker process.
+
+    Without an active collector, only the sampled messages are written.
+    """
+    for (category, count) in counts.items():
+        stats.Count(category, count)
+    if ACTIVE is None:
+        for messages in samples.values():
+            for message in messages:
+                utils.Warning(message)
+    else:
+        ACTIVE.merge(counts, samples, log)
+
+
+def Stop() -> Optional[Collector]:
+    """Stops collecting, returning the collector which was active, if any."""
+    global ACTIVE
+    collector = ACTIVE
+    ACTIVE = None
+    return collector
+
+
+def Flush(err: TextIO = sys.stderr) -> None:
+    """Writes the summary of the collected events and stops collecting."""
+    collector = Stop()
+    if collector is None:
+        return
+    for line in collector.summary():
+        err.write('warning: %s\n' % line)
@@ -0,0 +1,63 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the diagnostics module."""
+
+import io
+import unittest
+
+import diagnostics
+from tdameritrade import TDAmeritrade
+
+
+class _Unformattable:
+    def __str__(self):
+        raise AssertionError('message formatted although not sampled')
+
+
+class DiagnosticsTest(unittest.TestCase):
+    def tearDown(self):
+        diagnostics.Stop()
+
+    def testSamplesAreBounded(self):
+        collector = diagnostics.Collect(max_samples=2)
+        for i in range(5):
+            diagnostics.Report(diagnostics.WRONG_YEAR, 'row %d', i)
+        diagnostics.Report(diagnostics.UNKNOWN_LINE, 'bad line')
+        for _ in range(3):
+            diagnostics.Report(diagnostics.WRONG_YEAR, '%s', _Unformattable())
+
+        self.assertEqual({'wrong_year': 8, 'unknown_line': 1}, collector.counts)
+        err = io.StringIO()
+        diagnostics.Flush(err)
+        self.assertEqual(['warning: row 0',
+                          'warning: row 1',
+                          'warning: 6 more `wrong_year` diagnostics not shown (8 total)',
+                          'warning: bad line'],
+                         err.getvalue().splitlines())
+        self.assertIsNone(diagnostics.ACTIVE)
+
+    def testLogGetsEverything(self):
+        log = io.StringIO()
+        diagnostics.Collect(max_samples=1, log=log)
+        list(TDAmeritrade.iterTxns('testdata/tdameritrade.csv', 2011))
+        lines = log.getvalue().splitlines()
+        self.assertEqual(3, len(lines))
+        self.assertTrue(all(line.startswith('wrong_year\t') for line in lines))
+
+
+if __name__ == '__main__':
+    unittest.main()
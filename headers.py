@@ -0,0 +1,31 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""The first lines of the exports of the built-in brokers.
+
+These are kept apart from the brokers themselves, so that the registry in
+`brokers` can detect files without importing any of the parsers.
+"""
+
+# Only the start of the first line; it is followed by the tax year.
+INTERACTIVE_BROKERS = 'Title,Worksheet for Form 8949,'
+
+TDAMERITRADE = ','.join([
+    'Security', 'Trans type', 'Qty', 'Open date', 'Adj cost',
+    'Close date', 'Adj proceeds', 'Adj gain($)', 'Adj gain(%)',
+    'Term\n'])
+
+VANGUARD = ','.join(['"Trade Date"', '"Transaction Type"',
+                     '"Investment Name"', '"Symbol"', '"Shares"',
+                     '"Principal Amount"', '"Net Amount"\n'])
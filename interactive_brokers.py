@@ -20,21 +20,32 @@ Does not handle:
 
 from __future__ import annotations
 
-import csv
-from datetime import datetime
-from decimal import Decimal
-from typing import Optional
+import itertools
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 from broker import Broker
+import diagnostics
+import headers
+import money
 from typing_extensions import override
 import utils
 
 
-FIRST_LINE = 'Title,Worksheet for Form 8949,'
+FIRST_LINE = headers.INTERACTIVE_BROKERS
+
+# The number of rows in a chunk of a file, and its `Part` and `Box` lines, with
+# their indices; see `summarizeRows`.
+_Summary = Tuple[int, List[Tuple[int, List[str]]]]
 
 
 class InteractiveBrokers(Broker):
 
+    HEADER = FIRST_LINE
+    HEADER_IS_PREFIX = True
+    RESUMABLE = True
+    SPLITTABLE = True
+    TRAILER = 'Footer,'
+
     @classmethod
     @override
     def name(cls) -> str:
@@ -60,72 +71,104 @@ class InteractiveBrokers(Broker):
 
     @classmethod
     def TryParseYear(cls, date_str: str) -> Optional[int]:
-        try:
-            return datetime.strptime(date_str, '%m/%d/%Y').year
-        except ValueError:
-            return None
+        parsed = utils.tryParseDate(date_str, utils.DATE_FORMAT_MDY)
+        return parsed[0].year if parsed else None
+
+    @classmethod
+    def ParseDollarValue(cls, value: str) -> int:
+        """Returns the amount in cents."""
+        return money.Parse(value)
+
+    @classmethod
+    @override
+    def iterTxnsFromRows(cls, rows: Iterable[list[str]],
+                         tax_year: Optional[int]) -> Iterator[utils.Transaction]:
+        return cls.resumeTxnsFromRows(rows, tax_year, {})
+
+    @classmethod
+    @override
+    def resumeTxnsFromRows(cls, rows: Iterable[list[str]], tax_year: Optional[int],
+                           state: dict) -> Iterator[utils.Transaction]:
+        txns = iter(rows)
+        # First 2 lines are headers.
+        header_rows = state.get('headers', 2)
+        state['headers'] = header_rows - len(list(itertools.islice(txns, header_rows)))
+
+        entry_code: Optional[int] = state.get('entry_code')
+
+        for row in txns:
+            if row[0] == 'Part' and len(row) == 3:
+                if not cls.updateState(state, row):
+                    diagnostics.Report(diagnostics.UNKNOWN_PART, 'unknown part line: "%s"', row)
+            elif row[0] == 'Box' and len(row) == 3:
+                if cls.updateState(state, row):
+                    entry_code = state['entry_code']
+                else:
+                    diagnostics.Report(diagnostics.UNKNOWN_BOX, 'unknown box line: "%s"', row)
+            elif row[0] == 'Data' and len(row) == 9:
+                if not entry_code:
+                    diagnostics.Report(diagnostics.MISSING_ENTRY_CODE,
+                                       'ignoring data: "%s" as the code is not defined', row)
+                    continue
+                # Check the year of the sale first, so that rows from other
+                # years are skipped without parsing their amounts.
+                year = cls.TryParseYear(row[4])
+                if tax_year and year and year != tax_year:
+                    diagnostics.Report(diagnostics.WRONG_YEAR,
+                                       'ignoring txn: "%s" as the sale is not from %d',
+                                       row[1], tax_year)
+                    continue
+                yield utils.Transaction.lazy(_DecodeAmounts, (row[5], row[6], row[7]),
+                                             desc=row[1], buyDateStr=row[3],
+                                             sellDateStr=row[4], entryCode=entry_code)
+            elif (row[0] != 'Header' and row[0] != 'Footer') or len(row) != 9:
+                diagnostics.Report(diagnostics.UNKNOWN_LINE, 'unknown line: "%s"', row)
 
     @classmethod
-    def ParseDollarValue(cls, value: str) -> Decimal:
-        return Decimal(value.replace(',', '').replace('"', ''))
+    def updateState(cls, state: dict, row: list[str]) -> bool:
+        """Applies a `Part` or `Box` line to the parser `state`.
+
+        Returns False if the part or box is unknown.
+        """
+        if row[0] == 'Part':
+            state['box'] = None
+            if row[1] == 'I':
+                state['part'] = 1
+            elif row[1] == 'II':
+                state['part'] = 2
+            else:
+                return False
+        elif row[1] == 'A' or row[1] == 'B' or row[1] == 'C':
+            state['box'] = row[1]
+            state['entry_code'] = cls.DetermineEntryCode(state.get('part'), row[1])
+        else:
+            return False
+        return True
 
     @classmethod
     @override
-    def isFileForBroker(cls, filename: str) -> bool:
-        with open(filename) as f:
-            first_line = f.readline()
-            return first_line.find(FIRST_LINE) == 0
+    def summarizeRows(cls, rows: Iterable[list[str]]) -> _Summary:
+        num_rows = 0
+        headings = []
+        for (num_rows, row) in enumerate(rows, 1):
+            if row and (row[0] == 'Part' or row[0] == 'Box') and len(row) == 3:
+                headings.append((num_rows - 1, row))
+        return (num_rows, headings)
 
     @classmethod
     @override
-    def parseFileToTxnList(cls, filename: str, tax_year: Optional[int]) -> list[utils.Transaction]:
-        with open(filename) as f:
-            # First 2 lines are headers.
-            f.readline()
-            f.readline()
-            txns = csv.reader(f, delimiter=',', quotechar='"')
-
-            txn_list: list[utils.Transaction] = []
-            part: Optional[int] = None
-            box: Optional[str] = None
-            entry_code: Optional[int] = None
-
-            for row in txns:
-                if row[0] == 'Part' and len(row) == 3:
-                    box = None
-                    if row[1] == 'I':
-                        part = 1
-                    elif row[1] == 'II':
-                        part = 2
-                    else:
-                        utils.Warning('unknown part line: "%s"' % row)
-                elif row[0] == 'Box' and len(row) == 3:
-                    if row[1] == 'A' or row[1] == 'B' or row[1] == 'C':
-                        box = row[1]
-                        entry_code = cls.DetermineEntryCode(part, box)
-                    else:
-                        utils.Warning('unknown box line: "%s"' % row)
-                elif row[0] == 'Data' and len(row) == 9:
-                    if not entry_code:
-                        utils.Warning('ignoring data: "%s" as the code is not defined')
-                        continue
-                    txn = utils.Transaction()
-                    txn.desc = row[1]
-                    txn.buyDateStr = row[3]
-                    txn.sellDateStr = row[4]
-                    year = cls.TryParseYear(txn.sellDateStr)
-                    txn.saleProceeds = cls.ParseDollarValue(row[5])
-                    txn.costBasis = cls.ParseDollarValue(row[6])
-                    if row[7]:
-                        txn.adjustment = cls.ParseDollarValue(row[7])
-                    txn.entryCode = entry_code
-                    if tax_year and year and year != tax_year:
-                        utils.Warning('ignoring txn: "%s" as the sale is not from %d' %
-                                      (txn.desc, tax_year))
-                    else:
-                        txn_list.append(txn)
-                    txn = None
-                elif (row[0] != 'Header' and row[0] != 'Footer') or len(row) != 9:
-                    utils.Warning('unknown line: "%s"' % row)
-
-            return txn_list
+    def advanceState(cls, state: dict, summary: _Summary) -> None:
+        (num_rows, headings) = summary
+        header_rows = state.get('headers', 2)
+        for (i, row) in headings:
+            if i >= header_rows:
+                cls.updateState(state, row)
+        state['headers'] = max(0, header_rows - num_rows)
+
+
+def _DecodeAmounts(txn: utils.Transaction, raw: tuple[str, str, str]) -> None:
+    (proceeds, cost, adjustment) = raw
+    txn.proceedsCents = InteractiveBrokers.ParseDollarValue(proceeds)
+    txn.costCents = InteractiveBrokers.ParseDollarValue(cost)
+    if adjustment:
+        txn.adjustmentCents = InteractiveBrokers.ParseDollarValue(adjustment)
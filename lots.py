@@ -0,0 +1,151 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Matches sales against the lots bought earlier.
+
+For brokers which report buys and sells as separate rows, a `LotMatcher` keeps
+the open lots of each symbol in a heap ordered by the matching method, so that
+each buy, and each lot consumed by a sale, costs O(log n). A sale of part of a
+lot splits it, dividing its cost basis in proportion to the shares sold.
+
+Amounts are integer numbers of cents; see the `money` module.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+import heapq
+import itertools
+from typing import Optional
+
+import money
+import utils
+
+
+# Methods of choosing which lots a sale comes out of.
+FIFO = 'fifo'  # First in, first out: the oldest lots.
+LIFO = 'lifo'  # Last in, first out: the newest lots.
+HIFO = 'hifo'  # Highest in, first out: the lots with the highest cost per share.
+
+METHODS = (FIFO, HIFO, LIFO)
+
+# The method used by the parsers; set by `--lot-method`.
+METHOD = FIFO
+
+
+class Lot:
+    """Shares bought together, or what remains of them."""
+
+    __slots__ = ('shares', 'cost', 'date', 'dateStr')
+
+    def __init__(self, shares: int, cost: int, date: datetime, dateStr: str):
+        self.shares = shares
+        self.cost = cost
+        self.date = date
+        self.dateStr = dateStr
+
+
+class Match:
+    """The part of a lot consumed by a sale."""
+
+    __slots__ = ('shares', 'cost', 'proceeds', 'buyDate', 'buyDateStr')
+
+    shares: int
+    cost: int
+    proceeds: Optional[int]
+    buyDate: datetime
+    buyDateStr: str
+
+    def __init__(self, shares: int, cost: int, lot: Lot):
+        self.shares = shares
+        self.cost = cost
+        self.proceeds = None
+        self.buyDate = lot.date
+        self.buyDateStr = lot.dateStr
+
+
+class LotMatcher:
+
+    def __init__(self, method: Optional[str] = None):
+        """Creates a matcher using `method`, or `METHOD` if not given."""
+        if method is None:
+            method = METHOD
+        if method not in METHODS:
+            raise utils.ValueError('Unknown lot matching method: %s' % method)
+        self.method = method
+        # Open lots of each symbol, as heaps of (key, lot); the sequence
+        # numbers in the keys break ties, so lots are never compared.
+        self._open: dict[str, list[tuple[tuple, Lot]]] = {}
+        self._seq = itertools.count()
+
+    def _key(self, lot: Lot) -> tuple:
+        seq = next(self._seq)
+        if self.method == FIFO:
+            return (seq,)
+        elif self.method == LIFO:
+            return (-seq,)
+        else:
+            # The cost per share when the lot is bought; selling part of the
+            # lot splits its cost in proportion, so it keeps its place.
+            return (-lot.cost / lot.shares, seq)
+
+    def buy(self, symbol: str, shares: int, cost: int, date: datetime, dateStr: str) -> None:
+        """Opens a lot of `shares`, which must be positive, bought for `cost`."""
+        if shares <= 0:
+            raise utils.ValueError('Cannot buy %d shares of %s' % (shares, symbol))
+        lot = Lot(shares, cost, date, dateStr)
+        heapq.heappush(self._open.setdefault(symbol, []), (self._key(lot), lot))
+
+    def sell(self, symbol: str, shares: int,
+             proceeds: Optional[int]) -> tuple[list[Match], int]:
+        """Consumes `shares` of `symbol` from the open lots.
+
+        The proceeds, if given, are divided among the matches in proportion to
+        their shares.
+
+        Returns:
+          the parts of the lots sold, and the number of shares which could not
+          be matched as there were not enough open lots
+        """
+        heap = self._open.get(symbol, [])
+        matches = []
+        remaining = shares
+        while remaining > 0 and heap:
+            lot = heap[0][1]
+            if lot.shares <= remaining:
+                heapq.heappop(heap)
+                match = Match(lot.shares, lot.cost, lot)
+            else:
+                # Split the lot; it keeps its place in the heap.
+                cost = money.Prorate(lot.cost, remaining, lot.shares)
+                match = Match(remaining, cost, lot)
+                lot.shares -= remaining
+                lot.cost -= cost
+            remaining -= match.shares
+            matches.append(match)
+        if not heap:
+            self._open.pop(symbol, None)
+
+        if proceeds is not None and matches:
+            allocated = 0
+            for match in matches:
+                match.proceeds = money.Prorate(proceeds, match.shares, shares)
+                allocated += match.proceeds
+            if not remaining:
+                # Rounding must not change the total proceeds of the sale.
+                matches[-1].proceeds += proceeds - allocated
+        return (matches, remaining)
+
+    def openShares(self, symbol: str) -> int:
+        return sum(lot.shares for (_, lot) in self._open.get(symbol, []))
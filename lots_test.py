@@ -0,0 +1,102 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the lots module."""
+
+from datetime import datetime
+from decimal import Decimal
+import unittest
+
+import lots
+import money
+import utils
+
+
+def Buy(matcher, symbol, shares, cost, day):
+    date = datetime(2011, 1, day)
+    matcher.buy(symbol, shares, money.Parse(cost), date, utils.txfDate(date))
+
+
+class LotMatcherTest(unittest.TestCase):
+    def Sell(self, matcher, symbol, shares, proceeds):
+        (matches, unmatched) = matcher.sell(symbol, shares, money.Parse(proceeds))
+        self.assertEqual(0, unmatched)
+        return [(match.shares, money.Format(match.cost), money.Format(match.proceeds),
+                 match.buyDate.day)
+                for match in matches]
+
+    def Matcher(self, method):
+        matcher = lots.LotMatcher(method)
+        Buy(matcher, 'ABC', 100, '1000.00', 1)
+        Buy(matcher, 'ABC', 100, '3000.00', 2)
+        Buy(matcher, 'ABC', 100, '2000.00', 3)
+        return matcher
+
+    def testFifo(self):
+        self.assertEqual([(100, '1000.00', '1500.00', 1), (50, '1500.00', '750.00', 2)],
+                         self.Sell(self.Matcher(lots.FIFO), 'ABC', 150, '2250.00'))
+
+    def testLifo(self):
+        self.assertEqual([(100, '2000.00', '1500.00', 3), (50, '1500.00', '750.00', 2)],
+                         self.Sell(self.Matcher(lots.LIFO), 'ABC', 150, '2250.00'))
+
+    def testHifo(self):
+        self.assertEqual([(100, '3000.00', '1500.00', 2), (50, '1000.00', '750.00', 3)],
+                         self.Sell(self.Matcher(lots.HIFO), 'ABC', 150, '2250.00'))
+
+    def testSplitLotKeepsTotals(self):
+        matcher = lots.LotMatcher(lots.FIFO)
+        Buy(matcher, 'ABC', 3, '10.00', 1)
+        sales = [self.Sell(matcher, 'ABC', 1, '4.00') for _ in range(3)]
+        self.assertEqual(Decimal('10.00'), sum(Decimal(sale[0][1]) for sale in sales))
+        self.assertEqual(0, matcher.openShares('ABC'))
+
+    def testProceedsAddUp(self):
+        matcher = lots.LotMatcher(lots.FIFO)
+        for day in (1, 2, 3):
+            Buy(matcher, 'ABC', 1, '1.00', day)
+        sale = self.Sell(matcher, 'ABC', 3, '10.00')
+        self.assertEqual(Decimal('10.00'), sum(Decimal(match[2]) for match in sale))
+
+    def testUnmatched(self):
+        matcher = lots.LotMatcher(lots.FIFO)
+        Buy(matcher, 'ABC', 10, '100.00', 1)
+        (matches, unmatched) = matcher.sell('ABC', 15, None)
+        self.assertEqual([10], [match.shares for match in matches])
+        self.assertIsNone(matches[0].proceeds)
+        self.assertEqual(5, unmatched)
+        self.assertEqual(([], 5), matcher.sell('XYZ', 5, None))
+
+    def testSymbolsAreSeparate(self):
+        matcher = lots.LotMatcher(lots.FIFO)
+        Buy(matcher, 'ABC', 10, '100.00', 1)
+        Buy(matcher, 'XYZ', 10, '500.00', 2)
+        self.assertEqual([(10, '500.00', '600.00', 2)],
+                         self.Sell(matcher, 'XYZ', 10, '600.00'))
+        self.assertEqual(10, matcher.openShares('ABC'))
+
+    def testNoShares(self):
+        for method in lots.METHODS:
+            matcher = lots.LotMatcher(method)
+            self.assertRaises(utils.ValueError, Buy, matcher, 'ABC', 0, '0.00', 1)
+            self.assertEqual(0, matcher.openShares('ABC'))
+
+    def testUnknownMethod(self):
+        self.assertRaises(utils.ValueError, lots.LotMatcher, 'random')
+
+
+if __name__ == '__main__':
+    unittest.main()
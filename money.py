@@ -0,0 +1,112 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Amounts of money as integer numbers of cents.
+
+Amounts are parsed straight from the brokers' strings into `int`s, added up
+exactly as `int`s, and formatted for TXF without going through `Decimal` or
+`float`. `Decimal` values are only needed at the edges, e.g., for the
+`Transaction.costBasis` properties.
+"""
+
+from __future__ import annotations
+
+from decimal import Decimal
+import re
+from typing import Union
+
+import utils
+
+
+# Characters which brokers put into amounts for readability.
+_IGNORED = str.maketrans('', '', ',"$ ')
+
+
+# Amounts with exactly two decimals, as nearly all brokers' amounts are, once
+# thousands separators are removed.
+_SIMPLE = re.compile(r'-?[0-9]*\.[0-9][0-9]')
+
+
+def Parse(value: str) -> int:
+    """Returns the amount in cents of a broker's number string.
+
+    Accepts thousands separators, quotes, a dollar sign, surrounding spaces,
+    a leading sign, and parentheses for negative amounts, e.g., '"1,234.56 "'
+    or '(12.50)'. Amounts with more than two decimals are rounded to the nearest
+    cent (half to even).
+
+    Raises:
+      utils.ValueError: if `value` is not a number
+    """
+    s = value.replace(',', '')
+    if _SIMPLE.fullmatch(s) is not None:
+        return int(s.replace('.', ''))
+    s = s.translate(_IGNORED)
+    negative = False
+    if s[:1] == '(' and s[-1:] == ')':
+        negative = True
+        s = s[1:-1]
+    if s[:1] in ('-', '+'):
+        negative = negative != (s[0] == '-')
+        s = s[1:]
+    (dollars, _, cents) = s.partition('.')
+    digits = dollars + cents
+    if not digits or not (digits.isascii() and digits.isdigit()):
+        raise utils.ValueError('Invalid amount: %r' % value)
+    amount = int(dollars or '0') * 100 + int(cents[:2].ljust(2, '0'))
+    if len(cents) > 2:
+        # Compares the dropped digits with one half, e.g., '5' or '50'.
+        rest = cents[2:].rstrip('0')
+        if rest > '5' or (rest == '5' and amount % 2):
+            amount += 1
+    return -amount if negative else amount
+
+
+def Format(cents: int) -> str:
+    """Formats `cents` as dollars with two decimals, e.g., '-1234.50'."""
+    if cents >= 100:
+        digits = str(cents)
+        return digits[:-2] + '.' + digits[-2:]
+    (dollars, rest) = divmod(abs(cents), 100)
+    return '%s%d.%02d' % ('-' if cents < 0 else '', dollars, rest)
+
+
+def ToDecimal(cents: int) -> Decimal:
+    return Decimal(cents).scaleb(-2)
+
+
+def FromDecimal(amount: Union[Decimal, int]) -> int:
+    """Returns `amount` in cents, rounded to the nearest cent (half to even)."""
+    (numerator, denominator) = amount.as_integer_ratio()
+    return _DivideRounded(numerator * 100, denominator)
+
+
+def _DivideRounded(numerator: int, denominator: int) -> int:
+    """Returns `numerator / denominator`, rounded half to even."""
+    if denominator < 0:
+        (numerator, denominator) = (-numerator, -denominator)
+    (quotient, remainder) = divmod(numerator, denominator)
+    if 2 * remainder > denominator or (2 * remainder == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+def Prorate(cents: int, part: Union[Decimal, int], whole: Union[Decimal, int]) -> int:
+    """Returns `cents * part / whole`, rounded to the nearest cent (half to even)."""
+    if part == whole:
+        return cents
+    (part_numerator, part_denominator) = part.as_integer_ratio()
+    (whole_numerator, whole_denominator) = whole.as_integer_ratio()
+    return _DivideRounded(cents * part_numerator * whole_denominator,
+                          part_denominator * whole_numerator)
@@ -0,0 +1,106 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the money module."""
+
+from decimal import Decimal, ROUND_HALF_EVEN
+import random
+import unittest
+
+import money
+import utils
+
+
+def DecimalParse(value):
+    """The reference parser: what the brokers used to do with `Decimal`."""
+    s = value.replace(',', '').replace('"', '').replace('$', '').strip()
+    negative = s.startswith('(') and s.endswith(')')
+    amount = Decimal(s.strip('()'))
+    return -amount if negative else amount
+
+
+def RandomAmount(rng):
+    dollars = rng.choice([0, rng.randrange(10), rng.randrange(10 ** rng.randrange(1, 10))])
+    s = '{:,}'.format(dollars) if rng.random() < 0.5 else str(dollars)
+    decimals = rng.choice([0, 1, 2, 2, 2, 3, 4])
+    if decimals:
+        digits = ''.join(rng.choice('0123456789') for _ in range(min(decimals, 2)))
+        if decimals > 2:
+            # Halves, to exercise rounding ties, and arbitrary digits.
+            digits += rng.choice(['5', ''.join(rng.choice('0123456789')
+                                               for _ in range(decimals - 2))])
+        s += '.' + digits + '0' * (decimals - len(digits))
+    elif rng.random() < 0.1:
+        s += '.'
+    sign = rng.choice(['', '', '-', '+', '()'])
+    s = '(%s)' % s if sign == '()' else sign + s
+    if rng.random() < 0.2:
+        s = '$' + s if sign == '()' else sign + '$' + s.lstrip('+-')
+    if rng.random() < 0.2:
+        s = '"%s"' % s
+    return s
+
+
+class MoneyTest(unittest.TestCase):
+    def testParseMatchesDecimal(self):
+        rng = random.Random(1)
+        for _ in range(20000):
+            value = RandomAmount(rng)
+            expected = DecimalParse(value).quantize(Decimal('0.01'), ROUND_HALF_EVEN)
+            self.assertEqual(int(expected.scaleb(2)), money.Parse(value), value)
+
+    def testParseEdgeCases(self):
+        for (value, cents) in [('0', 0), ('-0.00', 0), ('.5', 50), ('5.', 500),
+                               ('1,234,567.89', 123456789), ('"1,234.50"', 123450),
+                               ('(12.34)', -1234), ('-$12.34', -1234), (' 7.10 ', 710),
+                               ('1.2300', 123), ('+3', 300), ('1.005', 100),
+                               ('1.015', 102), ('1.0051', 101), ('1.2345', 123),
+                               ('(0.125)', -12), ('-0.135', -14)]:
+            self.assertEqual(cents, money.Parse(value), value)
+
+    def testParseInvalid(self):
+        for value in ['', '.', '-', '()', 'abc', '1.2.3', '1.00x', '--1', '1e5', '١٢']:
+            with self.assertRaises(utils.ValueError, msg=value):
+                money.Parse(value)
+
+    def testFormatMatchesDecimal(self):
+        rng = random.Random(2)
+        for cents in [0, 1, -1, 99, -99, 100, -100, 10 ** 20 + 1] + [
+                rng.randrange(-10 ** 12, 10 ** 12) for _ in range(20000)]:
+            self.assertEqual(format(money.ToDecimal(cents), '.2f'), money.Format(cents), cents)
+
+    def testFromDecimal(self):
+        self.assertEqual(123, money.FromDecimal(Decimal('1.23')))
+        self.assertEqual(-500, money.FromDecimal(Decimal('-5')))
+        self.assertEqual(700, money.FromDecimal(7))
+        self.assertEqual(100, money.FromDecimal(Decimal('1.005')))
+        self.assertEqual(-102, money.FromDecimal(Decimal('-1.015')))
+        self.assertEqual(123, money.FromDecimal(Decimal('1.2345')))
+
+    def testProrateMatchesDecimal(self):
+        rng = random.Random(3)
+        cent = Decimal('0.01')
+        for _ in range(20000):
+            cents = rng.randrange(-10 ** 9, 10 ** 9)
+            whole = rng.randrange(1, 10000)
+            part = rng.randrange(0, whole + 1)
+            expected = (money.ToDecimal(cents) * part / whole).quantize(cent, ROUND_HALF_EVEN)
+            self.assertEqual(money.FromDecimal(expected), money.Prorate(cents, part, whole))
+        self.assertEqual(50, money.Prorate(150, Decimal('0.5'), Decimal('1.5')))
+
+
+if __name__ == '__main__':
+    unittest.main()
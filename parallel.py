@@ -0,0 +1,133 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Parses a single large file in chunks, on a pool of worker processes.
+
+The file is split into ranges of rows (see `csvrows.SplitRows`), which are
+parsed in two passes, both in parallel:
+
+1) Each chunk is summarized (see `Broker.summarizeRows`): e.g., the `Part` and
+   `Box` lines of Interactive Brokers, which set the entry code of the rows
+   after them, or the summary line which ends TD Ameritrade exports.
+2) Folding the summaries of the chunks before it gives the parser state at
+   the start of each chunk, from which it is then parsed.
+
+The transactions, and diagnostics, of each chunk are passed back in order, so
+the result is the same as that of parsing the file sequentially.
+"""
+
+from __future__ import annotations
+
+import collections
+import io
+import itertools
+import os
+import sys
+from typing import Iterator, Optional, Type, TYPE_CHECKING
+
+import csvrows
+import diagnostics
+import stats
+import utils
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+    from broker import Broker
+
+
+# Whether single files are parsed in parallel; set by `--split`.
+ENABLED = False
+
+# Number of worker processes, or None for the number of CPUs; set by `--jobs`.
+JOBS: Optional[int] = None
+
+# Bytes of the file parsed by each task; smaller files are parsed sequentially.
+CHUNK_SIZE = 32 << 20
+
+
+def _Summarize(broker: Type[Broker], filename: str, start: int, end: int) -> object:
+    stats.Disable()
+    return broker.summarizeRows(csvrows.ReadRange(filename, start, end))
+
+
+def _Parse(broker: Type[Broker], filename: str, tax_year: Optional[int], start: int,
+           end: int, state: dict, max_samples: int,
+           log: bool) -> tuple[bytes, dict[str, int], dict[str, list[str]], str]:
+    """Parses a chunk; this runs in a worker process.
+
+    Returns the encoded transactions and what the diagnostics collector saw.
+    """
+    import cache
+    stats.Disable()
+    text = io.StringIO() if log else None
+    collector = diagnostics.Collect(max_samples, text)
+    try:
+        # The transactions only go through a pipe, so compress them quickly.
+        txns = cache.EncodeTxns(
+            broker.resumeTxnsFromRows(csvrows.ReadRange(filename, start, end), tax_year, state),
+            level=1)
+    finally:
+        diagnostics.Stop()
+    return (txns, collector.counts, collector.samples, text.getvalue() if text else '')
+
+
+def IterTxns(broker: Type[Broker], filename: str,
+             tax_year: Optional[int]) -> Iterator[utils.Transaction]:
+    """Like `broker.iterTxns`, but parses chunks of the file in parallel."""
+    # Compressed files cannot be split.
+    ranges = csvrows.SplitRows(filename, CHUNK_SIZE) if csvrows.IsPlainFile(filename) else []
+    if len(ranges) < 2:
+        yield from broker.iterTxns(filename, tax_year)
+        return
+    stats.Count('chunks', len(ranges))
+    # Imported here, as starting up the CLI would otherwise take a lot longer.
+    from concurrent.futures import ProcessPoolExecutor
+
+    if diagnostics.ACTIVE is None:
+        (max_samples, log) = (sys.maxsize, False)
+    else:
+        (max_samples, log) = (diagnostics.ACTIVE.max_samples, diagnostics.ACTIVE.log is not None)
+    jobs = JOBS or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=jobs)
+    summaries: list[Future] = []
+    # Chunks are parsed a few at a time ahead of the one being consumed,
+    # so that the results waiting to be consumed stay bounded.
+    parses: collections.deque[Future] = collections.deque()
+    try:
+        summaries.extend(executor.submit(_Summarize, broker, filename, start, end)
+                         for (start, end) in ranges)
+        state: dict = {}
+        for ((start, end), summary) in zip(ranges, summaries):
+            # The arguments are only pickled later on, so pass a copy of the
+            # state as of the start of this chunk.
+            parses.append(executor.submit(_Parse, broker, filename, tax_year, start, end,
+                                          dict(state), max_samples, log))
+            broker.advanceState(state, summary.result())
+            if len(parses) > 2 * jobs:
+                yield from _Results(parses.popleft())
+        while parses:
+            yield from _Results(parses.popleft())
+    finally:
+        # Not `shutdown(cancel_futures=True)`, which needs Python 3.9.
+        for future in itertools.chain(summaries, parses):
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def _Results(parse: Future) -> list[utils.Transaction]:
+    import cache
+    (txns, counts, samples, log) = parse.result()
+    diagnostics.Merge(counts, samples, log)
+    return cache.DecodeTxns(txns)
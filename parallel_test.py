@@ -0,0 +1,103 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the parallel module."""
+
+import io
+import itertools
+import os
+import shutil
+import tempfile
+import unittest
+
+import csvrows
+import diagnostics
+from interactive_brokers import InteractiveBrokers
+import parallel
+from tdameritrade import TDAmeritrade
+
+
+class ParallelTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.addCleanup(setattr, parallel, 'CHUNK_SIZE', parallel.CHUNK_SIZE)
+        self.addCleanup(setattr, parallel, 'JOBS', parallel.JOBS)
+        self.addCleanup(diagnostics.Stop)
+        parallel.JOBS = 2
+
+    def WriteInput(self, data):
+        filename = os.path.join(self.tmpdir, 'input.csv')
+        with open(filename, 'w') as f:
+            f.write(data)
+        return filename
+
+    def Parse(self, txns):
+        collector = diagnostics.Collect(3, io.StringIO())
+        result = [str(txn) for txn in txns]
+        diagnostics.Stop()
+        return (result, collector.summary(), collector.log.getvalue())
+
+    def AssertSameAsSequential(self, broker, filename, tax_year):
+        expected = self.Parse(broker.iterTxns(filename, tax_year))
+        for chunk_size in (1, 50, 200, 1 << 20):
+            parallel.CHUNK_SIZE = chunk_size
+            self.assertEqual(expected, self.Parse(parallel.IterTxns(broker, filename, tax_year)),
+                             chunk_size)
+
+    def testInteractiveBrokers(self):
+        for tax_year in (2011, 2012):
+            self.AssertSameAsSequential(InteractiveBrokers, 'testdata/interactive_brokers.csv',
+                                        tax_year)
+        with open('testdata/interactive_brokers.csv') as f:
+            lines = f.readlines()
+        # Rows before any box, an unknown part and a box before any part.
+        filename = self.WriteInput(''.join(lines[:2] + lines[5:7] + ['Part,III,\n'] +
+                                           lines[8:] + ['Box,A,\n'] + lines[5:7]))
+        self.AssertSameAsSequential(InteractiveBrokers, filename, 2011)
+
+    def testTDAmeritrade(self):
+        self.AssertSameAsSequential(TDAmeritrade, 'testdata/tdameritrade.csv', 2020)
+        with open('testdata/tdameritrade.csv') as f:
+            lines = f.readlines()
+        # Rows after the summary line are ignored.
+        filename = self.WriteInput(''.join(lines[:1] + lines[1:-1] * 20 + lines[-1:] +
+                                           lines[1:-1]))
+        self.AssertSameAsSequential(TDAmeritrade, filename, 2020)
+
+    def testStopEarly(self):
+        parallel.CHUNK_SIZE = 1
+        txns = parallel.IterTxns(TDAmeritrade, 'testdata/tdameritrade.csv', 2020)
+        self.assertIsNotNone(next(txns))
+        # Cancels the chunks which are still pending.
+        txns.close()
+
+    def testSplitRows(self):
+        data = 'a,b\n' + '"x\n\ny",z\n' * 5 + 'c,"d,\ne"\n' * 5 + 'f'
+        filename = self.WriteInput(data)
+        expected = list(csvrows.Read(filename))
+        for chunk_size in (1, 3, 10, 1000):
+            ranges = csvrows.SplitRows(filename, chunk_size)
+            self.assertEqual(0, ranges[0][0])
+            self.assertEqual(len(data), ranges[-1][1])
+            rows = itertools.chain.from_iterable(
+                csvrows.ReadRange(filename, start, end) for (start, end) in ranges)
+            self.assertEqual(expected, list(rows), chunk_size)
+        self.assertEqual([], csvrows.SplitRows(self.WriteInput(''), 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs the stages of a conversion concurrently.
+
+Reading the input, parsing it and rendering TXF each run on a thread of their
+own, while the calling thread writes the output. The stages are connected by
+bounded queues, so a stage which gets ahead blocks until the next one catches
+up, and the memory in use is capped by the sizes of the queues rather than the
+size of the input. Reads and writes release the GIL, so I/O overlaps with the
+parsing and rendering.
+
+An exception in any stage is raised by the consumer of its output, and so on
+down to the caller; if a consumer stops early, for whatever reason, the stages
+feeding it are stopped as well.
+"""
+
+from __future__ import annotations
+
+import itertools
+import queue
+import threading
+import time
+from typing import (Generic, Iterable, Iterator, Optional, Sequence, TextIO, Type, TypeVar,
+                    TYPE_CHECKING)
+
+import csvrows
+import sinks
+import stats
+import utils
+
+if TYPE_CHECKING:
+    from broker import Broker
+
+
+# Whether conversions run as a pipeline; set by `--pipeline`.
+ENABLED = False
+
+# Number of chunks each queue holds.
+QUEUE_SIZE = 8
+
+# Number of items passed between stages at a time; handing over items one at
+# a time would cost more than producing them.
+CHUNK_SIZE = 512
+
+# How often a stage blocked on a full queue checks whether it was stopped, in
+# seconds.
+POLL_INTERVAL = 0.1
+
+T = TypeVar('T')
+
+
+class _Done:
+    pass
+
+
+class _Failed:
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class Stage(Generic[T]):
+    """Produces the items of `iterable` on a thread of its own.
+
+    Iterating over the stage yields the items in order; the stage can only be
+    iterated over once.
+    """
+
+    def __init__(self, name: str, iterable: Iterable[T], chunk_size: int = CHUNK_SIZE,
+                 upstream: Sequence[Stage] = ()):
+        """Starts the stage.
+
+        Args:
+          name: name of the stage, whose thread's CPU time is added to `stats`
+          iterable: the items, which are only iterated over on the stage's thread
+          chunk_size: number of items passed to the consumer at a time
+          upstream: stages feeding `iterable`, which are stopped with this one
+        """
+        self.name = name
+        self._queue: queue.Queue = queue.Queue(QUEUE_SIZE)
+        self._stopped = threading.Event()
+        self._upstream = list(upstream)
+        self._thread = threading.Thread(target=self._run, args=(iterable, chunk_size),
+                                        name='csv2txf-%s' % name, daemon=True)
+        self._thread.start()
+
+    def _put(self, item: object) -> bool:
+        """Waits for room in the queue for `item`; returns False if stopped."""
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self, iterable: Iterable[T], chunk_size: int) -> None:
+        start = time.thread_time()
+        iterator = iter(iterable)
+        try:
+            while True:
+                chunk = list(itertools.islice(iterator, chunk_size))
+                if not chunk:
+                    self._put(_Done())
+                    return
+                if not self._put(chunk):
+                    return
+        except BaseException as e:
+            self._put(_Failed(e))
+        finally:
+            # Runs any cleanup of the items' generator (e.g., closing files) on
+            # this thread, before stopping the stages which feed it.
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+            for stage in self._upstream:
+                stage.stop()
+            stats.AddTime(self.name, time.thread_time() - start)
+
+    def __iter__(self) -> Iterator[T]:
+        try:
+            while True:
+                chunk = self._queue.get()
+                if isinstance(chunk, _Done):
+                    return
+                if isinstance(chunk, _Failed):
+                    raise chunk.error
+                yield from chunk
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        """Stops producing items; those already produced are discarded."""
+        self._stopped.set()
+
+
+def IterTxns(broker: Type[Broker], filename: str,
+             tax_year: Optional[int]) -> Stage[utils.Transaction]:
+    """Like `broker.iterTxns`, but reads and parses the file on separate threads."""
+    blocks = Stage('read', csvrows.ReadBlocks(filename), chunk_size=1)
+    return Stage('parse', broker.iterTxnsFromRows(csvrows.FromBlocks(blocks), tax_year),
+                 upstream=[blocks])
+
+
+class _Chunks(list):
+    """Collects the text written by a sink."""
+
+    def write(self, text: str) -> None:
+        self.append(text)
+
+
+def _RenderTxf(txns: Iterable[utils.Transaction], tax_year: int,
+               date: Optional[str]) -> Iterator[str]:
+    chunks = _Chunks()
+    sink = sinks.TxfSink(chunks, '', tax_year, date)  # type: ignore[arg-type]
+    num_txns = 0
+    for txn in txns:
+        num_txns += 1
+        sink.add(txn)
+        if chunks:
+            yield from chunks
+            chunks.clear()
+    sink.finish()
+    yield from chunks
+    stats.Count('txns', num_txns)
+
+
+def RenderTxf(txns: Iterable[utils.Transaction], tax_year: int,
+              date: Optional[str]) -> Stage[str]:
+    """Renders `txns` as TXF on a separate thread, in chunks of text.
+
+    The chunks add up to the output of `csv2txf.WriteTxf`.
+    """
+    upstream = [txns] if isinstance(txns, Stage) else []
+    return Stage('render', _RenderTxf(txns, tax_year, date), chunk_size=1, upstream=upstream)
+
+
+def WriteTxf(txns: Iterable[utils.Transaction], tax_year: int, date: Optional[str],
+             out: TextIO) -> None:
+    """Like `csv2txf.WriteTxf`, but renders on a separate thread while writing."""
+    render = RenderTxf(txns, tax_year, date)
+    try:
+        for text in render:
+            out.write(text)
+    finally:
+        render.stop()
@@ -0,0 +1,126 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the pipeline module."""
+
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import csv2txf
+import csvrows
+import pipeline
+
+
+class StageTest(unittest.TestCase):
+    def testYieldsItemsInOrder(self):
+        self.assertEqual(list(range(2000)), list(pipeline.Stage('test', range(2000))))
+        self.assertEqual([], list(pipeline.Stage('test', [])))
+
+    def testRaisesErrors(self):
+        def Fail():
+            yield 1
+            raise ValueError('broken')
+
+        stage = pipeline.Stage('test', Fail(), chunk_size=1)
+        with self.assertRaisesRegex(ValueError, 'broken'):
+            list(stage)
+
+    def testBlocksWhenFull(self):
+        produced = []
+
+        def Items():
+            for i in range(1000):
+                produced.append(i)
+                yield i
+
+        stage = pipeline.Stage('test', Items(), chunk_size=1)
+        items = iter(stage)
+        self.assertEqual(0, next(items))
+        stage._thread.join(0.5)
+        self.assertTrue(stage._thread.is_alive())
+        # The queue, the chunk being put into it and the one being consumed.
+        self.assertLessEqual(len(produced), pipeline.QUEUE_SIZE + 2)
+
+        items.close()
+        stage._thread.join(10)
+        self.assertFalse(stage._thread.is_alive())
+
+    def testStopsUpstream(self):
+        closed = threading.Event()
+
+        def Items():
+            try:
+                yield from range(10 ** 6)
+            finally:
+                closed.set()
+
+        upstream = pipeline.Stage('up', Items(), chunk_size=1)
+        downstream = pipeline.Stage('down', upstream, chunk_size=1, upstream=[upstream])
+        self.assertEqual(0, next(iter(downstream)))
+        downstream.stop()
+        self.assertTrue(closed.wait(10))
+
+
+class ConvertTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        block_size = csvrows.BLOCK_SIZE
+        self.addCleanup(setattr, csvrows, 'BLOCK_SIZE', block_size)
+        self.addCleanup(setattr, pipeline, 'ENABLED', pipeline.ENABLED)
+
+    def Convert(self, broker, filename, tax_year):
+        out = io.StringIO()
+        csv2txf.StreamConverter(broker, filename, tax_year, '04/15/2021', out)
+        return out.getvalue()
+
+    def testMatchesSequential(self):
+        for (broker, filename, tax_year) in [
+                ('tdameritrade', 'testdata/tdameritrade.csv', 2020),
+                ('vanguard', 'testdata/vanguard.csv', 2011),
+                ('ib', 'testdata/interactive_brokers.csv', 2011)]:
+            pipeline.ENABLED = False
+            expected = self.Convert(broker, filename, tax_year)
+            run_expected = csv2txf.RunConverter(broker, filename, tax_year, '04/15/2021')
+            pipeline.ENABLED = True
+            for block_size in (1, 64, 1 << 20):
+                csvrows.BLOCK_SIZE = block_size
+                self.assertEqual(expected, self.Convert(broker, filename, tax_year),
+                                 (broker, block_size))
+            self.assertEqual(run_expected,
+                             csv2txf.RunConverter(broker, filename, tax_year, '04/15/2021'))
+
+    def testMissingFile(self):
+        pipeline.ENABLED = True
+        with self.assertRaises(FileNotFoundError):
+            self.Convert('tdameritrade', os.path.join(self.tmpdir, 'missing.csv'), 2020)
+
+    def testReadBlocksMatchesRead(self):
+        filename = os.path.join(self.tmpdir, 'input.csv')
+        with open(filename, 'w') as f:
+            f.write('a,b\n' * 50 + '"x\ny",z\n' + 'c,d\n' * 50 + 'e,f')
+        for block_size in (1, 7, 1 << 20):
+            csvrows.BLOCK_SIZE = block_size
+            self.assertEqual(list(csvrows.Read(filename)),
+                             list(csvrows.FromBlocks(csvrows.ReadBlocks(filename))))
+
+
+if __name__ == '__main__':
+    unittest.main()
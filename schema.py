@@ -0,0 +1,100 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Declarative schemas of the columns read from broker exports.
+
+A broker declares the columns it reads, by their names in the header, and how
+each value is converted, e.g.:
+
+  SCHEMA = schema.Schema(
+      schema.Column('symbol', 'Symbol'),
+      schema.Column('shares', 'Shares', int),
+  )
+
+Once the header of an export has been read, `Schema.compile` turns the schema
+into a decoder specialized for that header: a single expression which picks
+the values out of a row by position and converts them, returning a tuple in
+the order the columns were declared. Rows are then decoded without building a
+dict of the row or looking up any names.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Optional, Sequence
+
+import utils
+
+
+class Column:
+    """A column read from an export.
+
+    Args:
+      field: name by which the broker refers to the column
+      name: name of the column in the header of the export
+      convert: applied to the values of the column, if given
+    """
+
+    __slots__ = ('field', 'name', 'convert')
+
+    def __init__(self, field: str, name: str, convert: Optional[Callable[[str], Any]] = None):
+        self.field = field
+        self.name = name
+        self.convert = convert
+
+
+class Decoder:
+    """A schema compiled for a particular header.
+
+    `decode(row)` returns the values of the columns in `row`, converted, in
+    the order of the schema; `indices` maps the fields of the columns to
+    their positions in the row.
+    """
+
+    __slots__ = ('decode', 'indices')
+
+    def __init__(self, decode: Callable[[Sequence[str]], tuple], indices: dict[str, int]):
+        self.decode = decode
+        self.indices = indices
+
+
+class Schema:
+
+    def __init__(self, *columns: Column):
+        self.columns = columns
+
+    def compile(self, header: Sequence[str]) -> Decoder:
+        """Returns a decoder for the rows following `header`.
+
+        Raises:
+          utils.ValueError: if a column is missing from `header`
+        """
+        positions = {name: i for (i, name) in reversed(list(enumerate(header)))}
+        indices = {}
+        namespace: dict[str, Any] = {}
+        values = []
+        for (i, column) in enumerate(self.columns):
+            if column.name not in positions:
+                raise utils.ValueError('missing column %r in header: %s' %
+                                       (column.name, ','.join(header)))
+            indices[column.field] = positions[column.name]
+            value = 'row[%d]' % positions[column.name]
+            if column.convert is not None:
+                # Bound as defaults, so that they are looked up as locals.
+                namespace['convert%d' % i] = column.convert
+                value = 'convert%d(%s)' % (i, value)
+            values.append(value + ',')
+        params = ''.join(', %s=%s' % (name, name) for name in namespace)
+        # Only indices and the names above make it into the source.
+        decode = eval('lambda row%s: (%s)' % (params, ' '.join(values)), namespace)
+        return Decoder(decode, indices)
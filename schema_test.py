@@ -0,0 +1,51 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the schema module."""
+
+import unittest
+
+import schema
+import utils
+
+
+SCHEMA = schema.Schema(
+    schema.Column('symbol', 'Symbol'),
+    schema.Column('shares', 'Shares', int),
+    schema.Column('amount', 'Amount', lambda value: value.strip()),
+)
+
+
+class SchemaTest(unittest.TestCase):
+    def testDecode(self):
+        decoder = SCHEMA.compile(['Date', 'Amount', 'Symbol', 'Shares'])
+        self.assertEqual({'symbol': 2, 'shares': 3, 'amount': 1}, decoder.indices)
+        self.assertEqual(('ABC', 100, '12.50'),
+                         decoder.decode(['2011-01-12', ' 12.50 ', 'ABC', '100']))
+
+    def testFirstOfDuplicateColumns(self):
+        decoder = SCHEMA.compile(['Symbol', 'Shares', 'Amount', 'Symbol'])
+        self.assertEqual(('A', 1, 'x'), decoder.decode(['A', '1', 'x', 'B']))
+
+    def testNoColumns(self):
+        self.assertEqual((), schema.Schema().compile(['Symbol']).decode(['ABC']))
+
+    def testMissingColumn(self):
+        self.assertRaises(utils.ValueError, SCHEMA.compile, ['Symbol', 'Shares'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Output formats, as sinks which consume one transaction at a time.
+
+Since sinks are fed transactions one by one, a single pass over the parsed
+transactions can feed several of them at once.
+
+To define a new output format:
+1) Create a new class derived from `Sink`, whose constructor takes the same
+   arguments as `Sink.__init__`, and define `add` and `finish`.
+2) Add your class to the SINKS map below; its key is the `--outfmt` name.
+"""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import ClassVar, Optional, TextIO, Type
+
+import money
+import summary
+import utils
+
+
+# Number of TXF lines joined into each write to the output.
+WRITE_CHUNK_LINES = 4096
+
+
+def TxfHeaderLines(date: Optional[str]) -> list[str]:
+    if date is None:
+        date = utils.txfDate(datetime.today())
+    return [
+        'V042',  # Version
+        'Acsv2txf',  # Program name/version
+        'D%s' % date,  # Export date
+        '^',
+    ]
+
+
+def TxfRecordLines(txn: utils.Transaction) -> list[str]:
+    assert txn.entryCode is not None
+    assert txn.costCents is not None
+    assert txn.proceedsCents is not None
+    lines = [
+        'TD',
+        'N%d' % txn.entryCode,
+        'C1',
+        'L1',
+        'P%s' % txn.desc,
+        'D%s' % txn.buyDateStr,
+        'D%s' % txn.sellDateStr,
+        '$%s' % money.Format(txn.costCents),
+        '$%s' % money.Format(txn.proceedsCents),
+    ]
+    if txn.adjustmentCents:
+        lines.append('$%s' % money.Format(txn.adjustmentCents))
+    lines.append('^')
+    return lines
+
+
+class SummaryTotals:
+
+    def __init__(self):
+        self.num_txns = 0
+        # In cents.
+        self.total_cost = 0
+        self.total_sales = 0
+
+    def add(self, txn: utils.Transaction) -> None:
+        self.num_txns += 1
+        assert txn.costCents is not None
+        self.total_cost += txn.costCents
+        assert txn.proceedsCents is not None
+        self.total_sales += txn.proceedsCents
+
+    def format(self, name: str, tax_year: int) -> str:
+        return '\n'.join([
+            '%s summary report for %d' % (name, tax_year),
+            'Num sale txns:  %d' % self.num_txns,
+            'Total cost:     $%s' % money.Format(self.total_cost),
+            'Total proceeds: $%s' % money.Format(self.total_sales),
+            'Net gain/loss:  $%s' % money.Format(self.total_sales - self.total_cost),
+        ])
+
+
+class Sink(ABC):
+
+    def __init__(self, out: TextIO, name: str, tax_year: int, date: Optional[str]):
+        """Creates a sink writing to `out`.
+
+        Args:
+          out: where to write the output
+          name: name of the broker, for reports
+          tax_year: the tax year being reported
+          date: export date in the TXF format, or None for today
+        """
+        self.out = out
+        self.name = name
+        self.tax_year = tax_year
+        self.date = date
+
+    @abstractmethod
+    def add(self, txn: utils.Transaction) -> None:
+        ...
+
+    @abstractmethod
+    def finish(self) -> None:
+        """Writes any remaining output; no trailing newline is written."""
+        ...
+
+
+class TxfSink(Sink):
+
+    def __init__(self, out: TextIO, name: str, tax_year: int, date: Optional[str]):
+        super().__init__(out, name, tax_year, date)
+        self._chunk = ['\n'.join(TxfHeaderLines(date))]
+
+    def add(self, txn: utils.Transaction) -> None:
+        self._chunk.extend(TxfRecordLines(txn))
+        if len(self._chunk) > WRITE_CHUNK_LINES:
+            self.out.write('\n'.join(self._chunk))
+            # The empty string separates the next chunk from this one.
+            self._chunk = ['']
+
+    def finish(self) -> None:
+        if self._chunk != ['']:
+            self.out.write('\n'.join(self._chunk))
+        self._chunk = ['']
+
+
+class SummarySink(Sink):
+
+    def __init__(self, out: TextIO, name: str, tax_year: int, date: Optional[str]):
+        super().__init__(out, name, tax_year, date)
+        self.totals = SummaryTotals()
+
+    def add(self, txn: utils.Transaction) -> None:
+        self.totals.add(txn)
+
+    def finish(self) -> None:
+        self.out.write(self.totals.format(self.name, self.tax_year))
+
+
+class GroupedSummarySink(Sink):
+    """A summary with totals for each group of transactions."""
+
+    # How transactions are grouped; one of the keys of `summary.GROUPINGS`.
+    GROUP_BY: ClassVar[str]
+
+    def __init__(self, out: TextIO, name: str, tax_year: int, date: Optional[str]):
+        super().__init__(out, name, tax_year, date)
+        self.totals = summary.GroupedTotals(self.GROUP_BY)
+
+    def add(self, txn: utils.Transaction) -> None:
+        self.totals.add(txn)
+
+    def finish(self) -> None:
+        self.out.write(self.totals.format(self.name, self.tax_year))
+
+
+class SummaryByCodeSink(GroupedSummarySink):
+    GROUP_BY = 'code'
+
+
+class SummaryBySymbolSink(GroupedSummarySink):
+    """Totals for each symbol; Interactive Brokers exports have none."""
+
+    GROUP_BY = 'symbol'
+
+
+class SummaryByTermSink(GroupedSummarySink):
+    GROUP_BY = 'term'
+
+
+SINKS: dict[str, Type[Sink]] = {
+    'summary': SummarySink,
+    'summary-by-code': SummaryByCodeSink,
+    'summary-by-symbol': SummaryBySymbolSink,
+    'summary-by-term': SummaryByTermSink,
+    'txf': TxfSink,
+}
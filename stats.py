@@ -0,0 +1,253 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per-stage timers and counters for profiling a conversion.
+
+Instrumentation is off unless `Enable` has been called, in which case the
+module-level helpers record into the active `Stats`; otherwise they cost no
+more than a check for None. Stages nest: time spent in an inner stage (e.g.,
+parsing transactions pulled by the TXF writer) is charged to that stage only,
+so the reported stage times add up to the total.
+
+Stages which run on threads of their own (see the `pipeline` module) overlap
+instead, and report the CPU time of their threads with `AddTime`.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import sys
+import threading
+import time
+from typing import Iterable, Iterator, Optional, TextIO
+
+
+class Stats:
+
+    def __init__(self):
+        self.seconds: dict[str, float] = {}
+        self.counters: dict[str, int] = {}
+        self._start = time.perf_counter()
+        # Time spent in nested stages, for each open stage.
+        self._nested: list[float] = []
+        # Counters and times may also be updated from pipeline threads.
+        self._lock = threading.Lock()
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def addTime(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def _begin(self) -> float:
+        self._nested.append(0.0)
+        return time.perf_counter()
+
+    def _end(self, name: str, start: float) -> None:
+        elapsed = time.perf_counter() - start
+        nested = self._nested.pop()
+        self.addTime(name, elapsed - nested)
+        if self._nested:
+            self._nested[-1] += elapsed
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = self._begin()
+        try:
+            yield
+        finally:
+            self._end(name, start)
+
+    def timed(self, name: str, iterable: Iterable, counter: Optional[str]) -> Iterator:
+        iterator = iter(iterable)
+        while True:
+            start = self._begin()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._end(name, start)
+            if counter is not None:
+                self.count(counter)
+            yield item
+
+    def merge(self, data: dict) -> None:
+        """Adds the times and counters in `data`, from `toDict`, e.g., of a worker."""
+        for (name, seconds) in data['seconds'].items():
+            if name != 'total':
+                self.addTime(name, seconds)
+        for (name, value) in data['counters'].items():
+            self.count(name, value)
+
+    def total(self) -> float:
+        return time.perf_counter() - self._start
+
+    def toDict(self) -> dict:
+        return {
+            'seconds': dict(self.seconds, total=self.total()),
+            'counters': dict(self.counters),
+        }
+
+    def formatTable(self) -> str:
+        data = self.toDict()
+        lines = ['%-24s %12s' % ('stage', 'seconds')]
+        for (name, seconds) in data['seconds'].items():
+            lines.append('%-24s %12.6f' % (name, seconds))
+        lines.append('')
+        lines.append('%-24s %12s' % ('counter', 'value'))
+        for (name, value) in sorted(data['counters'].items()):
+            lines.append('%-24s %12d' % (name, value))
+        return '\n'.join(lines)
+
+    def formatJson(self) -> str:
+        return json.dumps(self.toDict(), indent=2)
+
+
+class _TimedWriter:
+    """Forwards writes to `out`, charging their time to the `write` stage."""
+
+    def __init__(self, stats: Stats, out: TextIO):
+        self._stats = stats
+        self._out = out
+
+    def write(self, data: str) -> int:
+        start = self._stats._begin()
+        try:
+            return self._out.write(data)
+        finally:
+            self._stats._end('write', start)
+            self._stats.count('chars_out', len(data))
+
+
+class Reading:
+    """Counts the bytes and lines read from a file, optionally reporting progress.
+
+    Does nothing unless stats are enabled when it is created.
+    """
+
+    # Minimum interval between progress reports, in seconds.
+    PROGRESS_INTERVAL = 0.5
+
+    def __init__(self, filename: str, size: int):
+        self._stats = ACTIVE
+        self._progress = _PROGRESS if ACTIVE is not None else None
+        self._filename = filename
+        self._size = size
+        self._offset = 0
+        self._start = time.perf_counter()
+        self._last_report = self._start
+
+    def __enter__(self) -> Reading:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def advance(self, data: bytes) -> None:
+        """Records that `data` has been read."""
+        if self._stats is None:
+            return
+        self._offset += len(data)
+        self._stats.count('bytes_in', len(data))
+        self._stats.count('lines_read', data.count(b'\n'))
+        if self._progress is not None:
+            now = time.perf_counter()
+            if now - self._last_report >= self.PROGRESS_INTERVAL:
+                self._last_report = now
+                self._report(now)
+
+    def _report(self, now: float) -> None:
+        assert self._progress is not None
+        elapsed = now - self._start
+        rate = self._offset / elapsed if elapsed else 0.0
+        fraction = self._offset / self._size if self._size else 1.0
+        eta = (self._size - self._offset) / rate if rate else 0.0
+        self._progress.write('\r%s: %5.1f%% (%.1f of %.1f MiB), %.1f MiB/s, ETA %ds ' % (
+            self._filename, fraction * 100, self._offset / (1 << 20),
+            self._size / (1 << 20), rate / (1 << 20), eta))
+        self._progress.flush()
+
+    def close(self) -> None:
+        if self._progress is not None:
+            self._report(time.perf_counter())
+            self._progress.write('\n')
+            self._progress = None
+
+
+ACTIVE: Optional[Stats] = None
+_PROGRESS: Optional[TextIO] = None
+
+
+def Enable(progress: Optional[TextIO] = None) -> Stats:
+    """Starts recording into a new `Stats`, reporting read progress to `progress`."""
+    global ACTIVE, _PROGRESS
+    ACTIVE = Stats()
+    _PROGRESS = progress
+    return ACTIVE
+
+
+def Disable() -> None:
+    global ACTIVE, _PROGRESS
+    ACTIVE = None
+    _PROGRESS = None
+
+
+def Count(name: str, n: int = 1) -> None:
+    if ACTIVE is not None:
+        ACTIVE.count(name, n)
+
+
+def AddTime(name: str, seconds: float) -> None:
+    if ACTIVE is not None:
+        ACTIVE.addTime(name, seconds)
+
+
+def Merge(data: dict) -> None:
+    if ACTIVE is not None:
+        ACTIVE.merge(data)
+
+
+def Stage(name: str) -> contextlib.AbstractContextManager:
+    if ACTIVE is None:
+        return contextlib.nullcontext()
+    return ACTIVE.stage(name)
+
+
+def Timed(name: str, iterable: Iterable, counter: Optional[str] = None) -> Iterable:
+    """Charges the time taken to produce each item to stage `name`.
+
+    If `counter` is given, it counts the items produced.
+    """
+    if ACTIVE is None:
+        return iterable
+    return ACTIVE.timed(name, iterable, counter)
+
+
+def TimedWriter(out: TextIO) -> TextIO:
+    if ACTIVE is None:
+        return out
+    return _TimedWriter(ACTIVE, out)  # type: ignore[return-value]
+
+
+def Report(fmt: str, out: TextIO = sys.stderr) -> None:
+    if ACTIVE is None:
+        return
+    if fmt == 'json':
+        out.write(ACTIVE.formatJson() + '\n')
+    else:
+        out.write(ACTIVE.formatTable() + '\n')
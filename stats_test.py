@@ -0,0 +1,69 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the stats module."""
+
+import io
+import json
+import os
+import time
+import unittest
+
+import csv2txf
+import stats
+
+
+class StatsTest(unittest.TestCase):
+    def tearDown(self):
+        stats.Disable()
+
+    def testDisabledIsPassThrough(self):
+        items = [1, 2, 3]
+        self.assertIs(items, stats.Timed('parse', items))
+        out = io.StringIO()
+        self.assertIs(out, stats.TimedWriter(out))
+        stats.Count('ignored')
+
+    def testNestedStagesAreExclusive(self):
+        s = stats.Enable()
+
+        def Slow():
+            for i in range(3):
+                time.sleep(0.01)
+                yield i
+
+        with stats.Stage('outer'):
+            self.assertEqual([0, 1, 2], list(stats.Timed('inner', Slow(), 'items')))
+        self.assertGreaterEqual(s.seconds['inner'], 0.03)
+        self.assertLess(s.seconds['outer'], 0.01)
+        self.assertEqual(3, s.counters['items'])
+
+    def testConverterCounters(self):
+        s = stats.Enable()
+        out = io.StringIO()
+        csv2txf.StreamConverter('tdameritrade', 'testdata/tdameritrade.csv', 2011, None, out)
+        self.assertEqual(os.path.getsize('testdata/tdameritrade.csv'), s.counters['bytes_in'])
+        self.assertEqual(5, s.counters['lines_read'])
+        self.assertEqual(3, s.counters['wrong_year'])
+        self.assertEqual(len(out.getvalue()), s.counters['chars_out'])
+        self.assertEqual({'detect', 'parse', 'render', 'write'}, set(s.seconds))
+
+        data = json.loads(s.formatJson())
+        self.assertIn('total', data['seconds'])
+
+
+if __name__ == '__main__':
+    unittest.main()
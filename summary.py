@@ -0,0 +1,147 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Summaries of transactions grouped by entry code, term or symbol.
+
+As transactions are added, their amounts in cents are appended to compact
+`array` columns, along with the index of their group; the totals of all groups
+are then computed in bulk, using NumPy if it is installed and plain Python
+otherwise. Integer sums are exact, so the results do not depend on the order
+in which amounts are added up. NumPy is only imported once totals are first
+computed, as this module is imported on every run.
+
+Only TD Ameritrade and Vanguard transactions have a symbol; Interactive
+Brokers exports describe securities by name, so its transactions are all
+totalled as "(unknown)" when grouped by symbol.
+"""
+
+from __future__ import annotations
+
+from array import array
+from typing import Any, Callable
+
+import money
+import utils
+
+
+# The NumPy module once it has been imported, None if it is not installed, or
+# `_NOT_IMPORTED` before it is first needed.
+_NOT_IMPORTED = object()
+numpy: Any = _NOT_IMPORTED
+
+
+def _NumPy() -> Any:
+    global numpy
+    if numpy is _NOT_IMPORTED:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy = module
+    return numpy
+
+
+# The term of each entry code.
+TERMS = {
+    321: 'short',
+    711: 'short',
+    712: 'short',
+    323: 'long',
+    713: 'long',
+    714: 'long',
+}
+
+# How to find the group of a transaction, for each way of grouping them.
+GROUPINGS: dict[str, tuple[str, Callable[[utils.Transaction], str]]] = {
+    'code': ('Entry code', lambda txn: str(txn.entryCode)),
+    'symbol': ('Symbol', lambda txn: txn.symbol or '(unknown)'),
+    'term': ('Term', lambda txn: TERMS.get(txn.entryCode or 0, 'unknown')),
+}
+
+
+def _Aggregate(ids: array, columns: list[array], num_groups: int) -> tuple[list[int], list[list[int]]]:
+    """Returns the number of rows and the sum of each column for each group."""
+    numpy = _NumPy()
+    if numpy is not None and len(ids):
+        group = numpy.frombuffer(ids, dtype=numpy.int64)
+        counts = numpy.bincount(group, minlength=num_groups)
+        sums = []
+        for column in columns:
+            # Unlike `bincount` with weights, which sums floats, `add.at`
+            # keeps the sums in exact integers.
+            total = numpy.zeros(num_groups, dtype=numpy.int64)
+            numpy.add.at(total, group, numpy.frombuffer(column, dtype=numpy.int64))
+            sums.append(total.tolist())
+        return (counts.tolist(), sums)
+
+    counts = [0] * num_groups
+    for i in ids:
+        counts[i] += 1
+    sums = []
+    for column in columns:
+        total = [0] * num_groups
+        for (i, value) in zip(ids, column):
+            total[i] += value
+        sums.append(total)
+    return (counts, sums)
+
+
+class GroupedTotals:
+
+    def __init__(self, group_by: str):
+        """Creates totals grouped by `group_by`, one of the keys of `GROUPINGS`."""
+        (self.title, self._key) = GROUPINGS[group_by]
+        self._groups: dict[str, int] = {}
+        self._ids = array('q')
+        self._cost = array('q')
+        self._proceeds = array('q')
+
+    def add(self, txn: utils.Transaction) -> None:
+        assert txn.costCents is not None
+        assert txn.proceedsCents is not None
+        key = self._key(txn)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = len(self._groups)
+        self._ids.append(group)
+        self._cost.append(txn.costCents)
+        self._proceeds.append(txn.proceedsCents)
+
+    def totals(self) -> list[tuple[str, int, int, int]]:
+        """Returns (group, number of txns, total cost, total proceeds), sorted by group.
+
+        The totals are in cents.
+        """
+        (counts, (costs, proceeds)) = _Aggregate(
+            self._ids, [self._cost, self._proceeds], len(self._groups))
+        rows = [(key, counts[group], costs[group], proceeds[group])
+                for (key, group) in self._groups.items()]
+        rows.sort()
+        return rows
+
+    def format(self, name: str, tax_year: int) -> str:
+        rows = self.totals()
+        total = ('Total', sum(row[1] for row in rows),
+                 sum(row[2] for row in rows), sum(row[3] for row in rows))
+        width = max([len(self.title), len(total[0])] + [len(row[0]) for row in rows])
+        lines = [
+            '%s summary report for %d by %s' % (name, tax_year, self.title.lower()),
+            '%-*s %9s %16s %16s %16s' % (width, self.title, 'Num txns', 'Total cost',
+                                         'Total proceeds', 'Net gain/loss'),
+        ]
+        for (key, count, cost, sales) in rows + [total]:
+            lines.append('%-*s %9d %16s %16s %16s' % (
+                width, key, count, '$%s' % money.Format(cost), '$%s' % money.Format(sales),
+                '$%s' % money.Format(sales - cost)))
+        return '\n'.join(lines)
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the summary module."""
+
+from decimal import Decimal
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import benchmark
+from brokers import BROKERS
+import money
+import summary
+import utils
+
+
+class GroupedTotalsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def Parse(self, broker_name, rows):
+        filename = os.path.join(self.tmpdir, broker_name + '.csv')
+        benchmark.Generate(broker_name, filename, rows, seed=1, tax_year=2020)
+        return BROKERS[broker_name].parseFileToTxnList(filename, 2020)
+
+    def DecimalTotals(self, group_by, txns):
+        """The same totals, added up one Decimal at a time."""
+        key = summary.GROUPINGS[group_by][1]
+        totals = {}
+        for txn in txns:
+            row = totals.setdefault(key(txn), [0, Decimal(0), Decimal(0)])
+            row[0] += 1
+            row[1] += txn.costBasis
+            row[2] += txn.saleProceeds
+        return sorted((k, count, money.FromDecimal(cost), money.FromDecimal(sales))
+                      for (k, (count, cost, sales)) in totals.items())
+
+    def Totals(self, group_by, txns):
+        totals = summary.GroupedTotals(group_by)
+        for txn in txns:
+            totals.add(txn)
+        return totals.totals()
+
+    def testMatchesDecimals(self):
+        for broker_name in ('ib', 'tdameritrade', 'vanguard'):
+            txns = self.Parse(broker_name, 500)
+            for group_by in summary.GROUPINGS:
+                self.assertEqual(self.DecimalTotals(group_by, txns),
+                                 self.Totals(group_by, txns), (broker_name, group_by))
+
+    def testMatchesDecimalsWithoutNumpy(self):
+        txns = self.Parse('ib', 500)
+        numpy = summary.numpy
+        summary.numpy = None
+        try:
+            self.assertEqual(self.DecimalTotals('code', txns), self.Totals('code', txns))
+        finally:
+            summary.numpy = numpy
+
+    def testNumpyIsImportedLazily(self):
+        script = 'import sys; import csv2txf; print("numpy" in sys.modules)'
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True,
+                                text=True, check=True).stdout
+        self.assertEqual('False\n', output)
+
+    def testFormat(self):
+        totals = summary.GroupedTotals('symbol')
+        totals.add(utils.Transaction(costCents=1000, proceedsCents=1250, symbol='ABC'))
+        totals.add(utils.Transaction(costCents=500, proceedsCents=400))
+        self.assertEqual('\n'.join([
+            'Broker summary report for 2020 by symbol',
+            'Symbol     Num txns       Total cost   Total proceeds    Net gain/loss',
+            '(unknown)         1            $5.00            $4.00           $-1.00',
+            'ABC               1           $10.00           $12.50            $2.50',
+            'Total             2           $15.00           $16.50            $1.50',
+        ]), totals.format('Broker', 2020))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -25,43 +25,85 @@ Does not handle:
 
 from __future__ import annotations
 
-import csv
 from datetime import datetime
 from decimal import Decimal
+import functools
 import re
-from typing import Optional
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 from broker import Broker
+import diagnostics
+import headers
+import money
+import schema
 from typing_extensions import override
 import utils
 
 
-FIRST_LINE = ','.join([
-    'Security', 'Trans type', 'Qty', 'Open date', 'Adj cost',
-    'Close date', 'Adj proceeds', 'Adj gain($)', 'Adj gain(%)',
-    'Term\n'])
+FIRST_LINE = headers.TDAMERITRADE
 
 TRANSACTION_TYPE = 'Trans type'
 
+# The number of rows in a chunk of a file, its first row, if any, and the rows
+# which may be the summary line, with their indices; see `summarizeRows`.
+_Summary = Tuple[int, List[List[str]], List[Tuple[int, List[str]]]]
+
+
+def _EntryCode(term: str) -> int:
+    if term == 'Short-term':
+        # TODO(mbrukman): assert here that (sellDate - buyDate) <= 1 year
+        return 321  # "ST gain/loss - security"
+    else:
+        # TODO(mbrukman): assert here that (sellDate - buyDate) > 1 year
+        return 323  # "LT gain/loss - security"
+
 
 class TDAmeritrade(Broker):
 
+    HEADER = FIRST_LINE
+    RESUMABLE = True
+    SPLITTABLE = True
+    TRAILER = 'Total:,'
+
+    # The amounts and the date of purchase are only decoded once they are
+    # used; see `_DecodeTxn`.
+    SCHEMA = schema.Schema(
+        schema.Column('security', 'Security'),
+        schema.Column('qty', 'Qty'),
+        schema.Column('open_date', 'Open date'),
+        schema.Column('cost', 'Adj cost'),
+        schema.Column('close_date', 'Close date',
+                      functools.partial(utils.parseDate, fmt=utils.DATE_FORMAT_MDY)),
+        schema.Column('proceeds', 'Adj proceeds'),
+        schema.Column('entry_code', 'Term', _EntryCode),
+    )
+
     @classmethod
     @override
     def name(cls) -> str:
         return "TD Ameritrade"
 
+    @classmethod
+    def parsedBuyDate(cls, txn: dict[str, str]) -> tuple[datetime, str]:
+        """Returns date of purchase as datetime object and TXF string."""
+        # Our input date format is MM/DD/YYYY.
+        return utils.parseDate(txn['Open date'], utils.DATE_FORMAT_MDY)
+
+    @classmethod
+    def parsedSellDate(cls, txn: dict[str, str]) -> tuple[datetime, str]:
+        """Returns date of sale as datetime object and TXF string."""
+        # Our input date format is MM/DD/YYYY.
+        return utils.parseDate(txn['Close date'], utils.DATE_FORMAT_MDY)
+
     @classmethod
     def buyDate(cls, txn: dict[str, str]) -> datetime:
         """Returns date of transaction as datetime object."""
-        # Our input date format is MM/DD/YYYY.
-        return datetime.strptime(txn['Open date'], '%m/%d/%Y')
+        return cls.parsedBuyDate(txn)[0]
 
     @classmethod
     def sellDate(cls, txn: dict[str, str]) -> datetime:
         """Returns date of transaction as datetime object."""
-        # Our input date format is MM/DD/YYYY.
-        return datetime.strptime(txn['Close date'], '%m/%d/%Y')
+        return cls.parsedSellDate(txn)[0]
 
     @classmethod
     def isShortTerm(cls, txn: dict[str, str]) -> bool:
@@ -69,80 +111,126 @@ class TDAmeritrade(Broker):
 
     @classmethod
     def symbol(cls, txn: dict[str, str]) -> str:
-        match = re.match(r'^.*\((.*)\)$', txn['Security'])
-        if match:
-            return match.group(1)
-        else:
-            raise Exception('Security symbol not found in: %s' % txn)
+        return _Symbol(txn['Security'])
+
+    @classmethod
+    def desc(cls, txn: dict[str, str]) -> str:
+        return _Describe(txn['Qty'], txn['Security'])
 
     @classmethod
     def numShares(cls, txn: dict[str, str]) -> Decimal:
         return Decimal(txn['Qty'])
 
     @classmethod
-    def costBasis(cls, txn: dict[str, str]) -> Decimal:
-        # Proceeds amount may include commas as thousand separators, which
-        # Decimal does not handle.
-        return Decimal(txn['Adj cost'].replace(',', ''))
+    def costBasis(cls, txn: dict[str, str]) -> int:
+        # In cents; amounts may include commas as thousand separators.
+        return money.Parse(txn['Adj cost'])
 
     @classmethod
-    def saleProceeds(cls, txn: dict[str, str]) -> Decimal:
-        # Proceeds amount may include commas as thousand separators, which
-        # Decimal does not handle.
-        return Decimal(txn['Adj proceeds'].replace(',', ''))
+    def saleProceeds(cls, txn: dict[str, str]) -> int:
+        # In cents; amounts may include commas as thousand separators.
+        return money.Parse(txn['Adj proceeds'])
 
     @classmethod
     @override
-    def isFileForBroker(cls, filename: str) -> bool:
-        with open(filename) as f:
-            first_line = f.readline()
-            return first_line == FIRST_LINE
+    def iterTxnsFromRows(cls, rows: Iterable[list[str]],
+                         tax_year: Optional[int]) -> Iterator[utils.Transaction]:
+        return cls.resumeTxnsFromRows(rows, tax_year, {})
 
     @classmethod
     @override
-    def parseFileToTxnList(cls, filename: str, tax_year: Optional[int]) -> list[utils.Transaction]:
-        txns = csv.reader(open(filename), delimiter=',', quotechar='"')
-        line_num = 0
-        txn_list: list[utils.Transaction] = []
-        names: list[str] = []
-        for row in txns:
+    def resumeTxnsFromRows(cls, rows: Iterable[list[str]], tax_year: Optional[int],
+                           state: dict) -> Iterator[utils.Transaction]:
+        if state.get('done'):
+            return
+        line_num = state.get('line_num', 0)
+        decoder = cls.SCHEMA.compile(state['names']) if 'names' in state else None
+        for row in rows:
             line_num = line_num + 1
-            if line_num == 1:
-                names = row
+            if decoder is None:
+                decoder = cls.SCHEMA.compile(row)
+                state['names'] = row
                 continue
 
-            txn_dict = {}
-            for i in range(0, len(names)):
-                txn_dict[names[i]] = row[i]
-
-            if txn_dict['Security'] == 'Total:':
+            if row[decoder.indices['security']] == 'Total:':
                 # This is the summary line where the string 'Total:' appears in
                 # the first column, so we're done.
+                state['done'] = True
                 break
 
-            curr_txn = utils.Transaction()
-            curr_txn.desc = '%s shares %s' % (
-                cls.numShares(txn_dict), cls.symbol(txn_dict))
-            buyDate = cls.buyDate(txn_dict)
-            curr_txn.buyDateStr = utils.txfDate(buyDate)
-            curr_txn.costBasis = cls.costBasis(txn_dict)
-            sellDate = cls.sellDate(txn_dict)
-            curr_txn.sellDateStr = utils.txfDate(sellDate)
-            curr_txn.saleProceeds = cls.saleProceeds(txn_dict)
-
-            assert sellDate >= buyDate, f'Sell date ({sellDate}) must be on or after buy date ({buyDate})'
-            if cls.isShortTerm(txn_dict):
-                # TODO(mbrukman): assert here that (sellDate - buyDate) <= 1 year
-                curr_txn.entryCode = 321  # "ST gain/loss - security"
-            else:
-                # TODO(mbrukman): assert here that (sellDate - buyDate) > 1 year
-                curr_txn.entryCode = 323  # "LT gain/loss - security"
-
+            (security, qty, open_date, cost, (sellDate, sellDateStr), proceeds,
+             entryCode) = decoder.decode(row)
             if tax_year and sellDate.year != tax_year:
-                utils.Warning('ignoring txn: "%s" (line %d) as the sale is not from %d' %
-                              (curr_txn.desc, line_num, tax_year))
+                diagnostics.Report(diagnostics.WRONG_YEAR,
+                                   'ignoring txn: "%s" (line %d) as the sale is not from %d',
+                                   utils.LazyStr(_Describe, qty, security), line_num, tax_year)
                 continue
 
-            txn_list.append(curr_txn)
+            raw = (qty, security, open_date, cost, proceeds, sellDate, line_num)
+            yield utils.Transaction.lazy(_DecodeTxn, raw,
+                                         sellDateStr=sellDateStr, entryCode=entryCode)
+        state['line_num'] = line_num
 
-        return txn_list
+    @classmethod
+    @override
+    def summarizeRows(cls, rows: Iterable[list[str]]) -> _Summary:
+        num_rows = 0
+        first: list[list[str]] = []
+        totals = []
+        for (num_rows, row) in enumerate(rows, 1):
+            if num_rows == 1:
+                first.append(row)
+            if 'Total:' in row:
+                totals.append((num_rows - 1, row))
+        return (num_rows, first, totals)
+
+    @classmethod
+    @override
+    def advanceState(cls, state: dict, summary: _Summary) -> None:
+        if state.get('done'):
+            return
+        (num_rows, first, totals) = summary
+        line_num = state.get('line_num', 0)
+        if not line_num and first:
+            state['names'] = first[0]
+        if state.get('names'):
+            security = state['names'].index('Security')
+            for (i, row) in totals:
+                if line_num + i and len(row) > security and row[security] == 'Total:':
+                    state['done'] = True
+                    return
+        state['line_num'] = line_num + num_rows
+
+
+def _DecodeTxn(txn: utils.Transaction, raw: tuple) -> None:
+    (qty, security, open_date, cost, proceeds, sellDate, line_num) = raw
+    try:
+        txn.desc = _Describe(qty, security)
+        txn.symbol = _Symbol(security)
+        txn.shares = Decimal(qty)
+        (buyDate, txn.buyDateStr) = utils.parseDate(open_date, utils.DATE_FORMAT_MDY)
+        txn.costCents = money.Parse(cost)
+        txn.proceedsCents = money.Parse(proceeds)
+        assert sellDate >= buyDate, \
+            f'Sell date ({sellDate}) must be on or after buy date ({buyDate})'
+    except Exception as e:
+        # This runs when a field is first read, e.g., while rendering, long
+        # after the row was parsed; so name the row.
+        raise utils.ValueError('line %d: %s' % (line_num, e)) from e
+
+
+@functools.lru_cache(maxsize=4096)
+def _Describe(qty: str, security: str) -> str:
+    # The same lot sizes and securities recur throughout large exports, so
+    # cache the description rather than re-running the regex and formatting
+    # for every row; this also shares the resulting strings between rows.
+    return '%s shares %s' % (Decimal(qty), _Symbol(security))
+
+
+@functools.lru_cache(maxsize=4096)
+def _Symbol(security: str) -> str:
+    match = re.match(r'^.*\((.*)\)$', security)
+    if match:
+        return match.group(1)
+    else:
+        raise Exception('Security symbol not found in: %s' % security)
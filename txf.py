@@ -0,0 +1,265 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reads back TXF files written by csv2txf, and merges and compares them.
+
+`csv2txf.py merge [options] FILE...` combines several TXF files, e.g., one per
+account, into one, ordered by entry code and date of sale. The inputs are
+merged a record at a time, once each is in that order. csv2txf writes records
+in the order of the export, so inputs are first checked, a record at a time,
+and sorted in memory if they are out of order; files which are in order
+already (e.g., merged before) are then merged as they are read again, in
+constant memory. Streams, which cannot be read twice, are always sorted.
+
+`csv2txf.py diff [options] EXPECTED ACTUAL` compares two TXF files record by
+record, e.g., a large output against its golden, and reports the fields which
+differ; the records are compared as they are read, and only those which differ
+are decoded.
+
+Inputs may be compressed, or `-` for stdin, as those of the converter may.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import sys
+from typing import Iterable, Iterator, Optional, Sequence, TextIO
+
+import csvrows
+import money
+import sinks
+import utils
+
+
+# The lines of a record, in order; the adjustment is optional.
+RECORD_FIELDS = ('type', 'entry code', 'copy', 'line', 'description', 'buy date',
+                 'sell date', 'cost', 'proceeds', 'adjustment')
+
+
+def _Lines(source: csvrows.Source) -> Iterator[str]:
+    for block in csvrows.ReadBlocks(source):
+        yield from block.decode('utf-8').splitlines()
+
+
+class TxfReader:
+    """Reads a TXF file as written by `sinks.TxfSink`, a record at a time.
+
+    The header is read when the reader is created; iterating over the reader
+    yields the transactions of the records which follow it, once only.
+    """
+
+    def __init__(self, source: csvrows.Source):
+        self.name = str(source)
+        self._lines = enumerate(_Lines(source), 1)
+        records = self.records()
+        header = next(records, None)
+        if (header is None or len(header[1]) != 3 or header[1][0] != 'V042'
+                or header[1][1][:1] != 'A' or header[1][2][:1] != 'D'):
+            raise utils.ValueError('%s: not a TXF file written by csv2txf' % self.name)
+        self.program = header[1][1][1:]
+        self.date = header[1][2][1:]
+
+    def records(self) -> Iterator[tuple[int, list[str]]]:
+        """Yields the lines of each record, with the number of its first line."""
+        record: list[str] = []
+        start = 1
+        for (line_num, line) in self._lines:
+            if line != '^':
+                if not record:
+                    start = line_num
+                record.append(line)
+                continue
+            yield (start, record)
+            record = []
+        if record:
+            raise utils.ValueError('%s:%d: record is not terminated by `^`' % (self.name, start))
+
+    def __iter__(self) -> Iterator[utils.Transaction]:
+        for (line_num, record) in self.records():
+            if (not 9 <= len(record) <= 10 or record[0] != 'TD' or record[1][:1] != 'N'
+                    or record[2] != 'C1' or record[3] != 'L1' or record[4][:1] != 'P'
+                    or record[5][:1] != 'D' or record[6][:1] != 'D'
+                    or any(line[:1] != '$' for line in record[7:])
+                    or not record[1][1:].isdigit()):
+                raise utils.ValueError('%s:%d: unexpected TXF record: %s' %
+                                       (self.name, line_num, ' '.join(record)))
+            sellDateStr = record[6][1:]
+            sell = utils.tryParseDate(sellDateStr, utils.DATE_FORMAT_MDY)
+            raw = (self.name, line_num) + tuple(line[1:] for line in record[4:6] + record[7:])
+            yield utils.Transaction.lazy(
+                _DecodeRecord, raw, entryCode=int(record[1][1:]), sellDateStr=sellDateStr,
+                sellDate=sell[0] if sell else None)
+
+
+def _DecodeRecord(txn: utils.Transaction, raw: tuple) -> None:
+    (name, line_num, txn.desc, txn.buyDateStr) = raw[:4]
+    buy = utils.tryParseDate(txn.buyDateStr, utils.DATE_FORMAT_MDY)
+    if buy:
+        txn.buyDate = buy[0]
+    try:
+        txn.costCents = money.Parse(raw[4])
+        txn.proceedsCents = money.Parse(raw[5])
+        if len(raw) > 6:
+            txn.adjustmentCents = money.Parse(raw[6])
+    except utils.ValueError as e:
+        # Decoded once the amounts are first read, so name the record.
+        raise utils.ValueError('%s:%d: %s' % (name, line_num, e)) from e
+
+
+def SortKey(txn: utils.Transaction) -> tuple[int, int]:
+    """The order of merged records: by entry code, then date of sale.
+
+    Sales without a date (e.g., `VARIOUS`) come first.
+    """
+    assert txn.entryCode is not None
+    return (txn.entryCode, txn.sellDate.toordinal() if txn.sellDate else 0)
+
+
+def _IsOrdered(txns: Iterable[utils.Transaction]) -> bool:
+    keys = map(SortKey, txns)
+    last = next(keys, None)
+    for key in keys:
+        if key < last:
+            return False
+        last = key
+    return True
+
+
+def Ordered(reader: TxfReader, source: csvrows.Source) -> Iterable[utils.Transaction]:
+    """Returns the transactions of `reader`, which reads `source`, in `SortKey` order.
+
+    A plain file is read twice if it is in order already, rather than held in
+    memory; transactions which compare equal keep their order.
+    """
+    if csvrows.IsPlainFile(source):
+        if _IsOrdered(reader):
+            return TxfReader(source)
+        reader = TxfReader(source)
+    return sorted(reader, key=SortKey)
+
+
+def Merge(readers: Sequence[TxfReader],
+          sources: Sequence[csvrows.Source]) -> Iterator[utils.Transaction]:
+    """Merges the transactions of `readers`, of `sources`, in `SortKey` order.
+
+    Transactions which compare equal keep the order of `readers`.
+    """
+    return heapq.merge(*(Ordered(reader, source) for (reader, source) in zip(readers, sources)),
+                       key=SortKey)
+
+
+def WriteMerged(sources: Sequence[csvrows.Source], out: TextIO,
+                date: Optional[str] = None) -> int:
+    """Writes the merged records of `sources` to `out` as TXF; returns their number.
+
+    The export date is `date`, or by default, that of the first source.
+    """
+    readers = [TxfReader(source) for source in sources]
+    if date is None and readers:
+        date = readers[0].date
+    # The tax year is not part of TXF output.
+    sink = sinks.TxfSink(out, '', 0, date)
+    num_txns = 0
+    for txn in Merge(readers, sources):
+        sink.add(txn)
+        num_txns += 1
+    sink.finish()
+    return num_txns
+
+
+def _DescribeDiff(expected: list[str], actual: list[str]) -> str:
+    diffs = []
+    for (i, (a, b)) in enumerate(itertools.zip_longest(expected, actual, fillvalue='')):
+        if a != b:
+            field = RECORD_FIELDS[i] if i < len(RECORD_FIELDS) else 'line %d' % (i + 1)
+            diffs.append('%s: %r != %r' % (field, a[1:] if i else a, b[1:] if i else b))
+    return '; '.join(diffs)
+
+
+def Diff(expected: csvrows.Source, actual: csvrows.Source, out: TextIO,
+         max_diffs: int = 10, ignore_date: bool = False) -> int:
+    """Writes the differences between two TXF files to `out`; returns their number.
+
+    Records are compared in order, and each record which differs counts as
+    one difference, as does a differing header; only the first `max_diffs`
+    are described.
+    """
+    (a, b) = (TxfReader(expected), TxfReader(actual))
+    num_diffs = 0
+
+    def Report(text: str) -> None:
+        nonlocal num_diffs
+        num_diffs += 1
+        if num_diffs <= max_diffs:
+            out.write(text + '\n')
+
+    if a.program != b.program or (a.date != b.date and not ignore_date):
+        Report('header: %s != %s' % ('A%s D%s' % (a.program, a.date),
+                                     'A%s D%s' % (b.program, b.date)))
+    num_records = 0
+    for (num_records, (x, y)) in enumerate(itertools.zip_longest(a.records(), b.records()), 1):
+        if x is None:
+            Report('record %d (line %d): only in %s' % (num_records, y[0], b.name))
+        elif y is None:
+            Report('record %d (line %d): only in %s' % (num_records, x[0], a.name))
+        elif x[1] != y[1]:
+            Report('record %d (lines %d and %d): %s' %
+                   (num_records, x[0], y[0], _DescribeDiff(x[1], y[1])))
+    if num_diffs > max_diffs:
+        out.write('... and %d more\n' % (num_diffs - max_diffs))
+    if num_diffs:
+        out.write('%d differences in %d records\n' % (num_diffs, num_records))
+    return num_diffs
+
+
+def _Source(filename: str) -> csvrows.Source:
+    return csvrows.Input(sys.stdin.buffer, '<stdin>') if filename == '-' else filename
+
+
+def main(argv: list[str]) -> None:
+    """Runs `csv2txf.py merge` or `csv2txf.py diff`; `argv` starts with which."""
+    from optparse import OptionParser
+    command = argv[0]
+    if command == 'merge':
+        parser = OptionParser(usage='%prog merge [options] FILE...')
+        parser.add_option("-o", "--outfile", dest="out_filename",
+                          help="output file, leave empty for stdout")
+        parser.add_option("--date", dest="date",
+                          help="date to output in TXF file (default: that of the "
+                               "first input)")
+    else:
+        parser = OptionParser(usage='%prog diff [options] EXPECTED ACTUAL')
+        parser.add_option("--max-diffs", dest="max_diffs", type="int", default=10,
+                          help="number of differences described (default: %default)")
+        parser.add_option("--ignore-date", dest="ignore_date", action="store_true",
+                          default=False, help="ignore the export dates")
+    (options, args) = parser.parse_args(argv[1:])
+
+    if command == 'merge':
+        if not args:
+            parser.error('no inputs given')
+        sources = [_Source(filename) for filename in args]
+        if options.out_filename:
+            with open(options.out_filename, 'w') as out:
+                WriteMerged(sources, out, options.date)
+        else:
+            WriteMerged(sources, sys.stdout, options.date)
+            sys.stdout.write('\n')
+    else:
+        if len(args) != 2:
+            parser.error('expected two inputs')
+        num_diffs = Diff(_Source(args[0]), _Source(args[1]), sys.stdout,
+                         options.max_diffs, options.ignore_date)
+        sys.exit(1 if num_diffs else 0)
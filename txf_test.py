@@ -0,0 +1,164 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the txf module."""
+
+import gzip
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import csvrows
+import txf
+import utils
+
+
+GOLDENS = ['testdata/tdameritrade.out', 'testdata/vanguard.out',
+           'testdata/interactive_brokers.out']
+
+
+def Read(filename):
+    with open(filename) as f:
+        return f.read()
+
+
+class TxfTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.err = io.StringIO()
+        self.addCleanup(setattr, sys, 'stderr', sys.stderr)
+        sys.stderr = self.err
+
+    def Write(self, name, data):
+        filename = os.path.join(self.tmpdir, name)
+        with open(filename, 'w') as f:
+            f.write(data)
+        return filename
+
+    def testReadHeader(self):
+        reader = txf.TxfReader('testdata/vanguard.out')
+        self.assertEqual('csv2txf', reader.program)
+        self.assertEqual('04/15/2012', reader.date)
+        txns = list(reader)
+        self.assertEqual(2, len(txns))
+        self.assertEqual(321, txns[0].entryCode)
+        self.assertEqual('300 shares ABC', txns[0].desc)
+        self.assertEqual(23456, txns[0].costCents)
+
+    def testRoundTrip(self):
+        # Unlike the other goldens, that of Interactive Brokers is not in order.
+        for filename in GOLDENS[:2]:
+            out = io.StringIO()
+            txf.WriteMerged([filename], out)
+            self.assertEqual(Read(filename), out.getvalue(), filename)
+
+    def testMergeOrder(self):
+        out = io.StringIO()
+        num_txns = txf.WriteMerged(GOLDENS[:2], out, '01/01/2024')
+        txns = list(txf.TxfReader(csvrows.Input(io.BytesIO(out.getvalue().encode()))))
+        self.assertEqual(num_txns, len(txns))
+        self.assertEqual(sorted(txns, key=txf.SortKey), txns)
+        self.assertIn('\nD01/01/2024\n', out.getvalue())
+        self.assertEqual('', self.err.getvalue())
+
+    def testMergeIsStable(self):
+        first = self.Write('first.txf', Read('testdata/vanguard.out').replace('shares', 'units'))
+        out = io.StringIO()
+        txf.WriteMerged([first, 'testdata/vanguard.out'], out)
+        descs = [txn.desc for txn in txf.TxfReader(
+            csvrows.Input(io.BytesIO(out.getvalue().encode())))]
+        self.assertEqual(['300 units ABC', '300 shares ABC',
+                          '100 units XYZ', '100 shares XYZ'], descs)
+
+    def testUnorderedInput(self):
+        golden = Read('testdata/interactive_brokers.out')
+        expected = sorted(map(str, txf.TxfReader('testdata/interactive_brokers.out')))
+        for source in ('testdata/interactive_brokers.out',
+                       csvrows.Input(io.BytesIO(golden.encode()))):
+            out = io.StringIO()
+            txf.WriteMerged([source], out)
+            self.assertNotEqual(golden, out.getvalue())
+            txns = list(txf.TxfReader(csvrows.Input(io.BytesIO(out.getvalue().encode()))))
+            self.assertEqual(sorted(txns, key=txf.SortKey), txns)
+            self.assertEqual(expected, sorted(map(str, txns)))
+        # The merged output is in order, so merging it again leaves it as is.
+        merged = self.Write('merged.txf', out.getvalue())
+        again = io.StringIO()
+        txf.WriteMerged([merged], again)
+        self.assertEqual(out.getvalue(), again.getvalue())
+        self.assertEqual('', self.err.getvalue())
+
+    def testCompressedInput(self):
+        filename = os.path.join(self.tmpdir, 'vanguard.txf.gz')
+        with gzip.open(filename, 'wt') as f:
+            f.write(Read('testdata/vanguard.out'))
+        out = io.StringIO()
+        txf.WriteMerged([filename], out)
+        self.assertEqual(Read('testdata/vanguard.out'), out.getvalue())
+
+    def testNotTxf(self):
+        self.assertRaises(utils.ValueError, txf.TxfReader, 'testdata/vanguard.csv')
+
+    def testInvalidRecord(self):
+        filename = self.Write('bad.txf', Read('testdata/vanguard.out').replace('N321', 'Nxyz'))
+        self.assertRaises(utils.ValueError, list, txf.TxfReader(filename))
+
+    def testInvalidAmount(self):
+        filename = self.Write('bad.txf', Read('testdata/vanguard.out').replace('$234.56', '$2x4'))
+        txns = list(txf.TxfReader(filename))
+        with self.assertRaisesRegex(utils.ValueError, r'bad\.txf:\d+: '):
+            txns[0].costCents
+
+    def testUnterminatedRecord(self):
+        filename = self.Write('bad.txf', Read('testdata/vanguard.out').rstrip('^\n'))
+        self.assertRaises(utils.ValueError, list, txf.TxfReader(filename))
+
+    def testDiffIdentical(self):
+        out = io.StringIO()
+        self.assertEqual(0, txf.Diff('testdata/vanguard.out', 'testdata/vanguard.out', out))
+        self.assertEqual('', out.getvalue())
+
+    def testDiff(self):
+        golden = Read('testdata/tdameritrade.out')
+        changed = self.Write('changed.txf', golden.replace('D04/15/2021', 'D01/01/2024')
+                             .replace('$1379.23', '$1379.24'))
+        out = io.StringIO()
+        self.assertEqual(2, txf.Diff('testdata/tdameritrade.out', changed, out))
+        self.assertIn("record 1 (lines 5 and 5): cost: '1379.23' != '1379.24'", out.getvalue())
+        self.assertIn('2 differences in', out.getvalue())
+
+        out = io.StringIO()
+        self.assertEqual(1, txf.Diff('testdata/tdameritrade.out', changed, out,
+                                     ignore_date=True))
+
+        out = io.StringIO()
+        self.assertEqual(2, txf.Diff('testdata/tdameritrade.out', changed, out, max_diffs=1))
+        self.assertIn('... and 1 more', out.getvalue())
+
+    def testDiffMissingRecord(self):
+        golden = Read('testdata/vanguard.out')
+        truncated = self.Write('truncated.txf', golden[:golden.rindex('TD\n')])
+        out = io.StringIO()
+        self.assertEqual(1, txf.Diff('testdata/vanguard.out', truncated, out))
+        self.assertIn('only in testdata/vanguard.out', out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
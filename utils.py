@@ -16,10 +16,15 @@
 
 from __future__ import annotations
 
+import builtins
 from datetime import datetime
 from decimal import Decimal
+import functools
 import sys
-from typing import Optional
+from typing import Any, Callable, ClassVar, Optional
+
+import money
+import stats
 
 
 class Error(Exception):
@@ -49,29 +54,159 @@ class UnimplementedError(Error):
 
 
 def Warning(msg: str):
+    stats.Count('warnings')
     sys.stderr.write('warning: %s\n' % msg)
 
 
+class LazyStr:
+    """Formats as `func(*args)`, which is only called if it is formatted.
+
+    Useful for arguments to messages which are usually not formatted at all,
+    such as those of most diagnostics.
+    """
+
+    __slots__ = ('func', 'args')
+
+    def __init__(self, func: Callable[..., str], *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self) -> str:
+        return self.func(*self.args)
+
+
+def _FormatAmount(cents: Optional[int]) -> Optional[str]:
+    # Zero amounts are left out of `Transaction.__str__`, like missing ones.
+    return money.Format(cents) if cents else None
+
+
+class _Dollars:
+    """Exposes an amount of a `Transaction`, kept in cents, as a `Decimal`."""
+
+    def __init__(self, field: str):
+        self.field = field
+
+    def __get__(self, txn: Optional[Transaction], owner: Any = None) -> Any:
+        if txn is None:
+            return self
+        cents = getattr(txn, self.field)
+        return None if cents is None else money.ToDecimal(cents)
+
+    def __set__(self, txn: Transaction, value: Optional[Decimal]) -> None:
+        setattr(txn, self.field, None if value is None else money.FromDecimal(value))
+
+
 class Transaction:
+    """A single sale of a security, matched up with its purchase.
+
+    Uses `__slots__` so that each instance carries no per-instance `__dict__`,
+    which matters when there are millions of them alive at once.
+
+    Parsers may create transactions with `lazy`, deferring the work of decoding
+    fields (e.g., parsing amounts) until a sink actually reads one of them.
+    """
+
+    # The fields of a transaction, in the order of `__init__`'s arguments.
+    FIELDS: ClassVar[tuple[str, ...]] = (
+        'desc', 'buyDate', 'buyDateStr', 'costCents', 'sellDate', 'sellDateStr',
+        'proceedsCents', 'adjustmentCents', 'entryCode', 'symbol', 'shares')
 
-    desc: Optional[str] = None
-    buyDate: Optional[datetime] = None
-    buyDateStr: Optional[str] = None
-    costBasis: Optional[Decimal] = None
-    sellDate: Optional[datetime] = None
-    sellDateStr: Optional[str] = None
-    saleProceeds: Optional[Decimal] = None
-    adjustment: Optional[Decimal] = None
-    entryCode: Optional[int] = None
+    __slots__ = FIELDS + ('_decode', '_raw')
+
+    desc: Optional[str]
+    buyDate: Optional[datetime]
+    buyDateStr: Optional[str]
+    # Amounts are kept as integer numbers of cents; see the `money` module.
+    costCents: Optional[int]
+    sellDate: Optional[datetime]
+    sellDateStr: Optional[str]
+    proceedsCents: Optional[int]
+    adjustmentCents: Optional[int]
+    entryCode: Optional[int]
+    # Only needed to find wash sales; brokers which report their own
+    # adjustments need not set these.
+    symbol: Optional[str]
+    shares: Optional[Decimal]
+    _decode: Optional[Callable[[Transaction, tuple], None]]
+    _raw: Optional[tuple]
+
+    # The amounts as `Decimal`s, for convenience; these are slower than using
+    # the cents directly.
+    costBasis = _Dollars('costCents')
+    saleProceeds = _Dollars('proceedsCents')
+    adjustment = _Dollars('adjustmentCents')
+
+    def __init__(self,
+                 desc: Optional[str] = None,
+                 buyDate: Optional[datetime] = None,
+                 buyDateStr: Optional[str] = None,
+                 costCents: Optional[int] = None,
+                 sellDate: Optional[datetime] = None,
+                 sellDateStr: Optional[str] = None,
+                 proceedsCents: Optional[int] = None,
+                 adjustmentCents: Optional[int] = None,
+                 entryCode: Optional[int] = None,
+                 symbol: Optional[str] = None,
+                 shares: Optional[Decimal] = None):
+        self.desc = desc
+        self.buyDate = buyDate
+        self.buyDateStr = buyDateStr
+        self.costCents = costCents
+        self.sellDate = sellDate
+        self.sellDateStr = sellDateStr
+        self.proceedsCents = proceedsCents
+        self.adjustmentCents = adjustmentCents
+        self.entryCode = entryCode
+        self.symbol = symbol
+        self.shares = shares
+        self._decode = self._raw = None
+
+    @classmethod
+    def lazy(cls, decode: Callable[[Transaction, tuple], None], raw: tuple,
+             **fields) -> Transaction:
+        """Creates a transaction with `fields` set and the rest decoded on demand.
+
+        `decode(txn, raw)` is called the first time any other field is read,
+        and should set the remaining fields from the `raw` strings; those it
+        leaves unset read as None. Passing a module-level function and a tuple
+        of strings, rather than a closure over the row, keeps pending
+        transactions small and out of the way of the garbage collector.
+        """
+        txn = cls.__new__(cls)
+        for (name, value) in fields.items():
+            setattr(txn, name, value)
+        txn._decode = decode
+        txn._raw = raw
+        return txn
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for slots which have not been set, i.e., the fields of a
+        # lazy transaction which have not been decoded yet.
+        if name not in Transaction.FIELDS:
+            raise AttributeError(name)
+        decode = self._decode
+        if decode is not None:
+            decode(self, self._raw)
+            self._decode = self._raw = None
+            try:
+                return object.__getattribute__(self, name)
+            except AttributeError:
+                pass
+        setattr(self, name, None)
+        return None
+
+    def __reduce__(self) -> tuple:
+        # Decodes all fields, as the decoder need not be picklable.
+        return (Transaction, tuple(getattr(self, name) for name in Transaction.FIELDS))
 
     def __str__(self) -> str:
         data = [
             ('desc:%s', self.desc),
             ('buyDateStr:%s', self.buyDateStr),
-            ('costBasis:%.2f', self.costBasis),
+            ('costBasis:%s', _FormatAmount(self.costCents)),
             ('sellDateStr:%s', self.sellDateStr),
-            ('saleProceeds:%.2f', self.saleProceeds),
-            ('adjustment:%.2f', self.adjustment),
+            ('saleProceeds:%s', _FormatAmount(self.proceedsCents)),
+            ('adjustment:%s', _FormatAmount(self.adjustmentCents)),
             ('entryCode:%d', self.entryCode)
         ]
         formatted_data = [(fmt % value) for (fmt, value) in data if value]
@@ -83,6 +218,64 @@ def txfDate(date: datetime) -> str:
     return date.strftime('%m/%d/%Y')
 
 
+# Date formats used by the brokers, which have fast-path parsers below.
+DATE_FORMAT_MDY = '%m/%d/%Y'
+DATE_FORMAT_ISO = '%Y-%m-%d'
+
+# Exports repeat the same few hundred trading dates over and over, so a modest
+# cache catches nearly all of them while bounding memory use.
+DATE_CACHE_SIZE = 4096
+
+
+def _fastParseDate(date_str: str, fmt: str) -> Optional[datetime]:
+    """Parses the fixed date formats without `strptime`, or returns None."""
+    if fmt == DATE_FORMAT_MDY:
+        parts = date_str.split('/')
+        if len(parts) != 3:
+            return None
+        (month, day, year) = parts
+    elif fmt == DATE_FORMAT_ISO:
+        parts = date_str.split('-')
+        if len(parts) != 3:
+            return None
+        (year, month, day) = parts
+    else:
+        return None
+    if not (len(year) == 4 and 1 <= len(month) <= 2 and 1 <= len(day) <= 2):
+        return None
+    digits = year + month + day
+    if not (digits.isascii() and digits.isdigit()):
+        return None
+    try:
+        return datetime(int(year), int(month), int(day))
+    except builtins.ValueError:
+        return None
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def tryParseDate(date_str: str, fmt: str) -> Optional[tuple[datetime, str]]:
+    """Returns the date parsed from `date_str` and its TXF string.
+
+    Returns None if `date_str` is not a valid date in format `fmt`; failures
+    are cached too, as some brokers use placeholders such as `VARIOUS`.
+    """
+    date = _fastParseDate(date_str, fmt)
+    if date is None:
+        try:
+            date = datetime.strptime(date_str, fmt)
+        except builtins.ValueError:
+            return None
+    return (date, txfDate(date))
+
+
+def parseDate(date_str: str, fmt: str) -> tuple[datetime, str]:
+    """Like `tryParseDate`, but raises ValueError on invalid dates."""
+    parsed = tryParseDate(date_str, fmt)
+    if parsed is None:
+        raise builtins.ValueError('time data %r does not match format %r' % (date_str, fmt))
+    return parsed
+
+
 def isLongTerm(buy_date: datetime, sell_date: datetime) -> bool:
     # To handle leap years, cannot use a standard number of days, i.e.:
     #   sell_date - buy_date > timedelta(days=365)
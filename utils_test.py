@@ -17,6 +17,8 @@
 """Tests for utils module."""
 
 from datetime import datetime
+from decimal import Decimal
+import pickle
 import unittest
 import utils
 
@@ -38,6 +40,58 @@ class UtilsTest(unittest.TestCase):
         # TODO: verify error message.
         self.assertRaises(utils.ValueError, utils.isLongTerm, buy, sell)
 
+    def testParseDate(self):
+        self.assertEqual((datetime(2020, 1, 10), '01/10/2020'),
+                         utils.parseDate('1/10/2020', utils.DATE_FORMAT_MDY))
+        self.assertEqual((datetime(2011, 2, 1), '02/01/2011'),
+                         utils.parseDate('2011-02-01', utils.DATE_FORMAT_ISO))
+        self.assertIsNone(utils.tryParseDate('VARIOUS', utils.DATE_FORMAT_MDY))
+        self.assertIsNone(utils.tryParseDate('2/30/2011', utils.DATE_FORMAT_MDY))
+        self.assertRaises(ValueError, utils.parseDate, '2011/02/01', utils.DATE_FORMAT_ISO)
+
+    def testParseDateMatchesStrptime(self):
+        for date_str in ('01/02/2003', '1/2/2003', '12/31/1999', '2/29/2012',
+                         '2/29/2011', '13/01/2011', '1/2/03', ' 1/2/2003', '1/2/2003 '):
+            try:
+                expected = datetime.strptime(date_str, utils.DATE_FORMAT_MDY)
+            except ValueError:
+                expected = None
+            parsed = utils.tryParseDate(date_str, utils.DATE_FORMAT_MDY)
+            self.assertEqual(expected, parsed[0] if parsed else None, date_str)
+
+    def testTransactionIsSlotted(self):
+        txn = utils.Transaction(desc='100 shares ABC', entryCode=321)
+        self.assertFalse(hasattr(txn, '__dict__'))
+        self.assertIsNone(txn.costBasis)
+        self.assertEqual('desc:100 shares ABC,entryCode:321', str(txn))
+
+    def testLazyTransactionDecodesOnFirstRead(self):
+        calls = []
+
+        def Decode(txn, raw):
+            calls.append(raw)
+            txn.costBasis = Decimal(raw[0])
+
+        txn = utils.Transaction.lazy(Decode, ('1.50',), desc='100 shares ABC', entryCode=321)
+        self.assertEqual('100 shares ABC', txn.desc)
+        self.assertEqual([], calls)
+        self.assertEqual(Decimal('1.50'), txn.costBasis)
+        self.assertIsNone(txn.saleProceeds)
+        self.assertEqual(1, len(calls))
+
+    def testLazyTransactionPickles(self):
+        txn = utils.Transaction.lazy(lambda txn, raw: setattr(txn, 'costBasis', Decimal(raw[0])),
+                                     ('2',), desc='100 shares ABC', entryCode=321)
+        copy = pickle.loads(pickle.dumps(txn))
+        self.assertEqual('desc:100 shares ABC,costBasis:2.00,entryCode:321', str(copy))
+
+    def testLazyStr(self):
+        calls = []
+        lazy = utils.LazyStr(lambda *args: calls.append(args) or 'x', 1, 2)
+        self.assertEqual([], calls)
+        self.assertEqual('<x>', '<%s>' % lazy)
+        self.assertEqual([(1, 2)], calls)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -14,33 +14,49 @@
 
 """Implements Vanguard.
 
-Assumes reconciled transactions, i.e., sell follows buy.
+Buys and sells are reported as separate rows, in chronological order; each
+sale is matched against the lots bought before it using `lots.METHOD`, and
+produces one transaction for each lot (or part of one) that it sold.
 
 Does not handle:
 * dividends
 * short sales
-* partial lot sales
 """
 
 from __future__ import annotations
 
-import csv
 from datetime import datetime
 from decimal import Decimal
-from typing import Optional
+import functools
+from typing import Iterable, Iterator, Optional
 
 from broker import Broker
+import diagnostics
+import headers
+import lots
+import money
+import schema
 from typing_extensions import override
 import utils
 
 
-FIRST_LINE = ','.join(['"Trade Date"', '"Transaction Type"',
-                       '"Investment Name"', '"Symbol"', '"Shares"',
-                       '"Principal Amount"', '"Net Amount"\n'])
+FIRST_LINE = headers.VANGUARD
 
 
 class Vanguard(Broker):
 
+    HEADER = FIRST_LINE
+
+    # Amounts are only decoded once they are needed; see `iterTxnsFromRows`.
+    SCHEMA = schema.Schema(
+        schema.Column('type', 'Transaction Type'),
+        schema.Column('date', 'Trade Date',
+                      functools.partial(utils.parseDate, fmt=utils.DATE_FORMAT_ISO)),
+        schema.Column('symbol', 'Symbol'),
+        schema.Column('shares', 'Shares', int),
+        schema.Column('amount', 'Net Amount'),
+    )
+
     @classmethod
     @override
     def name(cls) -> str:
@@ -54,16 +70,25 @@ class Vanguard(Broker):
     def isSell(cls, txn: dict[str, str]) -> bool:
         return txn['Transaction Type'] == 'Sell'
 
+    @classmethod
+    def parsedDate(cls, txn: dict[str, str]) -> tuple[datetime, str]:
+        """Returns date of transaction as datetime object and TXF string."""
+        # Our input date format is YYYY-MM-DD.
+        return utils.parseDate(txn['Trade Date'], utils.DATE_FORMAT_ISO)
+
     @classmethod
     def date(cls, txn: dict[str, str]) -> datetime:
         """Returns date of transaction as datetime object."""
-        # Our input date format is YYYY/MM/DD.
-        return datetime.strptime(txn['Trade Date'], '%Y-%m-%d')
+        return cls.parsedDate(txn)[0]
 
     @classmethod
     def symbol(cls, txn: dict[str, str]) -> str:
         return txn['Symbol']
 
+    @classmethod
+    def desc(cls, txn: dict[str, str]) -> str:
+        return _Describe(cls.numShares(txn), cls.symbol(txn))
+
     @classmethod
     def investmentName(cls, txn: dict[str, str]) -> str:
         return txn['Investment Name']
@@ -77,8 +102,9 @@ class Vanguard(Broker):
             return shares
 
     @classmethod
-    def netAmount(cls, txn: dict[str, str]) -> Decimal:
-        amount = Decimal(txn['Net Amount'])
+    def netAmount(cls, txn: dict[str, str]) -> int:
+        """Returns the amount in cents."""
+        amount = money.Parse(txn['Net Amount'])
         if cls.isBuy(txn):
             return amount * -1
         else:
@@ -86,73 +112,66 @@ class Vanguard(Broker):
 
     @classmethod
     @override
-    def isFileForBroker(cls, filename: str) -> bool:
-        with open(filename) as f:
-            first_line = f.readline()
-            return first_line == FIRST_LINE
-
-    @classmethod
-    @override
-    def parseFileToTxnList(cls, filename: str, tax_year: Optional[int]) -> list[utils.Transaction]:
-        txns = csv.reader(open(filename), delimiter=',', quotechar='"')
-        row_num: int = 0
-        txn_list: list[utils.Transaction] = []
-        names: list[str] = []
-        curr_txn: Optional[utils.Transaction] = None
-        buy: dict[str, str] = {}
-        sell: dict[str, str] = {}
-        for row in txns:
-            row_num = row_num + 1
-            if row_num == 1:
-                names = row
-                continue
-
-            txn_dict = {}
-            for i in range(0, len(names)):
-                txn_dict[names[i]] = row[i]
-
-            if cls.isBuy(txn_dict):
-                buy = txn_dict
-                curr_txn = utils.Transaction()
-                curr_txn.desc = '%d shares %s' % (
-                    cls.numShares(buy), cls.symbol(buy))
-                curr_txn.buyDate = cls.date(txn_dict)
-                curr_txn.buyDateStr = utils.txfDate(curr_txn.buyDate)
-                curr_txn.costBasis = cls.netAmount(txn_dict)
-            elif cls.isSell(txn_dict):
-                sell = txn_dict
-                # Assume that sells follow the buys, so we can attach this sale to the
-                # current buy txn we are processing.
-                assert curr_txn is not None
-                assert cls.numShares(buy) == cls.numShares(sell)
-                assert cls.symbol(buy) == cls.symbol(sell)
-                assert cls.investmentName(buy) == cls.investmentName(sell)
-
-                buyDate: Optional[datetime] = curr_txn.buyDate
-                if buyDate is None:
-                    utils.Warning(f'Missing buy date for current transaction: {curr_txn}')
+    def iterTxnsFromRows(cls, rows: Iterable[list[str]],
+                         tax_year: Optional[int]) -> Iterator[utils.Transaction]:
+        rows = iter(rows)
+        header = next(rows, None)
+        if header is None:
+            return
+        decoder = cls.SCHEMA.compile(header)
+        (type_index, decode) = (decoder.indices['type'], decoder.decode)
+        matcher = lots.LotMatcher()
+        for row in rows:
+            # Rows of other types (e.g., dividends) are skipped without
+            # decoding them.
+            if row[type_index] == 'Buy':
+                (_, (buyDate, buyDateStr), symbol, shares, amount) = decode(row)
+                if shares <= 0:
+                    diagnostics.Report(diagnostics.NO_SHARES_BOUGHT,
+                                       'ignoring buy of %d shares %s on %s', shares, symbol,
+                                       buyDateStr)
                     continue
-
-                sellDate: datetime = cls.date(sell)
-                curr_txn.sellDateStr = utils.txfDate(sellDate)
-                curr_txn.saleProceeds = cls.netAmount(sell)
-
-                if utils.isLongTerm(buyDate, sellDate):
-                    curr_txn.entryCode = 323  # "LT gain/loss - security"
-                else:
-                    curr_txn.entryCode = 321  # "ST gain/loss - security"
-
-                assert sellDate >= buyDate, f'Sell date ({sellDate}) must be on or after buy date ({buyDate})'
-                if tax_year and sellDate.year != tax_year:
-                    utils.Warning('ignoring txn: "%s" as the sale is not from %d' %
-                                  (curr_txn.desc, tax_year))
+                # Purchases are reported as negative amounts.
+                matcher.buy(symbol, shares, -money.Parse(amount), buyDate, buyDateStr)
+            elif row[type_index] == 'Sell':
+                sellDate: datetime
+                (_, (sellDate, sellDateStr), symbol, shares, amount) = decode(row)
+                # Sales are reported as negative numbers of shares.
+                shares = -shares
+                # Sales from other years must still consume their lots, but
+                # their proceeds are never needed.
+                in_year = not tax_year or sellDate.year == tax_year
+                proceeds = money.Parse(amount) if in_year else None
+                (matches, unmatched) = matcher.sell(symbol, shares, proceeds)
+                if unmatched:
+                    diagnostics.Report(diagnostics.MISSING_BUY_DATE,
+                                       'Missing buy date for %d of %d shares %s sold on %s',
+                                       unmatched, shares, symbol, sellDateStr)
+                if not in_year:
+                    diagnostics.Report(diagnostics.WRONG_YEAR,
+                                       'ignoring txn: "%s" as the sale is not from %d',
+                                       utils.LazyStr(_Describe, shares, symbol), tax_year)
                     continue
 
-                txn_list.append(curr_txn)
-
-                # Clear both the buy and the sell as we have matched them up.
-                buy = {}
-                sell = {}
-                curr_txn = None
-
-        return txn_list
+                for match in matches:
+                    buyDate = match.buyDate
+                    assert sellDate >= buyDate, f'Sell date ({sellDate}) must be on or after buy date ({buyDate})'
+                    if utils.isLongTerm(buyDate, sellDate):
+                        entryCode = 323  # "LT gain/loss - security"
+                    else:
+                        entryCode = 321  # "ST gain/loss - security"
+                    yield utils.Transaction(
+                        desc=_Describe(match.shares, symbol),
+                        buyDate=buyDate, buyDateStr=match.buyDateStr,
+                        costCents=match.cost,
+                        sellDate=sellDate, sellDateStr=sellDateStr,
+                        proceedsCents=match.proceeds,
+                        entryCode=entryCode,
+                        symbol=symbol, shares=Decimal(match.shares))
+
+
+@functools.lru_cache(maxsize=4096)
+def _Describe(shares: int, symbol: str) -> str:
+    # Descriptions repeat across rows, so share the strings rather than
+    # formatting a new one for every sale.
+    return '%d shares %s' % (shares, symbol)
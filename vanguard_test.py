@@ -18,11 +18,19 @@
 
 import glob
 import os
+import shutil
+import tempfile
 import unittest
-from vanguard import Vanguard
+
+import diagnostics
+from vanguard import FIRST_LINE, Vanguard
 
 
 class VanguardTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
     def testDetect(self):
         for csv in glob.glob('testdata/*.csv'):
             self.assertEqual(os.path.basename(csv) == 'vanguard.csv',
@@ -35,6 +43,42 @@ class VanguardTest(unittest.TestCase):
                 expected_txn = expected_file.readline().strip()
                 self.assertEqual(expected_txn, str(txn))
 
+    def testParseInterleavedPartialLots(self):
+        filename = os.path.join(self.tmpdir, 'lots.csv')
+        with open(filename, 'w') as f:
+            f.write(FIRST_LINE)
+            f.write('"2010-01-04","Buy","ABC Corp","ABC",100,-1000.00,-1000.00\n')
+            f.write('"2010-06-01","Buy","XYZ Inc","XYZ",10,-500.00,-500.00\n')
+            f.write('"2011-02-01","Buy","ABC Corp","ABC",100,-2000.00,-2000.00\n')
+            f.write('"2011-03-01","Sell","ABC Corp","ABC",-150,2400.00,2400.00\n')
+            f.write('"2011-04-01","Sell","XYZ Inc","XYZ",-10,600.00,600.00\n')
+            f.write('"2011-05-02","Sell","ABC Corp","ABC",-50,900.00,900.00\n')
+        self.assertEqual([
+            'desc:100 shares ABC,buyDateStr:01/04/2010,costBasis:1000.00,'
+            'sellDateStr:03/01/2011,saleProceeds:1600.00,entryCode:323',
+            'desc:50 shares ABC,buyDateStr:02/01/2011,costBasis:1000.00,'
+            'sellDateStr:03/01/2011,saleProceeds:800.00,entryCode:321',
+            'desc:10 shares XYZ,buyDateStr:06/01/2010,costBasis:500.00,'
+            'sellDateStr:04/01/2011,saleProceeds:600.00,entryCode:321',
+            'desc:50 shares ABC,buyDateStr:02/01/2011,costBasis:1000.00,'
+            'sellDateStr:05/02/2011,saleProceeds:900.00,entryCode:321',
+        ], [str(txn) for txn in Vanguard.parseFileToTxnList(filename, 2011)])
+
+    def testBuyWithoutShares(self):
+        filename = os.path.join(self.tmpdir, 'lots.csv')
+        with open(filename, 'w') as f:
+            f.write(FIRST_LINE)
+            f.write('"2010-01-04","Buy","ABC Corp","ABC",0,-5.00,-5.00\n')
+            f.write('"2010-02-01","Buy","ABC Corp","ABC",10,-100.00,-100.00\n')
+            f.write('"2011-03-01","Sell","ABC Corp","ABC",-10,150.00,150.00\n')
+        collector = diagnostics.Collect()
+        self.addCleanup(diagnostics.Stop)
+        self.assertEqual([
+            'desc:10 shares ABC,buyDateStr:02/01/2010,costBasis:100.00,'
+            'sellDateStr:03/01/2011,saleProceeds:150.00,entryCode:323',
+        ], [str(txn) for txn in Vanguard.parseFileToTxnList(filename, 2011)])
+        self.assertEqual(1, collector.counts[diagnostics.NO_SHARES_BOUGHT])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,159 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Finds wash sales and fills in the disallowed losses as adjustments.
+
+A loss on a sale is disallowed to the extent that shares of the same security
+were bought within 30 days before or after it; the disallowed loss is added to
+the cost basis of those replacement shares instead. Shares of the same lot as
+those sold, i.e., of the same security bought on the same day (such as the
+rest of a lot which is sold piece-wise), do not replace them.
+
+Purchases are indexed by symbol in date-sorted arrays, so the replacements for
+each sale are found with a binary search for the start of its window rather
+than by comparing every pair of transactions. Sales are processed in date
+order, so that a basis increase is in place before the replacement shares are
+themselves sold.
+
+Only purchases which appear as the buy side of a sale in the export are seen,
+i.e., replacement shares which are still held are not; transactions without a
+`symbol` and `shares` (such as those from brokers which report their own
+adjustments) are left alone. Holding periods are not adjusted.
+"""
+
+from __future__ import annotations
+
+import bisect
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterable, Iterator, Optional
+
+import diagnostics
+import money
+import stats
+import utils
+
+
+# Whether conversions look for wash sales; set by `--wash-sales`.
+ENABLED = False
+
+WINDOW_DAYS = 30
+
+
+def _Date(date: Optional[datetime], date_str: Optional[str]) -> Optional[datetime]:
+    if date is not None or date_str is None:
+        return date
+    # Dates which are not single days, such as 'VARIOUS', cannot be matched.
+    parsed = utils.tryParseDate(date_str, utils.DATE_FORMAT_MDY)
+    return parsed[0] if parsed else None
+
+
+class _Purchase:
+    """The buy side of a sale, available to replace shares sold at a loss."""
+
+    __slots__ = ('txn', 'date', 'available')
+
+    def __init__(self, txn: utils.Transaction, date: int, shares: Decimal):
+        self.txn = txn
+        self.date = date
+        self.available = shares
+
+
+class WashSales:
+
+    def __init__(self, txns: Iterable[utils.Transaction]):
+        """Indexes the purchases of `txns`, which are kept for `adjust`."""
+        self.txns = list(txns)
+        # For each symbol, the dates of its purchases in ascending order, and
+        # the purchases themselves in the same order.
+        self._dates: dict[str, list[int]] = {}
+        self._purchases: dict[str, list[_Purchase]] = {}
+        indexed = []
+        for txn in self.txns:
+            if txn.symbol is None or not txn.shares:
+                continue
+            date = _Date(txn.buyDate, txn.buyDateStr)
+            if date is not None:
+                indexed.append((txn.symbol, _Purchase(txn, date.toordinal(), txn.shares)))
+        indexed.sort(key=lambda item: (item[0], item[1].date))
+        for (symbol, purchase) in indexed:
+            self._dates.setdefault(symbol, []).append(purchase.date)
+            self._purchases.setdefault(symbol, []).append(purchase)
+
+    def _replacements(self, symbol: str, date: int) -> Iterator[_Purchase]:
+        """Yields the purchases of `symbol` within the window around `date`."""
+        dates = self._dates.get(symbol)
+        if not dates:
+            return
+        purchases = self._purchases[symbol]
+        for i in range(bisect.bisect_left(dates, date - WINDOW_DAYS), len(dates)):
+            if dates[i] > date + WINDOW_DAYS:
+                return
+            yield purchases[i]
+
+    def adjust(self) -> list[utils.Transaction]:
+        """Fills in the adjustments of wash sales, returning all transactions."""
+        sales = []
+        for txn in self.txns:
+            if txn.symbol is None or not txn.shares or txn.adjustmentCents:
+                continue
+            date = _Date(txn.sellDate, txn.sellDateStr)
+            if date is not None:
+                sales.append((date.toordinal(), txn))
+        sales.sort(key=lambda sale: sale[0])
+
+        for (date, txn) in sales:
+            assert txn.costCents is not None and txn.proceedsCents is not None
+            loss = txn.costCents - txn.proceedsCents
+            if loss <= 0:
+                continue
+            assert txn.symbol is not None and txn.shares is not None
+            bought = _Date(txn.buyDate, txn.buyDateStr)
+            lot = bought.toordinal() if bought is not None else None
+            remaining = txn.shares
+            disallowed = 0
+            for purchase in self._replacements(txn.symbol, date):
+                # The sale itself, and the rest of its lot, are not replacements.
+                if purchase.txn is txn or purchase.date == lot or not purchase.available:
+                    continue
+                shares = min(remaining, purchase.available)
+                purchase.available -= shares
+                remaining -= shares
+                amount = money.Prorate(loss, shares, txn.shares)
+                assert purchase.txn.costCents is not None
+                purchase.txn.costCents += amount
+                disallowed += amount
+                if not remaining:
+                    break
+            if disallowed:
+                txn.adjustmentCents = disallowed
+                stats.Count('wash_sales')
+        return self.txns
+
+
+def Adjust(txns: Iterable[utils.Transaction]) -> list[utils.Transaction]:
+    return WashSales(txns).adjust()
+
+
+def SelectYear(txns: Iterable[utils.Transaction],
+               tax_year: Optional[int]) -> Iterator[utils.Transaction]:
+    """Yields the transactions whose sale is from `tax_year`, if given."""
+    for txn in txns:
+        date = _Date(txn.sellDate, txn.sellDateStr)
+        if tax_year and date is not None and date.year != tax_year:
+            diagnostics.Report(diagnostics.WRONG_YEAR,
+                               'ignoring txn: "%s" as the sale is not from %d',
+                               txn.desc, tax_year)
+            continue
+        yield txn
@@ -0,0 +1,112 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the wash_sales module."""
+
+from datetime import datetime
+from decimal import Decimal
+import unittest
+
+import money
+import utils
+import wash_sales
+
+
+def Txn(symbol, shares, buy, cost, sell, proceeds):
+    return utils.Transaction(
+        desc='%d shares %s' % (shares, symbol),
+        buyDate=datetime.strptime(buy, '%Y-%m-%d'),
+        costCents=money.Parse(cost),
+        sellDate=datetime.strptime(sell, '%Y-%m-%d'),
+        proceedsCents=money.Parse(proceeds),
+        entryCode=321, symbol=symbol, shares=Decimal(shares))
+
+
+class WashSalesTest(unittest.TestCase):
+    def testLossWithReplacementIsDisallowed(self):
+        loss = Txn('ABC', 100, '2011-01-03', '1000.00', '2011-02-01', '800.00')
+        replacement = Txn('ABC', 100, '2011-02-15', '810.00', '2011-06-01', '900.00')
+        wash_sales.Adjust([replacement, loss])
+        self.assertEqual(20000, loss.adjustmentCents)
+        self.assertEqual(101000, replacement.costCents)
+        self.assertIsNone(replacement.adjustmentCents)
+
+    def testReplacementBeforeSale(self):
+        replacement = Txn('ABC', 100, '2011-01-10', '900.00', '2011-06-01', '950.00')
+        loss = Txn('ABC', 100, '2010-06-01', '1000.00', '2011-02-01', '800.00')
+        wash_sales.Adjust([replacement, loss])
+        self.assertEqual(20000, loss.adjustmentCents)
+
+    def testOutsideWindow(self):
+        loss = Txn('ABC', 100, '2011-01-03', '1000.00', '2011-02-01', '800.00')
+        later = Txn('ABC', 100, '2011-03-04', '810.00', '2011-06-01', '900.00')
+        other = Txn('XYZ', 100, '2011-02-02', '810.00', '2011-06-01', '900.00')
+        wash_sales.Adjust([loss, later, other])
+        self.assertIsNone(loss.adjustmentCents)
+        self.assertEqual(81000, later.costCents)
+
+    def testPartialReplacement(self):
+        loss = Txn('ABC', 100, '2011-01-03', '1000.00', '2011-02-01', '800.00')
+        replacement = Txn('ABC', 25, '2011-02-10', '200.00', '2011-06-01', '300.00')
+        wash_sales.Adjust([loss, replacement])
+        self.assertEqual(5000, loss.adjustmentCents)
+        self.assertEqual(25000, replacement.costCents)
+
+    def testRestOfLotIsNotReplacement(self):
+        # 200 shares bought together and sold in two parts.
+        loss = Txn('ABC', 100, '2011-01-03', '1000.00', '2011-01-20', '800.00')
+        rest = Txn('ABC', 100, '2011-01-03', '1000.00', '2011-06-01', '1200.00')
+        wash_sales.Adjust([loss, rest])
+        self.assertIsNone(loss.adjustmentCents)
+        self.assertEqual(100000, rest.costCents)
+
+        # Shares bought later within the window still replace them.
+        loss = Txn('ABC', 100, '2011-01-03', '1000.00', '2011-01-20', '800.00')
+        rest = Txn('ABC', 100, '2011-01-03', '1000.00', '2011-06-01', '1200.00')
+        replacement = Txn('ABC', 100, '2011-01-25', '850.00', '2011-06-01', '900.00')
+        wash_sales.Adjust([loss, rest, replacement])
+        self.assertEqual(20000, loss.adjustmentCents)
+        self.assertEqual(100000, rest.costCents)
+        self.assertEqual(105000, replacement.costCents)
+
+    def testReplacementIsOnlyUsedOnce(self):
+        first = Txn('ABC', 100, '2010-01-03', '1000.00', '2011-02-01', '800.00')
+        second = Txn('ABC', 100, '2010-01-04', '1000.00', '2011-02-02', '900.00')
+        replacement = Txn('ABC', 100, '2011-02-10', '850.00', '2011-06-01', '1200.00')
+        wash_sales.Adjust([first, second, replacement])
+        self.assertEqual(20000, first.adjustmentCents)
+        self.assertIsNone(second.adjustmentCents)
+
+    def testGainsAndUnknownSymbolsAreUntouched(self):
+        gain = Txn('ABC', 100, '2011-01-03', '800.00', '2011-02-01', '1000.00')
+        replacement = Txn('ABC', 100, '2011-02-10', '850.00', '2011-06-01', '900.00')
+        reported = utils.Transaction(desc='100 sh ABC', buyDateStr='VARIOUS',
+                                     costCents=100000, sellDateStr='02/01/2011',
+                                     proceedsCents=80000, entryCode=321)
+        wash_sales.Adjust([gain, replacement, reported])
+        self.assertIsNone(gain.adjustmentCents)
+        self.assertIsNone(reported.adjustmentCents)
+        self.assertEqual(85000, replacement.costCents)
+
+    def testSelectYear(self):
+        txns = [Txn('ABC', 1, '2010-01-03', '1', '2010-12-31', '1'),
+                Txn('ABC', 1, '2010-01-03', '1', '2011-01-03', '1')]
+        self.assertEqual([txns[1]], list(wash_sales.SelectYear(txns, 2011)))
+        self.assertEqual(txns, list(wash_sales.SelectYear(txns, None)))
+
+
+if __name__ == '__main__':
+    unittest.main()